@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+benchmark suite for SASA
+
+run all benchmarks with `python benchmark.py`, or name the ones to run,
+e.g. `python benchmark.py startup`. add `--record [csv path]` to append the
+results to a csv file so they can be tracked between versions
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import argparse
+import csv
+import datetime
+import os
+import glob
+import subprocess
+import sys
+import time
+
+SAMPLE_DATA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sample data", "pooled"
+)
+SAMPLE_SETTINGS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sample settings.xlsx"
+)
+
+
+# %% define functions
+def time_snippet(code, repeat=3, env=None):
+    """
+    runs a python snippet in a fresh interpreter and returns the fastest
+    of 'repeat' runs. the snippet must print its own elapsed time in
+    seconds as the last line of output
+
+    a fresh interpreter is used for every run so import caches are cold
+    """
+    run_env = dict(os.environ)
+    if env:
+        run_env.update(env)
+    timings = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=run_env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        timings.append(float(completed.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def bench_startup(repeat=3):
+    """
+    GUI startup time - importing sasa, and showing the main window
+    (offscreen unless a QT_QPA_PLATFORM is already set), compared with the
+    cost of importing the analysis stack that is now deferred
+    """
+    qt_env = {"QT_QPA_PLATFORM": os.environ.get("QT_QPA_PLATFORM", "offscreen")}
+    results = {}
+    results["import sasa (sec)"] = time_snippet(
+        "import time\n"
+        "t0 = time.perf_counter()\n"
+        "import sasa\n"
+        "print(time.perf_counter() - t0)\n",
+        repeat=repeat,
+        env=qt_env,
+    )
+    results["gui window shown (sec)"] = time_snippet(
+        "import time\n"
+        "t0 = time.perf_counter()\n"
+        "import sasa\n"
+        "app, ui = sasa.build_window()\n"
+        "app.processEvents()\n"
+        "elapsed = time.perf_counter() - t0\n"
+        "ui.warmup_worker.wait()\n"
+        "print(elapsed)\n",
+        repeat=repeat,
+        env=qt_env,
+    )
+    results["import analysis stack (sec)"] = time_snippet(
+        "import time\n"
+        "t0 = time.perf_counter()\n"
+        "import main, openpyxl, xlsxwriter\n"
+        "print(time.perf_counter() - t0)\n",
+        repeat=repeat,
+    )
+    return results
+
+
+def bench_ingest(data_path=SAMPLE_DATA, repeat=3):
+    """
+    recording csv load time per GB - the original pd.read_csv with default
+    inference and row-wise timestamp building, against the typed reader in
+    ingest.py with each available engine and with concurrent reads
+    """
+    import pandas as pd
+    import ingest
+    import main
+
+    file_list = sorted(glob.glob(os.path.join(data_path, "*.csv")))
+    gigabytes = sum(os.path.getsize(f) for f in file_list) / 1e9
+
+    def legacy_read(f):
+        df = pd.read_csv(f)
+        df["ts"] = df.apply(main.build_timestamp, axis=1)
+        return df
+
+    def best_of(func, n):
+        timings = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - t0)
+        return min(timings)
+
+    results = {}
+    results["csv data (GB)"] = gigabytes
+    results["legacy read_csv + apply (sec/GB)"] = (
+        best_of(lambda: [legacy_read(f) for f in file_list], 1) / gigabytes
+    )
+    engines = ["c", "pyarrow"] if ingest.DEFAULT_ENGINE == "pyarrow" else ["c"]
+    for engine in engines:
+        results[f"typed {engine} engine (sec/GB)"] = (
+            best_of(lambda: ingest.read_recordings(file_list, engine=engine), repeat)
+            / gigabytes
+        )
+    workers = os.cpu_count() or 1
+    results[f"typed {ingest.DEFAULT_ENGINE} engine, {workers} threads (sec/GB)"] = (
+        best_of(lambda: ingest.read_recordings(file_list, max_workers=workers), repeat)
+        / gigabytes
+    )
+    return results
+
+
+def bench_preprocess(data_path=SAMPLE_DATA, settings_path=SAMPLE_SETTINGS, repeat=3):
+    """
+    per-subject preprocessing time and peak memory (tracemalloc) - the
+    original whole-frame replace/bfill/ffill, row-wise night check and
+    night_df copy, against main.load_subject_df and the positional night take
+    """
+    import logging
+    import tracemalloc
+    import numpy as np
+    import pandas as pd
+    import ingest
+    import main
+    import settings_profile
+
+    settings, file_time_fix = main.read_settings(settings_path)
+    logger = logging.getLogger("benchmark")
+    file_dict = main.collect_subject_files(data_path, logger)
+
+    def legacy_preprocess(subject_file_list):
+        subject_df = pd.concat(ingest.read_recordings(subject_file_list))
+        subject_df["spo2_NA_filter"] = subject_df["spo2"] == 500
+        subject_df["pulse_NA_filter"] = subject_df["pulse"] == 500
+        subject_df["spo2_and_pulse_NA_filter"] = (subject_df["spo2"] == 500) & (
+            subject_df["pulse"] == 500
+        )
+        subject_df["spo2_or_pulse_NA_filter"] = (subject_df["spo2"] == 500) | (
+            subject_df["pulse"] == 500
+        )
+        subject_df["interval"] = subject_df["ts"].diff().dt.total_seconds()
+        subject_df["gaps"] = (
+            subject_df["interval"] > settings["expected_sampling_rate (sec)"]
+        )
+        subject_df["fixed_spo2"] = subject_df["spo2"]
+        subject_df["fixed_pulse"] = subject_df["pulse"]
+        subject_df.replace(
+            {"fixed_pulse": {500: np.nan}, "fixed_spo2": {500: np.nan}}, inplace=True
+        )
+        subject_df.bfill(inplace=True)
+        subject_df.ffill(inplace=True)
+        subject_df["diff_spo2"] = subject_df["fixed_spo2"].diff()
+        night_start, night_stop = settings_profile.night_window(settings)
+        subject_df["night"] = subject_df["ts"].apply(
+            main.night_time_check, night_start=night_start, night_stop=night_stop
+        )
+        return subject_df[subject_df["night"]].copy()
+
+    def current_preprocess(subject_id, subject_file_list):
+        subject_df, _ = main.load_subject_df(
+            subject_id, subject_file_list, settings, file_time_fix, logger
+        )
+        return subject_df.take(np.flatnonzero(subject_df["night"].to_numpy()))
+
+    def measure(func):
+        timings = []
+        peaks = []
+        for _ in range(repeat):
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - t0)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        return min(timings), min(peaks)
+
+    # the largest subject sets the peak memory
+    subject_id, subject_file_list = max(
+        file_dict.items(), key=lambda item: sum(os.path.getsize(f) for f in item[1])
+    )
+    results = {}
+    legacy_time, legacy_peak = measure(lambda: legacy_preprocess(subject_file_list))
+    current_time, current_peak = measure(
+        lambda: current_preprocess(subject_id, subject_file_list)
+    )
+    results["legacy preprocess (sec)"] = legacy_time
+    results["legacy peak memory (MB)"] = legacy_peak / 1e6
+    results["current preprocess (sec)"] = current_time
+    results["current peak memory (MB)"] = current_peak / 1e6
+    return results
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "ingest": bench_ingest,
+    "preprocess": bench_preprocess,
+}
+
+
+def record_results(record_path, name, results):
+    """
+    appends benchmark results to a csv file, one row per metric
+    """
+    new_file = not os.path.exists(record_path)
+    with open(record_path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["timestamp", "version", "benchmark", "metric", "value"])
+        timestamp = datetime.datetime.now().isoformat(timespec="seconds")
+        for metric, value in results.items():
+            writer.writerow([timestamp, __version__, name, metric, value])
+
+
+def main(names=None, record_path=None):
+    for name in names or BENCHMARKS:
+        results = BENCHMARKS[name]()
+        print(f"{name}")
+        for metric, value in results.items():
+            print(f"  {metric}: {value:.4g}")
+        if record_path:
+            record_results(record_path, name, results)
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SASA benchmark suite")
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"benchmarks to run, any of: {', '.join(BENCHMARKS)} (default: all)",
+    )
+    parser.add_argument("--record", help="csv file to append results to")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    main(names=args.benchmarks, record_path=args.record)
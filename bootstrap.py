@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+bootstrap confidence intervals of cohort means
+
+all resamples are drawn at once as a (resamples x subjects) index matrix,
+which is turned into per-resample subject counts with a single bincount. the
+resampled means of every metric are then one matrix product of those counts
+with the (subjects x metrics) value matrix - missing values are left out by
+dividing by the counts of the subjects that have a value for each metric
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import warnings
+import numpy as np
+import pandas as pd
+
+# %% define constants
+DEFAULT_RESAMPLES = 10000
+DEFAULT_CONFIDENCE = 95.0
+
+# resamples are reduced in blocks to bound the size of the count matrix
+BLOCK_RESAMPLES = 2000
+
+
+# %% define functions
+def metric_matrix(summaries):
+    """
+    (metric names, subjects x metrics float array) of the numeric metrics in
+    a {subject_id: output_summary} dict
+    """
+    df = pd.DataFrame.from_dict(summaries, orient="index").infer_objects()
+    numeric = df.select_dtypes(include="number").select_dtypes(exclude="bool")
+    return list(numeric.columns), numeric.to_numpy(dtype=np.float64)
+
+
+def resample_counts(subject_count, resamples, rng):
+    """
+    (resamples x subjects) matrix of how often each subject was drawn in
+    each resample
+    """
+    draws = rng.integers(0, subject_count, size=(resamples, subject_count))
+    offsets = np.arange(resamples)[:, np.newaxis] * subject_count
+    return np.bincount(
+        (draws + offsets).ravel(), minlength=resamples * subject_count
+    ).reshape(resamples, subject_count)
+
+
+def bootstrap_means(values, resamples=DEFAULT_RESAMPLES, seed=None):
+    """
+    (resamples x metrics) array of resampled means of the columns of values,
+    ignoring NaN - a resample without any value of a metric gives NaN
+    """
+    # seeds read from the settings workbook can arrive as floats
+    rng = np.random.default_rng(None if seed is None else int(seed))
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    means = np.empty((resamples, values.shape[1]))
+    for start in range(0, resamples, BLOCK_RESAMPLES):
+        stop = min(start + BLOCK_RESAMPLES, resamples)
+        counts = resample_counts(values.shape[0], stop - start, rng).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[start:stop] = (counts @ filled) / (counts @ valid)
+    return means
+
+
+def cohort_summary(
+    summaries, resamples=DEFAULT_RESAMPLES, seed=None, confidence=DEFAULT_CONFIDENCE
+):
+    """
+    one row per numeric metric of a {subject_id: output_summary} dict with
+    the subject count, cohort mean, bootstrap standard error and percentile
+    confidence interval
+    """
+    metrics, values = metric_matrix(summaries)
+    columns = [
+        "subjects",
+        "mean",
+        "bootstrap se",
+        f"{confidence:g}% ci low",
+        f"{confidence:g}% ci high",
+    ]
+    if not metrics:
+        return pd.DataFrame(columns=columns)
+
+    means = bootstrap_means(values, resamples, seed)
+    tail = (100 - confidence) / 2
+    with warnings.catch_warnings():
+        # metrics without any value give all-NaN columns
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        low, high = np.nanpercentile(means, [tail, 100 - tail], axis=0)
+        se = np.nanstd(means, axis=0, ddof=1)
+        mean = np.nanmean(values, axis=0)
+    return pd.DataFrame(
+        np.column_stack([(~np.isnan(values)).sum(axis=0), mean, se, low, high]),
+        index=pd.Index(metrics, name="metric"),
+        columns=columns,
+    )
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+hypoxic burden - area under a spo2 threshold
+
+each sample contributes (threshold - fixed_spo2) x interval when below the
+threshold, gap and spo2 artifact samples contribute nothing - the values
+filled in for artifacts were not measured. areas are reported in %·min and
+burdens in %·min per hour of recording (excluding gaps), nan for a night
+without any. the per-bout areas
+come from one cumulative sum over the night, so every bout costs two
+lookups instead of its own mask over night_df
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import numpy as np
+
+# %% define constants
+# threshold setting used for the area of each bout type
+BOUT_BURDEN_THRESHOLDS = {
+    "desat bouts": "desat threshold",
+    "sustained desat bouts": "desat threshold",
+    "subdesat bouts": "desat subthreshold",
+    "sustained subdesat bouts": "desat subthreshold",
+    "sevdesat bouts": "desat severe threshold",
+    "sustained sevdesat bouts": "desat severe threshold",
+}
+
+# threshold settings reported as overall burden in the summary
+SUMMARY_BURDEN_THRESHOLDS = {
+    "desat": "desat threshold",
+    "sev desat": "desat severe threshold",
+}
+
+
+# %% define functions
+def sample_area(night_df, threshold):
+    """
+    area below 'threshold' of every sample in %·sec, zero for gap and spo2
+    artifact samples
+    """
+    spo2 = night_df["fixed_spo2"].to_numpy(dtype=float)
+    interval = night_df["interval"].to_numpy(dtype=float)
+    excluded = night_df["gaps"].to_numpy(dtype=bool) | night_df[
+        "spo2_NA_filter"
+    ].to_numpy(dtype=bool)
+    deficit = np.clip(threshold - spo2, 0, None)
+    return np.where(excluded | np.isnan(deficit), 0.0, deficit * interval)
+
+
+def bout_areas(bouts, night_df, area):
+    """
+    area (%·min) of every bout from the per-sample areas, summed over the
+    samples from bout start to bout stop inclusive as in bout_assembler
+    """
+    if not bouts:
+        return np.array([])
+    ts = night_df["ts"].to_numpy(dtype="datetime64[ns]")
+    starts = np.array([bout["start"] for bout in bouts], dtype="datetime64[ns]")
+    stops = np.array([bout["stop"] for bout in bouts], dtype="datetime64[ns]")
+    cumulative = np.concatenate([[0.0], np.cumsum(area)])
+    return (
+        cumulative[np.searchsorted(ts, stops, side="right")]
+        - cumulative[np.searchsorted(ts, starts, side="left")]
+    ) / 60
+
+
+def add_bout_burden(bouts_by_type, night_df, settings):
+    """
+    adds a 'hypoxic_burden' (%·min below the bout type's threshold) entry to
+    every bout dict, areas for each threshold are computed once and shared
+    """
+    areas = {}
+    for bout_type, bouts in bouts_by_type.items():
+        threshold = settings[BOUT_BURDEN_THRESHOLDS[bout_type]]
+        if threshold not in areas:
+            areas[threshold] = sample_area(night_df, threshold)
+        for bout, bout_area in zip(
+            bouts, bout_areas(bouts, night_df, areas[threshold])
+        ):
+            bout["hypoxic_burden"] = bout_area
+    return bouts_by_type
+
+
+def per_hour(value, hours):
+    """
+    value per hour, nan when there is no recording time to divide by
+    """
+    return value / hours if hours > 0 else np.nan
+
+
+def summary_burden(night_df, settings):
+    """
+    overall area (%·min) and hypoxic burden (%·min/hr) below the desat and
+    severe desat thresholds
+    """
+    valid_hours = (
+        night_df["interval"]
+        .to_numpy(dtype=float)[~night_df["gaps"].to_numpy(dtype=bool)]
+        .sum()
+        / 3600
+    )
+    summary = {}
+    for label, setting in SUMMARY_BURDEN_THRESHOLDS.items():
+        area = sample_area(night_df, settings[setting]).sum() / 60
+        summary[f"area under {label} threshold (%min)"] = area
+        summary[f"hypoxic burden {label} (%min/hr)"] = per_hour(area, valid_hours)
+    return summary
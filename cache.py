@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+memoized per-subject results
+
+a subject's result (duration bin, output summary and bouts) and its night
+workbook are stored under a fingerprint of its fragment file contents, its
+verified end times, the settings that affect results and the source of the
+analysis modules, so an unchanged subject is loaded from disk instead of
+re-analysed while any change to the analysis code invalidates the cache. file content hashes are
+remembered by path, size and modification time so unchanged files are not
+re-read either
+
+the cache is limited in size - the least recently used entries are evicted
+first - and can be emptied with `python cache.py purge [cache folder]`
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import os
+import json
+import hashlib
+import pickle
+import tempfile
+import shutil
+import argparse
+import functools
+
+import settings_profile
+
+# %% define constants
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "sasa")
+DEFAULT_CACHE_SIZE_MB = 1024
+
+# settings that do not change a subject's result - how a run is executed,
+# the cohort summaries and the clock jump warnings
+EXECUTION_SETTINGS = [
+    "ingest threads",
+    "subject threads",
+    "segment rows",
+    "cache size (MB)",
+    "parallel workers",
+    "memory budget (MB)",
+    "backend",
+    "include patterns",
+    "exclude patterns",
+    "bootstrap resamples",
+    "bootstrap seed",
+    "bootstrap confidence (%)",
+    "clock jump threshold (sec)",
+]
+
+# modules whose code shapes a subject's result or night workbook
+ANALYSIS_MODULES = [
+    "main",
+    "ingest",
+    "settings_profile",
+    "odi",
+    "burden",
+    "segments",
+    "epochs",
+    "polars_backend",
+    "xlsx_stream",
+    "night_trace",
+]
+
+FILE_HASH_INDEX = "file hashes.json"
+# folder of the discovery.py folder indexes
+DISCOVERY_INDEX = "discovery"
+
+
+# %% define functions
+def atomic_write(path, data):
+    """
+    writes bytes to path through a temporary file in the same folder
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), suffix=".tmp", delete=False
+    ) as tmp_file:
+        tmp_file.write(data)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_file.name, path)
+
+
+def file_digest(f, hash_index):
+    """
+    sha256 of a file's contents, reused from hash_index while the file's
+    size and modification time are unchanged
+    """
+    stat = os.stat(f)
+    path = os.path.abspath(f)
+    entry = hash_index.get(path)
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+        return entry["digest"]
+    digest = hashlib.sha256()
+    with open(f, "rb") as recording:
+        for chunk in iter(lambda: recording.read(1 << 20), b""):
+            digest.update(chunk)
+    hash_index[path] = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "digest": digest.hexdigest(),
+    }
+    return hash_index[path]["digest"]
+
+
+def load_hash_index(cache_path):
+    """
+    loads the remembered file content hashes of a cache folder
+    """
+    try:
+        with open(os.path.join(cache_path, FILE_HASH_INDEX)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_hash_index(cache_path, hash_index):
+    """
+    saves the remembered file content hashes of a cache folder
+    """
+    atomic_write(
+        os.path.join(cache_path, FILE_HASH_INDEX),
+        json.dumps(hash_index, indent=1).encode(),
+    )
+
+
+@functools.cache
+def analysis_digest():
+    """
+    sha256 of the source of the ANALYSIS_MODULES, read once per process
+    """
+    digest = hashlib.sha256()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for module in ANALYSIS_MODULES:
+        with open(os.path.join(folder, f"{module}.py"), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def subject_fingerprint(subject_file_list, settings, file_time_fix, hash_index):
+    """
+    fingerprint of everything a subject's result depends on - fragment
+    names and contents, their verified end times, the result settings
+    and the analysis code
+    """
+    file_names = [os.path.basename(f) for f in subject_file_list]
+    end_times = {
+        name: settings_profile.end_time(file_time_fix, name) for name in file_names
+    }
+    fingerprint = {
+        "version": __version__,
+        "analysis": analysis_digest(),
+        "files": [
+            [name, file_digest(f, hash_index)]
+            for name, f in zip(file_names, subject_file_list)
+        ],
+        "file time fix": [
+            [name, end_times[name]] for name in sorted(file_names) if end_times[name]
+        ],
+        "settings": {
+            key: value
+            for key, value in settings.items()
+            if key not in EXECUTION_SETTINGS
+        },
+    }
+    return hashlib.sha256(
+        json.dumps(fingerprint, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def entry_path(cache_path, key, extension="pkl"):
+    """
+    location of a cached result (pkl), night workbook (xlsx) or night
+    trace (npz)
+    """
+    return os.path.join(cache_path, "results", f"{key}.{extension}")
+
+
+def load_result(cache_path, key):
+    """
+    loads a cached result, returns None when missing or unreadable
+
+    a hit refreshes the entry's modification time, which orders eviction
+    """
+    path = entry_path(cache_path, key)
+    try:
+        with open(path, "rb") as f:
+            record = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    os.utime(path)
+    return record
+
+
+def restore_workbook(cache_path, key, destination, trace_destination=None):
+    """
+    copies a cached night workbook (and night trace) to destination, returns
+    False if the entry has no workbook or no trace
+    """
+    try:
+        shutil.copyfile(entry_path(cache_path, key, "xlsx"), destination)
+        if trace_destination:
+            shutil.copyfile(entry_path(cache_path, key, "npz"), trace_destination)
+    except OSError:
+        return False
+    return True
+
+
+def store_result(
+    cache_path,
+    key,
+    record,
+    night_workbook=None,
+    size_limit_mb=DEFAULT_CACHE_SIZE_MB,
+    night_trace=None,
+):
+    """
+    stores a result (and copies of its night workbook and trace) and evicts
+    least recently used entries beyond the size limit
+    """
+    os.makedirs(os.path.dirname(entry_path(cache_path, key)), exist_ok=True)
+    if night_workbook:
+        shutil.copyfile(night_workbook, entry_path(cache_path, key, "xlsx"))
+    if night_trace:
+        shutil.copyfile(night_trace, entry_path(cache_path, key, "npz"))
+    atomic_write(
+        entry_path(cache_path, key),
+        pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL),
+    )
+    evict(cache_path, size_limit_mb)
+
+
+def cache_entries(cache_path):
+    """
+    (key, size, last used) of every cached result, least recently used first
+    """
+    results_path = os.path.join(cache_path, "results")
+    if not os.path.isdir(results_path):
+        return []
+    sizes = {}
+    last_used = {}
+    with os.scandir(results_path) as scan:
+        for entry in scan:
+            key, extension = os.path.splitext(entry.name)
+            if extension not in [".pkl", ".xlsx", ".npz"]:
+                continue
+            stat = entry.stat()
+            sizes[key] = sizes.get(key, 0) + stat.st_size
+            if extension == ".pkl":
+                last_used[key] = stat.st_mtime_ns
+    return sorted(
+        [(key, size, last_used.get(key, 0)) for key, size in sizes.items()],
+        key=lambda entry: entry[2],
+    )
+
+
+def evict(cache_path, size_limit_mb):
+    """
+    removes least recently used results until the cache fits the limit,
+    returns the number of entries removed
+    """
+    entries = cache_entries(cache_path)
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for key, size, _ in entries:
+        if total <= size_limit_mb * 1e6:
+            break
+        for extension in ["pkl", "xlsx", "npz"]:
+            if os.path.exists(entry_path(cache_path, key, extension)):
+                os.remove(entry_path(cache_path, key, extension))
+        total -= size
+        removed += 1
+    return removed
+
+
+def purge(cache_path):
+    """
+    removes every cached result, the file hash index and the folder indexes
+    """
+    removed = evict(cache_path, 0)
+    if os.path.exists(os.path.join(cache_path, FILE_HASH_INDEX)):
+        os.remove(os.path.join(cache_path, FILE_HASH_INDEX))
+    shutil.rmtree(os.path.join(cache_path, DISCOVERY_INDEX), ignore_errors=True)
+    return removed
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="manage the SASA result cache")
+    parser.add_argument("command", choices=["info", "purge"])
+    parser.add_argument("cache", nargs="?", default=DEFAULT_CACHE_PATH)
+    args = parser.parse_args()
+
+    if args.command == "purge":
+        print(f"removed {purge(args.cache)} cached result(s) from {args.cache}")
+    else:
+        entries = cache_entries(args.cache)
+        print(
+            f"{args.cache}: {len(entries)} cached result(s), "
+            + f"{sum(size for _, size, _ in entries) / 1e6:.1f} MB"
+        )
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+columnar cohort-wide bout table
+
+every bout of every type from every subject is gathered into one table
+(plus a small per-subject table for normalising by recording time) and
+stored as parquet, so cohort questions are answered with vectorized
+filters instead of re-reading the per-subject workbooks
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import pandas as pd
+import numpy as np
+import os
+import argparse
+
+# %% define constants
+BOUT_COLUMNS = {
+    "start": "datetime64[ns]",
+    "stop": "datetime64[ns]",
+    "duration": "float64",
+    "artifact_pulse_duration": "float64",
+    "artifact_spo2_duration": "float64",
+    "artifact_spo2_and_pulse_duration": "float64",
+    "artifact_spo2_or_pulse_duration": "float64",
+    "duration_min_dur_sev_desat": "float64",
+    "ratio_sev_desat": "float64",
+    "low_spo2": "float64",
+    "mean_spo2": "float64",
+    "median_spo2": "float64",
+    "low_pulse": "float64",
+    "high_pulse": "float64",
+    "mean_pulse": "float64",
+    "median_pulse": "float64",
+    "hypoxic_burden": "float64",
+    "started subdesat": "Int8",
+}
+
+COHORT_BOUTS_FILE = "cohort bouts"
+COHORT_SUBJECTS_FILE = "cohort subjects"
+
+
+# %% define functions
+def build_bout_table(subject_records):
+    """
+    builds the cohort bout table from per-subject records (as saved in the
+    run checkpoints) - one row per bout with 'subject' and 'bout type'
+    categorical columns followed by the bout fields
+    """
+    frames = []
+    for subject_id, record in subject_records.items():
+        for bout_type, bouts in record["bouts"].items():
+            if not bouts:
+                continue
+            bout_df = pd.DataFrame(bouts)
+            bout_df.insert(0, "bout type", bout_type)
+            bout_df.insert(0, "subject", subject_id)
+            frames.append(bout_df)
+
+    if frames:
+        bout_table = pd.concat(frames, ignore_index=True)
+    else:
+        bout_table = pd.DataFrame(columns=["subject", "bout type"])
+
+    for column, dtype in BOUT_COLUMNS.items():
+        if column not in bout_table:
+            bout_table[column] = pd.Series(dtype=dtype)
+        elif column == "started subdesat":
+            # 'unk' marks bouts whose starting state could not be determined
+            bout_table[column] = pd.to_numeric(
+                bout_table[column], errors="coerce"
+            ).astype(dtype)
+        else:
+            bout_table[column] = bout_table[column].astype(dtype)
+
+    bout_table["subject"] = bout_table["subject"].astype("category")
+    bout_table["bout type"] = bout_table["bout type"].astype("category")
+    return bout_table[["subject", "bout type"] + list(BOUT_COLUMNS)]
+
+
+def build_subject_table(subject_records):
+    """
+    builds the per-subject table used to normalise cohort bout counts
+    """
+    subject_table = pd.DataFrame(
+        {
+            "subject": list(subject_records),
+            "duration bin": [r["duration_bin"] for r in subject_records.values()],
+            "night start": [
+                r["output_summary"]["night start"] for r in subject_records.values()
+            ],
+            "night stop": [
+                r["output_summary"]["night stop"] for r in subject_records.values()
+            ],
+            "duration recording (excluding_gaps)": [
+                r["output_summary"]["duration recording (excluding_gaps)"]
+                for r in subject_records.values()
+            ],
+        }
+    )
+    subject_table["subject"] = subject_table["subject"].astype("category")
+    return subject_table
+
+
+def write_table(df, path_stem):
+    """
+    writes a table as parquet, or as a pickle when no parquet engine is
+    installed. returns the path written
+    """
+    try:
+        df.to_parquet(f"{path_stem}.parquet", index=False)
+        return f"{path_stem}.parquet"
+    except ImportError:
+        df.to_pickle(f"{path_stem}.pkl")
+        return f"{path_stem}.pkl"
+
+
+def read_table(path_stem, columns=None):
+    """
+    reads a table written by write_table, optionally only some columns
+    """
+    if os.path.exists(f"{path_stem}.parquet"):
+        return pd.read_parquet(f"{path_stem}.parquet", columns=columns)
+    df = pd.read_pickle(f"{path_stem}.pkl")
+    return df[columns] if columns else df
+
+
+def write_cohort_tables(subject_records, output_file_path):
+    """
+    builds and writes the cohort bout and subject tables to the output folder
+    """
+    bout_path = write_table(
+        build_bout_table(subject_records),
+        os.path.join(output_file_path, COHORT_BOUTS_FILE),
+    )
+    subject_path = write_table(
+        build_subject_table(subject_records),
+        os.path.join(output_file_path, COHORT_SUBJECTS_FILE),
+    )
+    return bout_path, subject_path
+
+
+def read_cohort_tables(output_file_path, columns=None):
+    """
+    reads the cohort bout and subject tables from an output folder
+    """
+    return (
+        read_table(os.path.join(output_file_path, COHORT_BOUTS_FILE), columns),
+        read_table(os.path.join(output_file_path, COHORT_SUBJECTS_FILE)),
+    )
+
+
+def duration_histogram(bout_table, bins, bout_type="desat bouts"):
+    """
+    counts of bouts of one type per duration bin (bin edges in seconds)
+    across the cohort
+    """
+    durations = bout_table["duration"].to_numpy()[
+        (bout_table["bout type"] == bout_type).to_numpy()
+    ]
+    counts, edges = np.histogram(durations, bins=bins)
+    return pd.Series(
+        counts,
+        index=pd.IntervalIndex.from_breaks(edges, closed="left"),
+        name=f"{bout_type} count",
+    )
+
+
+def share_below(bout_table, spo2, bout_type="desat bouts", by_subject=False):
+    """
+    share of bouts of one type whose lowest spo2 fell below 'spo2',
+    for the whole cohort or per subject
+    """
+    bouts = bout_table[bout_table["bout type"] == bout_type]
+    below = bouts["low_spo2"] < spo2
+    if by_subject:
+        return below.groupby(bouts["subject"], observed=False).mean()
+    return below.mean()
+
+
+def bouts_per_hour(bout_table, subject_table, bout_type="desat bouts"):
+    """
+    bouts of one type per hour of recording (excluding gaps) for every
+    subject, subjects without any bouts are reported as 0
+    """
+    counts = (
+        bout_table[bout_table["bout type"] == bout_type]
+        .groupby("subject", observed=False)
+        .size()
+    )
+    hours = (
+        subject_table.set_index("subject")["duration recording (excluding_gaps)"] / 3600
+    )
+    return (counts.reindex(hours.index, fill_value=0) / hours).rename(
+        f"{bout_type} per hour"
+    )
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="summarise the cohort bout table from a SASA output folder"
+    )
+    parser.add_argument("output", help="SASA output folder")
+    parser.add_argument("--bout-type", default="desat bouts")
+    parser.add_argument(
+        "--below", type=float, default=80, help="spo2 level for the share below"
+    )
+    args = parser.parse_args()
+
+    bout_table, subject_table = read_cohort_tables(args.output)
+    print(
+        duration_histogram(
+            bout_table, [0, 10, 20, 30, 60, 120, 300, np.inf], args.bout_type
+        ).to_string()
+    )
+    print(
+        f"share of {args.bout_type} below {args.below}%: "
+        + f"{share_below(bout_table, args.below, args.bout_type):.3f}"
+    )
+    print(bouts_per_hour(bout_table, subject_table, args.bout_type).to_string())
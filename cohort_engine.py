@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+batch-vectorized cohort scoring engine
+
+every subject shares the sampling interval and night window from settings,
+so the night recordings of a cohort are placed on one common time grid
+(subjects x samples, time measured from the night start) with a mask for
+slots that hold no sample. thresholds, the minimum/sustained duration
+filters, bout extraction and the core summary metrics then run as batched
+array operations over all subjects at once. recordings that do not sit on
+the grid (irregular sampling, several nights) fall back to the per-subject
+pipeline in main.py
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import pandas as pd
+import numpy as np
+import datetime
+import logging
+import os
+import argparse
+import traceback
+import warnings
+
+import main
+import settings_profile
+
+# %% define constants
+# output_summary keys reproduced by the cohort engine
+ENGINE_SUMMARY_KEYS = [
+    "night start",
+    "night stop",
+    "recording files",
+    "duration recording (excluding_gaps)",
+    "duration recording (including gaps)",
+    "duration of recording gaps",
+    "duration spo2 artifact",
+    "duration pulse artifact",
+    "duration both artifact",
+    "duration either artifact",
+    "maximum recording gap",
+    "cummulative any duration desat",
+    "cumulative any duration subdesat",
+    "cummulative any duration sev desat",
+    "count spike desat",
+    "count desat bouts",
+    "sum desat duration",
+    "mean desat duration",
+    "median desat duration",
+    "count subdesat bouts",
+    "sum subdesat duration",
+    "mean subdesat duration",
+    "median subdesat duration",
+    "count sustained desat bouts",
+    "sum sustained desat duration",
+    "mean sustained desat duration",
+    "median sustained desat duration",
+    "mean spo2 during non_desat and non_artifact",
+    "median spo2 during non_desat and non_artifact",
+    "minimum spo2 during non_desat and non_artifact",
+    "mean pulse during non_desat and non_artifact",
+    "mean spo2 overall",
+    "median spo2 overall",
+    "minimum spo2 overall",
+]
+
+GRID_COLUMNS = {
+    "spo2": np.nan,
+    "pulse": np.nan,
+    "fixed_spo2": np.nan,
+    "interval": np.nan,
+    "diff_spo2": np.nan,
+    "gaps": False,
+    "spo2_NA_filter": False,
+    "pulse_NA_filter": False,
+    "spo2_and_pulse_NA_filter": False,
+    "spo2_or_pulse_NA_filter": False,
+}
+
+
+# %% define functions
+def night_window_seconds(settings):
+    """
+    length of the night window from settings in seconds
+    """
+    night_start, night_stop = settings_profile.night_window(settings)
+    start_sec = night_start.hour * 3600 + night_start.minute * 60 + night_start.second
+    stop_sec = night_stop.hour * 3600 + night_stop.minute * 60 + night_stop.second
+    if start_sec < stop_sec:
+        return stop_sec - start_sec
+    return 24 * 3600 - start_sec + stop_sec
+
+
+def grid_position(night_ts, settings, grid_length):
+    """
+    places the night timestamps of one subject on the common grid
+
+    returns (grid index of each sample, timestamp of grid slot 0) or None
+    when the samples do not sit on a regular grid within a single night
+    """
+    sample_ns = int(settings["expected_sampling_rate (sec)"] * 1e9)
+    night_start, night_stop = settings_profile.night_window(settings)
+
+    first_ts = night_ts.iloc[0]
+    anchor_date = first_ts.date()
+    if night_start > night_stop and first_ts.time() <= night_stop:
+        anchor_date -= datetime.timedelta(days=1)
+    anchor = pd.Timestamp(datetime.datetime.combine(anchor_date, night_start))
+
+    offsets = night_ts.to_numpy(dtype="datetime64[ns]").astype("int64") - anchor.value
+    phase = offsets[0] % sample_ns
+    if ((offsets - phase) % sample_ns).any():
+        return None
+    grid_index = (offsets - phase) // sample_ns
+    if (np.diff(grid_index) <= 0).any() or grid_index[-1] >= grid_length:
+        return None
+    return grid_index, anchor + pd.Timedelta(phase, unit="ns")
+
+
+def window_counts(values, lower, upper):
+    """
+    number of True values in a centered window [j + lower, j + upper] for
+    every column j of a 2-D boolean array, via a cumulative sum per row
+    """
+    counts = np.zeros((values.shape[0], values.shape[1] + 1), dtype=np.int32)
+    np.cumsum(values, axis=1, out=counts[:, 1:])
+    columns = np.arange(values.shape[1])
+    upper_index = np.minimum(columns + upper + 1, values.shape[1])
+    lower_index = np.maximum(columns + lower, 0)
+    return counts[:, upper_index] - counts[:, lower_index]
+
+
+def grid_duration_filter(flag, present, window_sec, sample_sec):
+    """
+    batched equivalent of the rolling(window, on="ts", center=True) min
+    then max used in main.py - a sample is kept when it lies in a run of
+    flagged samples at least one window long. the pandas time window
+    (t - w/2, t + w/2] covers grid offsets floor(-w/2/dt)+1 .. floor(w/2/dt),
+    and empty (masked) slots are ignored as they are not samples
+    """
+    lower = int(np.floor(-window_sec / 2 / sample_sec)) + 1
+    upper = int(np.floor(window_sec / 2 / sample_sec))
+    trimmed = present & (window_counts(present & ~flag, lower, upper) == 0)
+    return present & (window_counts(trimmed, lower, upper) > 0)
+
+
+def carry_forward(values, present):
+    """
+    fills empty slots with the last sample value of the same row (slots
+    before the first sample take the first sample value), so a diff along
+    the row compares each sample with the previous sample
+    """
+    columns = np.arange(present.shape[1])
+    source = np.where(present, columns, 0)
+    np.maximum.accumulate(source, axis=1, out=source)
+    first = np.argmax(present, axis=1)[:, None]
+    source = np.where(columns < first, first, source)
+    return np.take_along_axis(values, source, axis=1)
+
+
+def grid_bouts(filtered, present, sample_sec):
+    """
+    batched equivalent of the bout start/stop detection and bout_assembler
+    pairing in main.py
+
+    returns (subject row, start slot, duration in seconds) for every bout
+    """
+    carried = carry_forward(filtered, present).astype(np.int8)
+    change = np.zeros_like(carried)
+    change[:, 1:] = np.diff(carried, axis=1)
+    change[~present] = 0
+
+    start_rows, start_slots = np.nonzero(change == 1)
+    stop_rows, stop_slots = np.nonzero(change == -1)
+    n_rows = filtered.shape[0]
+
+    # rank of every start/stop within its row
+    start_rank = np.arange(start_rows.size) - np.searchsorted(start_rows, start_rows)
+    stop_rank = np.arange(stop_rows.size) - np.searchsorted(stop_rows, stop_rows)
+
+    # a row that began inside a bout has a stop before its first start,
+    # that stop is dropped as in bout_assembler
+    first_start = np.full(n_rows, np.iinfo(np.int64).max)
+    first_start[start_rows[start_rank == 0]] = start_slots[start_rank == 0]
+    first_stop = np.full(n_rows, np.iinfo(np.int64).max)
+    first_stop[stop_rows[stop_rank == 0]] = stop_slots[stop_rank == 0]
+    began_in_bout = first_start > first_stop
+    stop_rank = stop_rank - began_in_bout[stop_rows]
+
+    start_key = start_rows.astype(np.int64) * (filtered.shape[1] + 1) + start_rank
+    stop_key = stop_rows.astype(np.int64) * (filtered.shape[1] + 1) + stop_rank
+    keep_stop = stop_rank >= 0
+    _, start_index, stop_index = np.intersect1d(
+        start_key, np.where(keep_stop, stop_key, -1), return_indices=True
+    )
+    bout_rows = start_rows[start_index]
+    bout_starts = start_slots[start_index]
+    durations = (stop_slots[stop_index] - bout_starts) * sample_sec
+    return bout_rows, bout_starts, durations.astype(np.float64)
+
+
+def row_count_sum_mean_median(rows, values, n_rows):
+    """
+    per-row count, sum, mean and median of grouped values (np.sum, np.mean
+    and np.median conventions for rows without values: 0, nan, nan)
+    """
+    count = np.bincount(rows, minlength=n_rows)
+    total = np.bincount(rows, weights=values, minlength=n_rows)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+    median = np.full(n_rows, np.nan)
+    order = np.lexsort((values, rows))
+    sorted_values = values[order]
+    offsets = np.concatenate([[0], np.cumsum(count)[:-1]])
+    has_values = count > 0
+    low = offsets + (count - 1) // 2
+    high = offsets + count // 2
+    median[has_values] = (
+        sorted_values[low[has_values]] + sorted_values[high[has_values]]
+    ) / 2
+    return count, total, mean, median
+
+
+def masked_stat(values, mask, func):
+    """
+    applies a nan-aware reduction along rows to the values selected by mask
+    """
+    with warnings.catch_warnings():
+        # all-nan rows return nan, as the pandas reductions in main.py do
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return func(np.where(mask, values, np.nan), axis=1)
+
+
+def build_grid(subjects, grid_length):
+    """
+    stacks per-subject night columns on the common grid
+
+    subjects is a list of (night_df, grid_index) pairs, returns a dict of
+    (subjects x grid_length) arrays and the 'present' mask
+    """
+    n_subjects = len(subjects)
+    grid = {"present": np.zeros((n_subjects, grid_length), dtype=bool)}
+    for column, fill in GRID_COLUMNS.items():
+        grid[column] = np.full(
+            (n_subjects, grid_length), fill, dtype=bool if fill is False else float
+        )
+    for row, (night_df, grid_index) in enumerate(subjects):
+        grid["present"][row, grid_index] = True
+        for column in GRID_COLUMNS:
+            grid[column][row, grid_index] = night_df[column].to_numpy()
+    return grid
+
+
+def score_grid(grid, settings):
+    """
+    scores all subjects on the grid at once, returns a dict of output
+    summary key -> per-subject array
+    """
+    present = grid["present"]
+    n_rows = present.shape[0]
+    sample_sec = settings["expected_sampling_rate (sec)"]
+    not_gap = present & ~grid["gaps"]
+    interval = np.where(present, grid["interval"], 0)
+
+    fixed_spo2 = grid["fixed_spo2"]
+    with np.errstate(invalid="ignore"):
+        desat = not_gap & (fixed_spo2 < settings["desat threshold"])
+        sub_desat = (
+            not_gap
+            & (fixed_spo2 <= settings["desat subthreshold"])
+            & (fixed_spo2 >= settings["desat threshold"])
+        )
+        sev_desat = not_gap & (fixed_spo2 < settings["desat severe threshold"])
+        spike_desat = not_gap & (grid["diff_spo2"] <= settings["desat spike"])
+
+    summary = {
+        "duration recording (excluding_gaps)": np.where(not_gap, interval, 0).sum(
+            axis=1
+        ),
+        "duration recording (including gaps)": interval.sum(axis=1),
+        "duration of recording gaps": np.where(grid["gaps"], interval, 0).sum(axis=1),
+        "duration spo2 artifact": np.where(
+            not_gap & grid["spo2_NA_filter"], interval, 0
+        ).sum(axis=1),
+        "duration pulse artifact": np.where(
+            not_gap & grid["pulse_NA_filter"], interval, 0
+        ).sum(axis=1),
+        "duration both artifact": np.where(
+            not_gap & grid["spo2_and_pulse_NA_filter"], interval, 0
+        ).sum(axis=1),
+        "duration either artifact": np.where(
+            not_gap & grid["spo2_or_pulse_NA_filter"], interval, 0
+        ).sum(axis=1),
+        "maximum recording gap": masked_stat(grid["interval"], present, np.nanmax),
+        "cummulative any duration desat": np.where(desat, interval, 0).sum(axis=1),
+        "cumulative any duration subdesat": np.where(sub_desat, interval, 0).sum(
+            axis=1
+        ),
+        "cummulative any duration sev desat": np.where(sev_desat, interval, 0).sum(
+            axis=1
+        ),
+        "count spike desat": spike_desat.sum(axis=1),
+    }
+
+    for label, flag, window in [
+        ("desat", desat, settings["minimum desat interval (sec)"]),
+        ("subdesat", sub_desat, settings["minimum desat interval (sec)"]),
+        ("sustained desat", desat, settings["sustained desat interval (sec)"]),
+    ]:
+        filtered = grid_duration_filter(flag, present, window, sample_sec)
+        rows, _, durations = grid_bouts(filtered, present, sample_sec)
+        count, total, mean, median = row_count_sum_mean_median(rows, durations, n_rows)
+        summary[f"count {label} bouts"] = count
+        summary[f"sum {label} duration"] = total
+        summary[f"mean {label} duration"] = mean
+        # main.py reports the mean for the subdesat 'median'
+        summary[f"median {label} duration"] = mean if label == "subdesat" else median
+
+    baseline = (
+        present
+        & (grid["spo2"] > settings["desat threshold"])
+        & ~grid["spo2_or_pulse_NA_filter"]
+    )
+    summary["mean spo2 during non_desat and non_artifact"] = masked_stat(
+        grid["spo2"], baseline, np.nanmean
+    )
+    summary["median spo2 during non_desat and non_artifact"] = masked_stat(
+        grid["spo2"], baseline, np.nanmedian
+    )
+    summary["minimum spo2 during non_desat and non_artifact"] = masked_stat(
+        grid["spo2"], baseline, np.nanmin
+    )
+    summary["mean pulse during non_desat and non_artifact"] = masked_stat(
+        grid["pulse"], baseline, np.nanmean
+    )
+    summary["mean spo2 overall"] = masked_stat(grid["spo2"], present, np.nanmean)
+    summary["median spo2 overall"] = masked_stat(grid["spo2"], present, np.nanmedian)
+    summary["minimum spo2 overall"] = masked_stat(grid["spo2"], present, np.nanmin)
+    return summary
+
+
+def score_cohort(file_dict, settings, file_time_fix, logger):
+    """
+    scores a cohort with the grid engine, falling back to the per-subject
+    pipeline for recordings that are not on the common grid
+
+    returns a dataframe indexed by subject with the duration bin, the
+    engine used and the ENGINE_SUMMARY_KEYS columns
+    """
+    sample_sec = settings["expected_sampling_rate (sec)"]
+    grid_length = int(night_window_seconds(settings) // sample_sec) + 1
+    night_duration_bins = main.build_night_duration_bins(settings, logger)
+
+    grid_subjects = []
+    grid_rows = {}
+    fallback = []
+    rows = {}
+    for subject_id, subject_file_list in file_dict.items():
+        try:
+            subject_df, subject_df_list = main.load_subject_df(
+                subject_id, subject_file_list, settings, file_time_fix, logger
+            )
+        except Exception as e:
+            logger.error(f"{subject_id} failed - {type(e).__name__}: {e}")
+            continue
+        night_df = subject_df[subject_df["night"]]
+        position = grid_position(night_df["ts"], settings, grid_length)
+        if night_df.shape[0] < 2 or position is None:
+            logger.info(f"{subject_id} is not on the common grid, scoring alone")
+            fallback.append((subject_id, subject_file_list))
+            continue
+        grid_index, slot_zero = position
+        grid_rows[subject_id] = (
+            len(grid_subjects),
+            slot_zero,
+            grid_index[0],
+            grid_index[-1],
+            len(subject_df_list),
+        )
+        grid_subjects.append((night_df, grid_index))
+
+    if grid_subjects:
+        logger.info(f"scoring {len(grid_subjects)} subject(s) on the common grid")
+        summary = score_grid(build_grid(grid_subjects, grid_length), settings)
+        sample_delta = pd.Timedelta(seconds=sample_sec)
+        for subject_id, (row, slot_zero, first, last, n_files) in grid_rows.items():
+            rows[subject_id] = {
+                "night start": slot_zero + first * sample_delta,
+                "night stop": slot_zero + last * sample_delta,
+                "recording files": n_files,
+            }
+            for key, values in summary.items():
+                rows[subject_id][key] = values[row]
+            rows[subject_id]["engine"] = "cohort grid"
+
+    for subject_id, subject_file_list in fallback:
+        try:
+            subject_result = main.process_subject(
+                subject_id,
+                subject_file_list,
+                settings,
+                file_time_fix,
+                night_duration_bins,
+                logger,
+            )
+        except Exception as e:
+            logger.error(f"{subject_id} failed - {type(e).__name__}: {e}")
+            logger.debug(traceback.format_exc())
+            continue
+        rows[subject_id] = {
+            key: subject_result["output_summary"][key] for key in ENGINE_SUMMARY_KEYS
+        }
+        rows[subject_id]["engine"] = "per subject"
+
+    cohort_df = pd.DataFrame.from_dict(rows, orient="index")
+    if cohort_df.empty:
+        return cohort_df
+    duration_hours = (
+        (
+            cohort_df["duration recording (excluding_gaps)"]
+            + settings["night duration round up within (minutes)"] * 60
+        )
+        / 60
+        / 60
+    ).astype(int)
+    cohort_df.insert(
+        0,
+        "duration bin",
+        [main.identify_bin(h, list(night_duration_bins)) for h in duration_hours],
+    )
+    return cohort_df[["duration bin", "engine"] + ENGINE_SUMMARY_KEYS]
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="score a cohort on a common time grid with batched array operations"
+    )
+    parser.add_argument("-i", "--input", default="./sample data/pooled/")
+    parser.add_argument("-o", "--output", default="./sample output/")
+    parser.add_argument("-s", "--settings", default="./sample settings.xlsx")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(threadName)s | %(levelname)-5.5s |  %(message)s",
+    )
+    logger = logging.getLogger()
+    settings, file_time_fix = main.read_settings(args.settings)
+    file_dict = main.collect_subject_files(args.input, logger)
+    cohort_df = score_cohort(file_dict, settings, file_time_fix, logger)
+    cohort_df.to_excel(
+        os.path.join(args.output, "Cohort Engine.xlsx"), sheet_name="cohort engine"
+    )
+    logger.info("Cohort Engine Output Saved")
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+group comparison of output_summary metrics
+
+every input folder is a labelled group ("label=folder", or the folder name)
+whose subjects are run through the regular per-subject pipeline. the numeric
+metrics of all subjects form one (subjects x metrics) matrix, which is
+ranked column-wise in a single pass, so every test below is computed for all
+metrics at once:
+- Kruskal-Wallis H with epsilon squared across all groups (more than two)
+- Mann-Whitney U (normal approximation, tie and continuity corrected) with
+  Cliff's delta for every pair of groups
+p values of each test family are corrected over the metrics with
+Benjamini-Hochberg. the comparison table is written to
+'Group Comparison.xlsx'
+
+    python compare.py -i "sample data/10 Desats" "sample data/10 No Desats" \\
+        -o "sample output" -s "sample settings.xlsx"
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import os
+import argparse
+import itertools
+import logging
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import main
+import scheduler
+import bootstrap
+
+# %% define constants
+COMPARISON_FILE = "Group Comparison.xlsx"
+
+# Chebyshev fit of erfc (Numerical Recipes erfcc), highest power first
+ERFC_COEFFICIENTS = [
+    0.17087277,
+    -0.82215223,
+    1.48851587,
+    -1.13520398,
+    0.27886807,
+    -0.18628806,
+    0.09678418,
+    0.37409196,
+    1.00002368,
+    -1.26551223,
+]
+
+
+# %% define functions
+def parse_group(argument):
+    """
+    (label, folder) of a "label=folder" argument, a bare folder is labelled
+    with its own name
+    """
+    label, separator, folder = argument.partition("=")
+    if not separator:
+        folder = argument
+        label = os.path.basename(os.path.normpath(argument))
+    return label, folder
+
+
+def summarise_subject(subject_id, subject_file_list, settings, file_time_fix, bins):
+    """
+    output summary of one subject (run in a scheduler worker)
+    """
+    return main.process_subject(
+        subject_id.rsplit("/", 1)[1],
+        subject_file_list,
+        settings,
+        file_time_fix,
+        bins,
+        logging.getLogger(),
+    )["output_summary"]
+
+
+def collect_group_summaries(groups, settings, file_time_fix, logger):
+    """
+    {label: {subject_id: output_summary}} for groups given as {label: folder}
+
+    subjects run largest first under the "parallel workers" and "memory
+    budget (MB)" settings, failed subjects are logged and left out
+    """
+    bins = list(main.build_night_duration_bins(settings, logger).keys())
+    tasks = {}
+    task_groups = {}
+    for label, folder in groups.items():
+        for subject_id, file_list in main.collect_subject_files(folder, logger).items():
+            task_id = f"{label}/{subject_id}"
+            tasks[task_id] = file_list
+            task_groups[task_id] = (label, subject_id)
+    summaries = {}
+    for task_id, summary, error, _ in scheduler.run_largest_first(
+        tasks,
+        summarise_subject,
+        args=(settings, file_time_fix, bins),
+        max_workers=int(settings.get("parallel workers", 1)),
+        memory_budget_mb=settings.get("memory budget (MB)"),
+        logger=logger,
+    ):
+        label, subject_id = task_groups[task_id]
+        if error:
+            logger.error(f"{label} {subject_id} failed - {error}")
+            continue
+        summaries[task_id] = summary
+        logger.info(f"{label} {subject_id} summarised")
+
+    # subjects in folder order whatever order they finished in
+    group_summaries = {label: {} for label in groups}
+    for task_id, (label, subject_id) in task_groups.items():
+        if task_id in summaries:
+            group_summaries[label][subject_id] = summaries[task_id]
+    return group_summaries
+
+
+def rank_columns(values):
+    """
+    average ranks (1-based) of every column of values, NaN stays NaN
+
+    also returns the tie correction sum(t**3 - t) of every column
+    """
+    rows, columns = values.shape
+    order = np.argsort(values, axis=0, kind="stable")
+    ordered = np.take_along_axis(values, order, axis=0)
+
+    # tie groups of the column-major flattened sorted values - the first row
+    # of every column starts a group, NaN never ties
+    new_group = np.ones_like(ordered, dtype=bool)
+    new_group[1:] = ordered[1:] != ordered[:-1]
+    new_group = new_group.T.ravel()
+    group_starts = np.flatnonzero(new_group)
+    group_sizes = np.diff(np.append(group_starts, rows * columns))
+    first_rank = group_starts % rows + 1
+    sorted_ranks = np.repeat(first_rank + (group_sizes - 1) / 2, group_sizes)
+
+    ranks = np.empty_like(values, dtype=np.float64)
+    np.put_along_axis(ranks, order, sorted_ranks.reshape(columns, rows).T, axis=0)
+    ranks[np.isnan(values)] = np.nan
+
+    tie_sum = np.bincount(
+        group_starts // rows,
+        weights=group_sizes.astype(np.float64) ** 3 - group_sizes,
+        minlength=columns,
+    )
+    return ranks, tie_sum
+
+
+def erfc(x):
+    """
+    complementary error function (fractional error below 1.2e-7), numpy
+    has none and scipy is not a dependency
+    """
+    z = np.abs(x)
+    t = 1 / (1 + z / 2)
+    result = t * np.exp(-z * z + np.polyval(ERFC_COEFFICIENTS, t))
+    return np.where(x >= 0, result, 2 - result)
+
+
+def chi2_sf(x, df):
+    """
+    chi-squared survival function for an integer number of degrees of
+    freedom, from the closed-form series
+    """
+    x = np.asarray(x, dtype=np.float64)
+    half = x / 2
+    if df % 2 == 0:
+        total = np.zeros_like(x)
+        term = np.ones_like(x)
+        for i in range(df // 2):
+            if i:
+                term = term * half / i
+            total = total + term
+        return np.exp(-half) * total
+    total = erfc(np.sqrt(half))
+    term = np.sqrt(half) * 2 / np.sqrt(np.pi)
+    for i in range((df - 1) // 2):
+        if i:
+            term = term * half / (i + 0.5)
+        total = total + np.exp(-half) * term
+    return total
+
+
+def benjamini_hochberg(p_values):
+    """
+    Benjamini-Hochberg adjusted p values (q values), NaN is left out
+    """
+    q_values = np.full_like(p_values, np.nan, dtype=np.float64)
+    tested = np.flatnonzero(~np.isnan(p_values))
+    if not len(tested):
+        return q_values
+    order = tested[np.argsort(p_values[tested])]
+    scaled = p_values[order] * len(order) / np.arange(1, len(order) + 1)
+    q_values[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1)
+    return q_values
+
+
+def mann_whitney(ranks, tie_sum, in_first, in_second):
+    """
+    U of the first group, Cliff's delta and two-sided p value of every
+    metric, from ranks of the two groups' pooled values
+    """
+    n1 = (~np.isnan(ranks[in_first])).sum(axis=0).astype(np.float64)
+    n2 = (~np.isnan(ranks[in_second])).sum(axis=0).astype(np.float64)
+    n = n1 + n2
+    u1 = np.nansum(ranks[in_first], axis=0) - n1 * (n1 + 1) / 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_sum / (n * (n - 1))))
+        z = (np.abs(u1 - n1 * n2 / 2) - 0.5) / sigma
+        z = np.maximum(z, 0)
+        p = np.where(sigma > 0, erfc(z / np.sqrt(2)), np.nan)
+        delta = 2 * u1 / (n1 * n2) - 1
+    empty = (n1 == 0) | (n2 == 0)
+    return (
+        np.where(empty, np.nan, u1),
+        np.where(empty, np.nan, delta),
+        np.where(empty, np.nan, p),
+    )
+
+
+def kruskal_wallis(ranks, tie_sum, group_masks):
+    """
+    H, epsilon squared and p value of every metric across all groups
+    """
+    valid = ~np.isnan(ranks)
+    n = valid.sum(axis=0).astype(np.float64)
+    h = np.zeros(ranks.shape[1])
+    groups_present = np.zeros(ranks.shape[1])
+    for mask in group_masks:
+        n_group = valid[mask].sum(axis=0)
+        rank_sum = np.nansum(ranks[mask], axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            h += np.where(n_group > 0, rank_sum**2 / n_group, 0)
+        groups_present += n_group > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        h = 12 / (n * (n + 1)) * h - 3 * (n + 1)
+        h = h / (1 - tie_sum / (n**3 - n))
+        epsilon_squared = h / (n - 1)
+    complete = groups_present == len(group_masks)
+    h = np.where(complete, h, np.nan)
+    return (
+        h,
+        np.where(complete, epsilon_squared, np.nan),
+        chi2_sf(h, len(group_masks) - 1),
+    )
+
+
+def compare_groups(group_summaries):
+    """
+    one row per numeric output_summary metric: per group subject count and
+    median, the Kruskal-Wallis test across groups (more than two groups) and
+    a Mann-Whitney test for every pair of groups, with BH q values
+    """
+    labels = list(group_summaries)
+    pooled = {}
+    membership = []
+    for label in labels:
+        for subject_id, summary in group_summaries[label].items():
+            pooled[f"{label}/{subject_id}"] = summary
+            membership.append(label)
+    metrics, values = bootstrap.metric_matrix(pooled)
+    membership = np.array(membership)
+    group_masks = [membership == label for label in labels]
+    ranks, tie_sum = rank_columns(values)
+
+    table = {}
+    with warnings.catch_warnings():
+        # metrics without values in a group have no median
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        for label, mask in zip(labels, group_masks):
+            table[f"{label} n"] = (~np.isnan(values[mask])).sum(axis=0)
+            table[f"{label} median"] = np.nanmedian(values[mask], axis=0)
+
+    if len(labels) > 2:
+        h, epsilon_squared, p = kruskal_wallis(ranks, tie_sum, group_masks)
+        table["kruskal-wallis H"] = h
+        table["kruskal-wallis epsilon squared"] = epsilon_squared
+        table["kruskal-wallis p"] = p
+        table["kruskal-wallis q (BH)"] = benjamini_hochberg(p)
+
+    for (first, first_mask), (second, second_mask) in itertools.combinations(
+        zip(labels, group_masks), 2
+    ):
+        pair = first_mask | second_mask
+        pair_ranks, pair_tie_sum = rank_columns(np.where(pair[:, None], values, np.nan))
+        u, delta, p = mann_whitney(pair_ranks, pair_tie_sum, first_mask, second_mask)
+        table[f"{first} vs {second} U"] = u
+        table[f"{first} vs {second} cliff's delta"] = delta
+        table[f"{first} vs {second} p"] = p
+        table[f"{first} vs {second} q (BH)"] = benjamini_hochberg(p)
+
+    return pd.DataFrame(table, index=pd.Index(metrics, name="metric"))
+
+
+def run_comparison(groups, settings, file_time_fix, logger, output_file_path):
+    """
+    runs every group's subjects and writes the comparison table and the
+    subjects' summaries to 'Group Comparison.xlsx'
+    """
+    group_summaries = collect_group_summaries(groups, settings, file_time_fix, logger)
+    comparison = compare_groups(group_summaries)
+    subjects = pd.concat(
+        {
+            label: pd.DataFrame.from_dict(summaries, orient="index")
+            for label, summaries in group_summaries.items()
+            if summaries
+        },
+        names=["group", "subject"],
+    )
+    os.makedirs(output_file_path, exist_ok=True)
+    with pd.ExcelWriter(
+        os.path.join(output_file_path, COMPARISON_FILE), engine="xlsxwriter"
+    ) as writer:
+        comparison.to_excel(writer, sheet_name="comparison")
+        subjects.to_excel(writer, sheet_name="subjects")
+    logger.info(f"{COMPARISON_FILE} saved")
+    return comparison
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="compare output_summary metrics between groups of recordings"
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        nargs="+",
+        required=True,
+        help='group folders, as "label=folder" or a folder labelled by its name',
+    )
+    parser.add_argument("-o", "--output", default="./sample output/")
+    parser.add_argument("-s", "--settings", default="./sample settings.xlsx")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(threadName)s | %(levelname)-5.5s |  %(message)s",
+    )
+    logger = logging.getLogger()
+    settings, file_time_fix = main.read_settings(args.settings)
+    groups = dict(parse_group(argument) for argument in args.input)
+    if len(groups) < 2:
+        parser.error("at least two groups are needed")
+    run_comparison(groups, settings, file_time_fix, logger, args.output)
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+differential test harness for alternate engines
+
+runs the reference pipeline (differential_reference.py, a frozen copy of
+the original pipeline) and one or more engines - main.process_subject with
+the pandas backend on one thread among them - on the same recordings -
+the sample data and/or randomized synthetic recordings with the edge cases
+that are easy to get wrong (nights that start mid-desat, bouts left open at
+the end of the recording, all-artifact stretches, gaps inside bouts) - and
+compares the duration bin, every output_summary key and every field of every
+bout within a tolerance. for each subject the earliest divergence is
+reported with its timestamp and field
+
+    python differential.py pandas polars "subject threads" --synthetic 20
+
+an engine is a name from ENGINES or "module:function" naming a function with
+the signature of main.process_subject
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import os
+import math
+import numbers
+import logging
+import argparse
+import tempfile
+import warnings
+import importlib
+import traceback
+
+import numpy as np
+import pandas as pd
+
+import main
+import cohort_engine
+import polars_backend
+import differential_reference
+
+# %% define constants
+SAMPLE_DATA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sample data", "pooled"
+)
+SAMPLE_SETTINGS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sample settings.xlsx"
+)
+DEFAULT_RTOL = 1e-9
+DEFAULT_ATOL = 1e-9
+
+SAMPLE_SEC = 4
+SYNTHETIC_CASES = [
+    "mid desat start",
+    "open bout at end",
+    "artifact stretch",
+    "gap in bout",
+    "mixed",
+]
+
+
+# %% define functions
+def per_subject(process, overrides=None):
+    """
+    engine running process (main.process_subject's signature) for every
+    subject with the settings overrides applied
+    """
+
+    def run(file_dict, settings, file_time_fix, logger):
+        engine_settings = {**settings, **(overrides or {})}
+        bins = main.build_night_duration_bins(engine_settings, logger)
+        results = {}
+        for subject_id, subject_file_list in file_dict.items():
+            try:
+                results[subject_id] = process(
+                    subject_id,
+                    subject_file_list,
+                    engine_settings,
+                    file_time_fix,
+                    bins,
+                    logger,
+                )
+            except Exception as e:
+                logger.debug(traceback.format_exc())
+                results[subject_id] = e
+        return results
+
+    return run
+
+
+def run_cohort_engine(file_dict, settings, file_time_fix, logger):
+    """
+    cohort_engine.score_cohort as an engine - it gives the duration bin and
+    the ENGINE_SUMMARY_KEYS only, so no bouts are compared
+    """
+    cohort_df = cohort_engine.score_cohort(file_dict, settings, file_time_fix, logger)
+    results = {}
+    for subject_id in file_dict:
+        if subject_id not in cohort_df.index:
+            results[subject_id] = RuntimeError("not scored by the cohort engine")
+            continue
+        row = cohort_df.loc[subject_id]
+        results[subject_id] = {
+            "duration_bin": row["duration bin"],
+            "output_summary": row[cohort_engine.ENGINE_SUMMARY_KEYS].to_dict(),
+            "bouts": None,
+        }
+    return results
+
+
+ENGINES = {
+    "reference": per_subject(differential_reference.process_subject),
+    "pandas": per_subject(
+        main.process_subject, {"backend": "pandas", "subject threads": 1}
+    ),
+    "polars": per_subject(main.process_subject, {"backend": "polars"}),
+    # small segments, so every night is split and stitched back several times
+    "subject threads": per_subject(
+        main.process_subject, {"subject threads": 4, "segment rows": 500}
+    ),
+    "cohort engine": run_cohort_engine,
+}
+
+
+def load_engine(name):
+    """
+    engine of a name in ENGINES or of a "module:function" per-subject
+    function
+    """
+    if name in ENGINES:
+        return ENGINES[name]
+    module_name, _, function_name = name.partition(":")
+    if not function_name:
+        raise ValueError(f"unknown engine {name} - use one of {', '.join(ENGINES)}")
+    return per_subject(getattr(importlib.import_module(module_name), function_name))
+
+
+def is_missing(value):
+    return value is None or (np.ndim(value) == 0 and bool(pd.isna(value)))
+
+
+def same_value(reference, alternate, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL):
+    """
+    whether two result values agree - numbers within the tolerance, missing
+    values with missing values and anything else exactly
+    """
+    if is_missing(reference) or is_missing(alternate):
+        return is_missing(reference) and is_missing(alternate)
+    numeric = (numbers.Number, np.bool_)
+    if isinstance(reference, numeric) and isinstance(alternate, numeric):
+        return math.isclose(
+            float(reference), float(alternate), rel_tol=rtol, abs_tol=atol
+        )
+    return bool(reference == alternate)
+
+
+def divergence(subject_id, where, timestamp, field, reference, alternate):
+    return {
+        "subject": subject_id,
+        "where": where,
+        "timestamp": timestamp,
+        "field": field,
+        "reference": reference,
+        "alternate": alternate,
+    }
+
+
+def bout_divergence(subject_id, bout_type, reference, alternate, rtol, atol):
+    """
+    earliest divergence between two bout lists of one bout type, or None
+    """
+    for i in range(max(len(reference), len(alternate))):
+        if i >= len(reference) or i >= len(alternate):
+            extra = (reference if i < len(reference) else alternate)[i]
+            return divergence(
+                subject_id,
+                bout_type,
+                extra["start"],
+                "bout count",
+                len(reference),
+                len(alternate),
+            )
+        for field, value in reference[i].items():
+            other = alternate[i].get(field)
+            if not same_value(value, other, rtol, atol):
+                return divergence(
+                    subject_id, bout_type, reference[i]["start"], field, value, other
+                )
+    return None
+
+
+def first_divergence(
+    subject_id, reference, alternate, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL
+):
+    """
+    earliest divergence of an alternate engine's subject result from the
+    reference result, or None when they agree
+
+    bout divergences are ordered by timestamp and come before summary keys,
+    which usually only follow from them. engines without bouts (None) or
+    with only some summary keys are compared on what they return
+    """
+    if isinstance(reference, Exception) or isinstance(alternate, Exception):
+        if isinstance(reference, Exception) and isinstance(alternate, Exception):
+            return None
+        return divergence(
+            subject_id,
+            "subject",
+            None,
+            "error",
+            repr(reference) if isinstance(reference, Exception) else "ok",
+            repr(alternate) if isinstance(alternate, Exception) else "ok",
+        )
+    if alternate.get("bouts") is not None:
+        found = [
+            bout_divergence(
+                subject_id,
+                bout_type,
+                bouts,
+                alternate["bouts"].get(bout_type, []),
+                rtol,
+                atol,
+            )
+            for bout_type, bouts in reference["bouts"].items()
+        ]
+        found = [d for d in found if d is not None]
+        if found:
+            return min(found, key=lambda d: d["timestamp"])
+    if not same_value(reference["duration_bin"], alternate["duration_bin"]):
+        return divergence(
+            subject_id,
+            "summary",
+            None,
+            "duration bin",
+            reference["duration_bin"],
+            alternate["duration_bin"],
+        )
+    for key, value in reference["output_summary"].items():
+        if key not in alternate["output_summary"]:
+            continue
+        other = alternate["output_summary"][key]
+        if not same_value(value, other, rtol, atol):
+            return divergence(subject_id, "summary", None, key, value, other)
+    return None
+
+
+def synthetic_recording(rng, case, start="2024-03-01 20:00:00", hours=12.0):
+    """
+    dataframe of a synthetic recording (the recording csv columns) with
+    random desats and the edge case named by case (see SYNTHETIC_CASES)
+    """
+    ts = pd.date_range(start, periods=int(hours * 3600 / SAMPLE_SEC), freq="4s")
+    n = ts.size
+    spo2 = np.clip(96 + rng.normal(0, 0.8, n), 0, 100)
+    pulse = 75 + rng.normal(0, 4, n)
+    keep = np.ones(n, dtype=bool)
+
+    def desat(first, samples, depth):
+        stop = min(first + samples, n)
+        spo2[first:stop] = np.minimum(spo2[first:stop], 96 - depth)
+
+    for _ in range(rng.integers(20, 80)):
+        desat(rng.integers(0, n), rng.integers(2, 40), rng.uniform(3, 16))
+    cases = SYNTHETIC_CASES[:-1] if case == "mixed" else [case]
+    if "mid desat start" in cases:
+        # recording begins inside the night window, already desaturated
+        night_start = int(
+            np.searchsorted(ts, ts[0].normalize() + pd.Timedelta(hours=21))
+        )
+        keep[:night_start] = False
+        desat(night_start, rng.integers(8, 40), rng.uniform(7, 15))
+    if "open bout at end" in cases:
+        # recording stops inside the night window while desaturated
+        stop = int(np.searchsorted(ts, ts[0].normalize() + pd.Timedelta(hours=30.5)))
+        keep[stop:] = False
+        desat(stop - rng.integers(10, 60), n, rng.uniform(7, 15))
+    if "artifact stretch" in cases:
+        first = rng.integers(n // 4, n // 2)
+        stop = first + rng.integers(150, 700)
+        spo2[first:stop] = 500
+        pulse[first:stop] = 500
+        # a desat running into the stretch
+        desat(first - 10, 10, rng.uniform(7, 15))
+    if "gap in bout" in cases:
+        for first in rng.integers(n // 8, n - 100, 5):
+            desat(first, 60, rng.uniform(7, 15))
+            keep[first + rng.integers(5, 20) : first + rng.integers(25, 50)] = False
+    # isolated artifact samples
+    spo2[rng.random(n) < 0.005] = 500
+    ts, spo2, pulse = ts[keep], spo2[keep], pulse[keep]
+    return pd.DataFrame(
+        {
+            "year": ts.year,
+            "month": ts.month,
+            "day": ts.day,
+            "hour": ts.hour,
+            "minute": ts.minute,
+            "second": ts.second,
+            "pulse": np.round(pulse).astype(int),
+            "spo2": np.round(spo2).astype(int),
+        }
+    )
+
+
+def write_synthetic(folder, count, seed=0):
+    """
+    writes count synthetic recordings, cycling through SYNTHETIC_CASES, and
+    returns their subject id -> file list dict
+    """
+    rng = np.random.default_rng(seed)
+    file_dict = {}
+    for i in range(count):
+        case = SYNTHETIC_CASES[i % len(SYNTHETIC_CASES)]
+        subject_id = f"SYN{i:03d}"
+        path = os.path.join(folder, f"{subject_id}.csv")
+        synthetic_recording(rng, case).to_csv(path, index=False)
+        file_dict[subject_id] = [path]
+    return file_dict
+
+
+def compare_engines(
+    file_dict,
+    settings,
+    file_time_fix,
+    engines,
+    logger,
+    rtol=DEFAULT_RTOL,
+    atol=DEFAULT_ATOL,
+):
+    """
+    {engine name: list of first divergences per diverging subject} of the
+    named engines against the reference
+    """
+    reference = ENGINES["reference"](file_dict, settings, file_time_fix, logger)
+    report = {}
+    for name in engines:
+        alternate = load_engine(name)(file_dict, settings, file_time_fix, logger)
+        report[name] = [
+            d
+            for d in (
+                first_divergence(
+                    subject_id,
+                    reference[subject_id],
+                    alternate.get(subject_id, RuntimeError("missing")),
+                    rtol,
+                    atol,
+                )
+                for subject_id in file_dict
+            )
+            if d is not None
+        ]
+    return report
+
+
+def print_report(report, subject_count):
+    for name, divergences in report.items():
+        print(
+            f"{name}: {subject_count - len(divergences)}/{subject_count} subjects agree"
+        )
+        for d in divergences:
+            at = f" at {d['timestamp']}" if d["timestamp"] is not None else ""
+            print(
+                f"  {d['subject']} {d['where']}{at}: {d['field']} - "
+                + f"reference {d['reference']}, {name} {d['alternate']}"
+            )
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="compare alternate engines with the reference pipeline"
+    )
+    parser.add_argument(
+        "engines",
+        nargs="*",
+        help=f"any of: {', '.join(e for e in ENGINES if e != 'reference')} or "
+        + "module:function (default: all)",
+    )
+    parser.add_argument("-i", "--input", default=SAMPLE_DATA, help="recording folder")
+    parser.add_argument("-s", "--settings", default=SAMPLE_SETTINGS)
+    parser.add_argument(
+        "--synthetic", type=int, default=0, help="number of synthetic recordings"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-data", action="store_true", help="skip the input folder")
+    parser.add_argument("--rtol", type=float, default=DEFAULT_RTOL)
+    parser.add_argument("--atol", type=float, default=DEFAULT_ATOL)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.ERROR,
+        format="%(asctime)s | %(threadName)s | %(levelname)-5.5s |  %(message)s",
+    )
+    logger = logging.getLogger()
+    if not args.verbose:
+        # empty bout selections warn in the pipelines, engines alike
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+    settings, file_time_fix = main.read_settings(args.settings)
+    engines = args.engines or [
+        e
+        for e in ENGINES
+        if e != "reference" and (e != "polars" or polars_backend.pl is not None)
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        file_dict = {}
+        if not args.no_data:
+            file_dict.update(main.collect_subject_files(args.input, logger))
+        if args.synthetic:
+            file_dict.update(write_synthetic(folder, args.synthetic, args.seed))
+        report = compare_engines(
+            file_dict, settings, file_time_fix, engines, logger, args.rtol, args.atol
+        )
+    print_report(report, len(file_dict))
+    raise SystemExit(1 if any(report.values()) else 0)
@@ -0,0 +1,1168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+frozen reference pipeline for the differential test harness
+
+a copy of the original per-subject pipeline (the body of the first
+main.main() loop with its annotate, rolling duration filter, bout_assembler
+and prepare_output_dict steps), kept unchanged so differential.py can hold
+every engine - main.process_subject included - against the results before
+any optimization. do not edit the scoring here; a deliberate change of the
+results belongs in main.py and shows up as a divergence from this copy
+
+the only change is the input: file end times come as the file time fix dict
+of settings_profile (file time fix entries or _time_off_ names) instead of
+the "file time fix" sheet
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import pandas as pd
+import numpy as np
+
+import settings_profile
+
+
+# %% define functions
+def build_timestamp(row):
+    """
+    builds a datetime timestamp from components
+    year, month, day, hour, minute, second available
+    as seperate columns in a row
+
+    intended for pd .apply method
+    """
+    ts = pd.Timestamp(
+        year=row["year"],
+        month=row["month"],
+        day=row["day"],
+        hour=row["hour"],
+        minute=row["minute"],
+        second=row["second"],
+    )
+    return ts
+
+
+def modified_min(array_data):
+    try:
+        return np.nanmin(array_data)
+    except:
+        return np.nan
+
+
+def night_time_check(ts, night_start=None, night_stop=None):
+    """
+    check if a timestamp 'ts' is between
+    night_start and night_stop timestamps
+    """
+    if not night_start:
+        night_start = pd.Timestamp(hour=21, minute=0).time()
+
+    if not night_stop:
+        night_stop = pd.Timestamp(hour=7, minute=0).time()
+
+    ts_time = ts.time()
+
+    if night_start < night_stop:
+        return night_start <= ts_time <= night_stop
+    else:
+        return ts_time >= night_start or ts_time <= night_stop
+
+
+def identify_bin(value, bin_list):
+    bin_list.sort(reverse=True)
+    for i in bin_list:
+        if value >= i:
+            return i
+
+
+def bout_assembler(start_bouts, stop_bouts, df):
+    bouts = []
+    if start_bouts.shape[0] == 0 or stop_bouts.shape[0] == 0:
+        return bouts
+    elif start_bouts.iat[0] > stop_bouts.iat[0]:
+        # animal started night_df desatted...drop first bout for revised count, mean, and median calcs
+        for i in range(min(start_bouts.shape[0], stop_bouts.shape[0] - 1)):
+            bouts.append(
+                {
+                    "start": start_bouts.iat[i],
+                    "stop": stop_bouts.iat[i + 1],
+                    "duration": (stop_bouts.iat[i + 1] - start_bouts.iat[i]).seconds,
+                    #
+                    "artifact_pulse_duration": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                        & (df["pulse_NA_filter"] == True)
+                    ]["interval"].sum(),
+                    "artifact_spo2_duration": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                        & (df["spo2_NA_filter"] == True)
+                    ]["interval"].sum(),
+                    "artifact_spo2_and_pulse_duration": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                        & (df["spo2_and_pulse_NA_filter"] == True)
+                    ]["interval"].sum(),
+                    "artifact_spo2_or_pulse_duration": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                        & (df["spo2_or_pulse_NA_filter"] == True)
+                    ]["interval"].sum(),
+                    "duration_min_dur_sev_desat": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                        & (df["min_dur_sev_desat"] == True)
+                    ]["interval"].sum(),
+                    "ratio_sev_desat": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                        & (df["min_dur_sev_desat"] == True)
+                    ]["interval"].sum()
+                    / (stop_bouts.iat[i + 1] - start_bouts.iat[i]).seconds,
+                    "low_spo2": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                    ]["spo2"].min(),
+                    "mean_spo2": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                    ]["spo2"].mean(),
+                    "median_spo2": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                    ]["spo2"].median(),
+                    "low_pulse": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                    ]["pulse"].min(),
+                    "high_pulse": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                    ]["pulse"].max(),
+                    "mean_pulse": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                    ]["pulse"].mean(),
+                    "median_pulse": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i + 1])
+                    ]["pulse"].median(),
+                }
+            )
+
+    else:
+        for i in range(min(start_bouts.shape[0], stop_bouts.shape[0])):
+            bouts.append(
+                {
+                    "start": start_bouts.iat[i],
+                    "stop": stop_bouts.iat[i],
+                    "duration": (stop_bouts.iat[i] - start_bouts.iat[i]).seconds,
+                    #
+                    "artifact_pulse_duration": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                        & (df["pulse_NA_filter"] == True)
+                    ]["interval"].sum(),
+                    "artifact_spo2_duration": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                        & (df["spo2_NA_filter"] == True)
+                    ]["interval"].sum(),
+                    "artifact_spo2_and_pulse_duration": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                        & (df["spo2_and_pulse_NA_filter"] == True)
+                    ]["interval"].sum(),
+                    "artifact_spo2_or_pulse_duration": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                        & (df["spo2_or_pulse_NA_filter"] == True)
+                    ]["interval"].sum(),
+                    "duration_min_dur_sev_desat": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                        & (df["min_dur_sev_desat"] == True)
+                    ]["interval"].sum(),
+                    "ratio_sev_desat": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                        & (df["min_dur_sev_desat"] == True)
+                    ]["interval"].sum()
+                    / (stop_bouts.iat[i] - start_bouts.iat[i]).seconds,
+                    "low_spo2": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                    ]["spo2"].min(),
+                    "mean_spo2": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                    ]["spo2"].mean(),
+                    "median_spo2": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                    ]["spo2"].median(),
+                    "low_pulse": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                    ]["pulse"].min(),
+                    "high_pulse": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                    ]["pulse"].max(),
+                    "mean_pulse": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                    ]["pulse"].mean(),
+                    "median_pulse": df[
+                        (df["ts"] >= start_bouts.iat[i])
+                        & (df["ts"] <= stop_bouts.iat[i])
+                    ]["pulse"].median(),
+                }
+            )
+    return bouts
+
+
+def flag_subdesat_starts(bouts, night_df):
+    for i in range(len(bouts)):
+        try:
+            bouts[i]["started subdesat"] = int(
+                night_df[night_df["ts"] < bouts[i]["start"]][
+                    "sustained_dur_sub_desat"
+                ].iloc[-1]
+            )
+        except Exception as e:
+            print(e)
+            bouts[i]["started subdesat"] = "unk"
+        # print(bouts)
+    return bouts
+
+
+def prepare_output_dict(
+    night_recording_start,
+    night_recording_stop,
+    subject_df_list,
+    night_df,
+    desat_bouts,
+    subdesat_bouts,
+    sevdesat_bouts,
+    sustained_desat_bouts,
+    sustained_subdesat_bouts,
+    sustained_sevdesat_bouts,
+    settings,
+):
+    output_dict = {
+        "night start": night_recording_start,
+        "night stop": night_recording_stop,
+        "recording files": len(subject_df_list),
+        "duration recording (excluding_gaps)": night_df[night_df["gaps"] == False][
+            "interval"
+        ].sum(),
+        "duration recording (including gaps)": night_df["interval"].sum(),
+        "duration of recording gaps": night_df[night_df["gaps"] == True][
+            "interval"
+        ].sum(),
+        "duration spo2 artifact": night_df[
+            (night_df["spo2_NA_filter"] == True) & (night_df["gaps"] == False)
+        ]["interval"].sum(),
+        "duration pulse artifact": night_df[
+            (night_df["pulse_NA_filter"] == True) & (night_df["gaps"] == False)
+        ]["interval"].sum(),
+        "duration both artifact": night_df[
+            (night_df["spo2_and_pulse_NA_filter"] == True) & (night_df["gaps"] == False)
+        ]["interval"].sum(),
+        "duration either artifact": night_df[
+            (night_df["spo2_or_pulse_NA_filter"] == True) & (night_df["gaps"] == False)
+        ]["interval"].sum(),
+        "maximum recording gap": night_df["interval"].max(),
+        "cummulative any duration desat": night_df[night_df["desat"] == True][
+            "interval"
+        ].sum(),
+        "cumulative any duration subdesat": night_df[night_df["sub desat"] == True][
+            "interval"
+        ].sum(),
+        "cummulative any duration sev desat": night_df[night_df["sev desat"] == True][
+            "interval"
+        ].sum(),
+        "count spike desat": night_df[night_df["spike desat"] == True]["ts"].count(),
+        "count desat bouts": len(desat_bouts),
+        "count desat started as subdesat bouts": len(
+            [i["started subdesat"] for i in desat_bouts if i["started subdesat"] == 1]
+        ),
+        "sum desat duration": np.sum([i["duration"] for i in desat_bouts]),
+        "mean desat duration": np.mean([i["duration"] for i in desat_bouts]),
+        "median desat duration": np.median([i["duration"] for i in desat_bouts]),
+        "count subdesat bouts": len(subdesat_bouts),
+        "sum subdesat duration": np.sum([i["duration"] for i in subdesat_bouts]),
+        "mean subdesat duration": np.mean([i["duration"] for i in subdesat_bouts]),
+        "median subdesat duration": np.mean([i["duration"] for i in subdesat_bouts]),
+        "count sustained desat bouts": len(sustained_desat_bouts),
+        "count sustained desat started as subdesat bouts": len(
+            [
+                i["started subdesat"]
+                for i in sustained_desat_bouts
+                if i["started subdesat"] == 1
+            ]
+        ),
+        "sum sustained desat duration": np.sum(
+            [i["duration"] for i in sustained_desat_bouts]
+        ),
+        "mean sustained desat duration": np.mean(
+            [i["duration"] for i in sustained_desat_bouts]
+        ),
+        "median sustained desat duration": np.median(
+            [i["duration"] for i in sustained_desat_bouts]
+        ),
+        "count minimum duration desat started as subdesat zero artifact bouts": np.sum(
+            [
+                1
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "sum minimum duration desat started as subdesat zero artifact bout duration": np.sum(
+            [
+                i["duration"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "mean minimum duration desat started as subdesat zero artifact bout duration": np.mean(
+            [
+                i["duration"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "median minimum duration desat started as subdesat zero artifact bout duration": np.median(
+            [
+                i["duration"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "mean low_spo2 during minimum duration desat started as subdesat zero artifact bouts": np.mean(
+            [
+                i["low_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "median low_spo2 during minimum duration desat started as subdesat zero artifact bouts": np.median(
+            [
+                i["low_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "minimum low_spo2 during minimum duration desat started as subdesat zero artifact bouts": modified_min(
+            [
+                i["low_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "mean mean_spo2 during minimum duration desat started as subdesat zero artifact bouts": np.mean(
+            [
+                i["mean_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "median mean_spo2 during minimum duration desat started as subdesat zero artifact bouts": np.median(
+            [
+                i["mean_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "minimum mean_spo2 during minimum duration desat started as subdesat zero artifact bouts": modified_min(
+            [
+                i["mean_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "count sustained desat started as subdesat zero artifact bouts": np.sum(
+            [
+                1
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "sum sustained desat started as subdesat zero artifact bout duration": np.sum(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "mean sustained desat started as subdesat zero artifact bout duration": np.mean(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "median sustained desat started as subdesat zero artifact bout duration": np.median(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "mean low_spo2 during sustained desat started as subdesat zero artifact bouts": np.mean(
+            [
+                i["low_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "median low_spo2 during sustained desat started as subdesat zero artifact bouts": np.median(
+            [
+                i["low_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "minimum low_spo2 during sustained desat started as subdesat zero artifact bouts": modified_min(
+            [
+                i["low_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "mean mean_spo2 during sustained desat started as subdesat zero artifact bouts": np.mean(
+            [
+                i["mean_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "median mean_spo2 during sustained desat started as subdesat zero artifact bouts": np.median(
+            [
+                i["mean_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "minimum mean_spo2 during sustained desat started as subdesat zero artifact bouts": modified_min(
+            [
+                i["mean_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+                and i["started subdesat"] == 1
+            ]
+        ),
+        "count minimum duration desat zero artifact bouts": np.sum(
+            [
+                1
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+            ]
+        ),
+        "sum minimum duration desat zero artifact bout duration": np.sum(
+            [
+                i["duration"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+            ]
+        ),
+        "mean minimum duration desat zero artifact bout duration": np.mean(
+            [
+                i["duration"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+            ]
+        ),
+        "median minimum duration desat zero artifact bout duration": np.median(
+            [
+                i["duration"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+            ]
+        ),
+        "mean low_spo2 during minimum duration desat zero artifact bouts": np.mean(
+            [
+                i["low_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+            ]
+        ),
+        "median low_spo2 during minimum duration desat zero artifact bouts": np.median(
+            [
+                i["low_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+            ]
+        ),
+        "minimum low_spo2 during minimum duration desat zero artifact bouts": modified_min(
+            [
+                i["low_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+            ]
+        ),
+        "mean mean_spo2 during minimum duration desat zero artifact bouts": np.mean(
+            [
+                i["mean_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+            ]
+        ),
+        "median mean_spo2 during minimum duration desat zero artifact bouts": np.median(
+            [
+                i["mean_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+            ]
+        ),
+        "minimum mean_spo2 during minimum duration desat zero artifact bouts": modified_min(
+            [
+                i["mean_spo2"]
+                for i in desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+                and i["duration"] >= settings["minimum desat interval (sec)"]
+            ]
+        ),
+        "count sustained desat non-artifact filtered bouts": np.sum(
+            [
+                1
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "count sustained desat zero artifact bouts": np.sum(
+            [
+                1
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "count sustained desat with sev desat non-artifact filtered bouts": np.sum(
+            [
+                1
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "count sustained desat with sev desat zero artifact bouts": np.sum(
+            [
+                1
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "sum sustained desat non-artifact filtered bout duration": np.sum(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "sum sustained desat zero artifact bout duration": np.sum(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "sum sustained desat with sev desat non-artifact filtered bout duration": np.sum(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "sum sustained desat with sev desat zero artifact bout duration": np.sum(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "mean sustained desat with sev desat non-artifact filtered bout duration": np.mean(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "mean sustained desat with sev desat zero artifact bout duration": np.mean(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "median sustained desat with sev desat non-artifact filtered bout duration": np.median(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "median sustained desat with sev desat zero artifact bout duration": np.median(
+            [
+                i["duration"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "mean sustained desat time ratio of sev desat non-artifact filtered bouts": np.mean(
+            [
+                i["ratio_sev_desat"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "mean sustained desat time ratio of sev desat zero artifact filtered bouts": np.mean(
+            [
+                i["ratio_sev_desat"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "median sustained desat time ratio of sev desat non-artifact filtered bouts": np.median(
+            [
+                i["ratio_sev_desat"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "median sustained desat time ratio of sev desat zero artifact bouts": np.median(
+            [
+                i["ratio_sev_desat"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"] > 0
+                and i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "count sustained desat with sustained sev desat zero artifact bouts": np.sum(
+            [
+                1
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"]
+                >= settings["sustained desat interval (sec)"]
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "mean low_spo2 with sustained sev desat zero artifact bouts": np.mean(
+            [
+                i["low_spo2"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"]
+                >= settings["sustained desat interval (sec)"]
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "median low_spo2 with sustained sev desat zero artifact bouts": np.median(
+            [
+                i["low_spo2"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"]
+                >= settings["sustained desat interval (sec)"]
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "minimum low_spo2 with sustained sev desat zero artifact bouts": modified_min(
+            [
+                i["low_spo2"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"]
+                >= settings["sustained desat interval (sec)"]
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "mean mean_spo2 with sustained sev desat zero artifact bouts": np.mean(
+            [
+                i["mean_spo2"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"]
+                >= settings["sustained desat interval (sec)"]
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "median mean_spo2 with sustained sev desat zero artifact bouts": np.median(
+            [
+                i["mean_spo2"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"]
+                >= settings["sustained desat interval (sec)"]
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "minimum mean_spo2 with sustained sev desat zero artifact bouts": modified_min(
+            [
+                i["mean_spo2"]
+                for i in sustained_desat_bouts
+                if i["duration_min_dur_sev_desat"]
+                >= settings["sustained desat interval (sec)"]
+                and i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "mean low_spo2 during sustained desat non-artifact filtered bouts": np.mean(
+            [
+                i["low_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "mean low_spo2 during sustained desat zero artifact bouts": np.mean(
+            [
+                i["low_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "minimum low_spo2 during sustained desat non-artifact filtered bouts": modified_min(
+            [
+                i["low_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "minimum low_spo2 during sustained desat zero artifact bouts": modified_min(
+            [
+                i["low_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "mean mean_spo2 during sustained desat non-artifact filtered bouts": np.mean(
+            [
+                i["mean_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "mean mean_spo2 during sustained desat zero artifact bouts": np.mean(
+            [
+                i["mean_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "median median_spo2 during sustained desat non-artifact filtered bouts": np.median(
+            [
+                i["median_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "median median_spo2 during sustained desat zero artifact bouts": np.median(
+            [
+                i["median_spo2"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "mean low_pulse during sustained desat non-artifact filtered bouts": np.mean(
+            [
+                i["low_pulse"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "mean low_pulse during sustained desat zero artifact bouts": np.mean(
+            [
+                i["low_pulse"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "mean high_pulse during sustained desat non-artifact filtered bouts": np.mean(
+            [
+                i["high_pulse"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "mean high_pulse during sustained desat zero artifact bouts": np.mean(
+            [
+                i["high_pulse"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "mean mean_pulse during sustained desat non-artifact filtered bouts": np.mean(
+            [
+                i["mean_pulse"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "mean mean_pulse during sustained desat zero artifact bouts": np.mean(
+            [
+                i["mean_pulse"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "median median_pulse during sustained desat non-artifact filtered bouts": np.median(
+            [
+                i["median_pulse"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"]
+                < settings["artifact duration threshold (sec)"]
+            ]
+        ),
+        "median median_pulse during sustained desat zero artifact bouts": np.median(
+            [
+                i["median_pulse"]
+                for i in sustained_desat_bouts
+                if i["artifact_spo2_or_pulse_duration"] == 0
+            ]
+        ),
+        "mean spo2 during non_desat and non_artifact": night_df[
+            (night_df["spo2"] > settings["desat threshold"])
+            & (night_df["spo2_or_pulse_NA_filter"] == False)
+        ]["spo2"].mean(),
+        "median spo2 during non_desat and non_artifact": night_df[
+            (night_df["spo2"] > settings["desat threshold"])
+            & (night_df["spo2_or_pulse_NA_filter"] == False)
+        ]["spo2"].median(),
+        "minimum spo2 during non_desat and non_artifact": night_df[
+            (night_df["spo2"] > settings["desat threshold"])
+            & (night_df["spo2_or_pulse_NA_filter"] == False)
+        ]["spo2"].min(),
+        "mean pulse during non_desat and non_artifact": night_df[
+            (night_df["spo2"] > settings["desat threshold"])
+            & (night_df["spo2_or_pulse_NA_filter"] == False)
+        ]["pulse"].mean(),
+        "mean spo2 overall": night_df["spo2"].mean(),
+        "median spo2 overall": night_df["spo2"].median(),
+        "minimum spo2 overall": night_df["spo2"].min(),
+    }
+    return output_dict
+
+
+def process_subject(
+    subject_id,
+    subject_file_list,
+    settings,
+    file_time_fix,
+    night_duration_bins,
+    logger,
+):
+    """
+    the original pipeline for a single subject, with the result layout of
+    main.process_subject (without the ODI events and the night dataframe)
+    """
+    logger.info(f"working on: {subject_id} - ','.join(subject_file_list)")
+    subject_df_list = []
+    output_summary = {}
+    for f in subject_file_list:
+        df = pd.read_csv(f)
+        # prepare timestamp column
+        df["ts"] = df.apply(build_timestamp, axis=1)
+        sample_interval = df["ts"].iloc[1] - df["ts"].iloc[0]
+
+        # fix timestamps if manual fix needed
+        end_time = settings_profile.end_time(file_time_fix, f)
+        if end_time:
+            last_row = df.iloc[-1]
+            ending_ts = pd.Timestamp(
+                year=last_row["year"],
+                month=last_row["month"],
+                day=last_row["day"],
+                hour=end_time[0],
+                minute=end_time[1],
+            )
+            df["ts"] = pd.date_range(
+                end=ending_ts, freq=sample_interval, periods=df.shape[0]
+            )
+            logger.info(
+                f"fixing timestamps in file: {f}, new start:{df['ts'].iloc[0]}, new end: {df['ts'].iloc[-1]}"
+            )
+
+        subject_df_list.append(df)
+    logger.info(
+        f"{subject_id}: {len(subject_file_list)} piece(s). sampling interval {sample_interval.seconds} sec"
+    )
+    subject_df = pd.concat(subject_df_list)
+
+    # % process file
+    # identify and placehold gaps and NA's
+    subject_df["spo2_NA_filter"] = subject_df["spo2"] == 500
+    subject_df["pulse_NA_filter"] = subject_df["pulse"] == 500
+    subject_df["spo2_and_pulse_NA_filter"] = (subject_df["spo2"] == 500) & (
+        subject_df["pulse"] == 500
+    )
+    subject_df["spo2_or_pulse_NA_filter"] = (subject_df["spo2"] == 500) | (
+        subject_df["pulse"] == 500
+    )
+    subject_df["interval"] = subject_df["ts"].diff().dt.total_seconds()
+    subject_df["gaps"] = (
+        subject_df["interval"] > settings["expected_sampling_rate (sec)"]
+    )
+
+    # create fixed o2 column
+    subject_df["fixed_spo2"] = subject_df["spo2"]
+    subject_df["fixed_pulse"] = subject_df["pulse"]
+    subject_df.replace(
+        {"fixed_pulse": {500: np.nan}, "fixed_spo2": {500: np.nan}}, inplace=True
+    )
+    subject_df.bfill(inplace=True)
+    subject_df.ffill(inplace=True)
+
+    # create instantaneous o2 diff collumn
+    subject_df["diff_spo2"] = subject_df["fixed_spo2"].diff()
+
+    # % filter to "night" hours
+    subject_df["night"] = subject_df["ts"].apply(
+        night_time_check,
+        night_start=settings["night_start_time (24hr HH:MM)"],
+        night_stop=settings["night_stop_time (24hr HH:MM)"],
+    )
+
+    night_df = subject_df[subject_df["night"]].copy()
+    night_recording_start = night_df["ts"].iloc[0]
+    night_recording_stop = night_df["ts"].iloc[-1]
+
+    # % determine which overnight bin to use
+    duration = night_df[night_df["gaps"] == False]["interval"].sum()
+    duration_hours = int(
+        (duration + settings["night duration round up within (minutes)"] * 60) / 60 / 60
+    )
+
+    duration_bin = identify_bin(duration_hours, list(night_duration_bins))
+    logger.info(
+        f"duration (sec):{duration}; duration (hrs):{duration_hours}; bin: {duration_bin}"
+    )
+
+    # % score desat events
+    night_df["desat"] = night_df["fixed_spo2"] < settings["desat threshold"]
+    night_df["sub desat"] = (
+        night_df["fixed_spo2"] <= settings["desat subthreshold"]
+    ) & (night_df["fixed_spo2"] >= settings["desat threshold"])
+    night_df["sev desat"] = night_df["fixed_spo2"] < settings["desat severe threshold"]
+    night_df["spike desat"] = night_df["diff_spo2"] <= settings["desat spike"]
+
+    # %% rescore desats that occur after recording gaps to prevent gap inclusion
+    # -- in minimum or sustained bouts
+    night_df.loc[night_df["gaps"] == True, "desat"] = False
+    night_df.loc[night_df["gaps"] == True, "sub desat"] = False
+    night_df.loc[night_df["gaps"] == True, "sev desat"] = False
+    night_df.loc[night_df["gaps"] == True, "spike desat"] = False
+
+    # % apply rolling filters (min duration and sustained duration)
+    # - apply twice, once to remove too small and second time to refill the time
+    min_duration = pd.Timedelta(seconds=settings["minimum desat interval (sec)"])
+    night_df["min_dur_desat_trimmed"] = night_df.rolling(
+        window=min_duration, on="ts", center=True
+    )["desat"].min()
+    night_df["min_dur_desat"] = night_df.rolling(
+        window=min_duration, on="ts", center=True
+    )["min_dur_desat_trimmed"].max()
+    night_df["min_dur_sub_desat_trimmed"] = night_df.rolling(
+        window=min_duration, on="ts", center=True
+    )["sub desat"].min()
+    night_df["min_dur_sub_desat"] = night_df.rolling(
+        window=min_duration, on="ts", center=True
+    )["min_dur_sub_desat_trimmed"].max()
+    night_df["min_dur_sev_desat_trimmed"] = night_df.rolling(
+        window=min_duration, on="ts", center=True
+    )["sev desat"].min()
+    night_df["min_dur_sev_desat"] = night_df.rolling(
+        window=min_duration, on="ts", center=True
+    )["min_dur_sev_desat_trimmed"].max()
+
+    night_df["min_dur_desat_bout_start"] = night_df["min_dur_desat"].astype(int).diff()
+    night_df["min_dur_sub_desat_bout_start"] = (
+        night_df["min_dur_sub_desat"].astype(int).diff()
+    )
+    night_df["min_dur_sev_desat_bout_start"] = (
+        night_df["min_dur_sev_desat"].astype(int).diff()
+    )
+
+    desat_start_bouts = night_df["ts"][night_df["min_dur_desat_bout_start"] == 1]
+    desat_stop_bouts = night_df["ts"][night_df["min_dur_desat_bout_start"] == -1]
+
+    subdesat_start_bouts = night_df["ts"][night_df["min_dur_sub_desat_bout_start"] == 1]
+    subdesat_stop_bouts = night_df["ts"][night_df["min_dur_sub_desat_bout_start"] == -1]
+
+    sevdesat_start_bouts = night_df["ts"][night_df["min_dur_sev_desat_bout_start"] == 1]
+    sevdesat_stop_bouts = night_df["ts"][night_df["min_dur_sev_desat_bout_start"] == -1]
+
+    sustained_duration = pd.Timedelta(
+        seconds=settings["sustained desat interval (sec)"]
+    )
+    night_df["sustained_dur_desat_trimmed"] = night_df.rolling(
+        window=sustained_duration, on="ts", center=True
+    )["desat"].min()
+    night_df["sustained_dur_desat"] = night_df.rolling(
+        window=sustained_duration, on="ts", center=True
+    )["sustained_dur_desat_trimmed"].max()
+    night_df["sustained_dur_sub_desat_trimmed"] = night_df.rolling(
+        window=sustained_duration, on="ts", center=True
+    )["sub desat"].min()
+    night_df["sustained_dur_sub_desat"] = night_df.rolling(
+        window=sustained_duration, on="ts", center=True
+    )["sustained_dur_sub_desat_trimmed"].max()
+    night_df["sustained_dur_sev_desat_trimmed"] = night_df.rolling(
+        window=sustained_duration, on="ts", center=True
+    )["sev desat"].min()
+    night_df["sustained_dur_sev_desat"] = night_df.rolling(
+        window=sustained_duration, on="ts", center=True
+    )["sustained_dur_sev_desat_trimmed"].max()
+
+    night_df["sustained_dur_desat_bout_start"] = (
+        night_df["sustained_dur_desat"].astype(int).diff()
+    )
+    night_df["sustained_dur_sub_desat_bout_start"] = (
+        night_df["sustained_dur_sub_desat"].astype(int).diff()
+    )
+    night_df["sustained_dur_sev_desat_bout_start"] = (
+        night_df["sustained_dur_sev_desat"].astype(int).diff()
+    )
+
+    sustained_desat_start_bouts = night_df["ts"][
+        night_df["sustained_dur_desat_bout_start"] == 1
+    ]
+    sustained_desat_stop_bouts = night_df["ts"][
+        night_df["sustained_dur_desat_bout_start"] == -1
+    ]
+
+    sustained_subdesat_start_bouts = night_df["ts"][
+        night_df["sustained_dur_sub_desat_bout_start"] == 1
+    ]
+    sustained_subdesat_stop_bouts = night_df["ts"][
+        night_df["sustained_dur_sub_desat_bout_start"] == -1
+    ]
+
+    sustained_sevdesat_start_bouts = night_df["ts"][
+        night_df["sustained_dur_sev_desat_bout_start"] == 1
+    ]
+    sustained_sevdesat_stop_bouts = night_df["ts"][
+        night_df["sustained_dur_sev_desat_bout_start"] == -1
+    ]
+
+    subdesat_bouts = bout_assembler(subdesat_start_bouts, subdesat_stop_bouts, night_df)
+    sustained_subdesat_bouts = bout_assembler(
+        sustained_subdesat_start_bouts, sustained_subdesat_stop_bouts, night_df
+    )
+    desat_bouts = flag_subdesat_starts(
+        bout_assembler(desat_start_bouts, desat_stop_bouts, night_df), night_df
+    )
+    sustained_desat_bouts = flag_subdesat_starts(
+        bout_assembler(
+            sustained_desat_start_bouts, sustained_desat_stop_bouts, night_df
+        ),
+        night_df,
+    )
+    sevdesat_bouts = bout_assembler(sevdesat_start_bouts, sevdesat_stop_bouts, night_df)
+    sustained_sevdesat_bouts = bout_assembler(
+        sustained_sevdesat_start_bouts, sustained_sevdesat_stop_bouts, night_df
+    )
+
+    # %
+    output_summary = prepare_output_dict(
+        night_recording_start,
+        night_recording_stop,
+        subject_df_list,
+        night_df,
+        desat_bouts,
+        subdesat_bouts,
+        sevdesat_bouts,
+        sustained_desat_bouts,
+        sustained_subdesat_bouts,
+        sustained_sevdesat_bouts,
+        settings,
+    )
+
+    return {
+        "duration_bin": duration_bin,
+        "output_summary": output_summary,
+        "bouts": {
+            "desat bouts": desat_bouts,
+            "sustained desat bouts": sustained_desat_bouts,
+            "subdesat bouts": subdesat_bouts,
+            "sustained subdesat bouts": sustained_subdesat_bouts,
+            "sevdesat bouts": sevdesat_bouts,
+            "sustained sevdesat bouts": sustained_sevdesat_bouts,
+        },
+    }
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+recursive discovery of recording files
+
+an input folder is scanned recursively with os.scandir. files are kept when
+their path relative to the input folder matches an include pattern and no
+exclude pattern (fnmatch globs, e.g. "*.csv", "*/calibration/*"), and are
+grouped into subjects by the recording file naming rules ([subject_id].csv,
+[subject_id]_a.csv, [subject_id]_time_off_[hhmm].csv, ...). subjects in nested folders are named after their
+folder, "site1.visit2.SB001", so equal ids in different folders stay apart
+
+with a cache folder (--cache), the per-folder result is kept in a small json
+index under it together with each folder's modification time, which changes
+whenever an entry is added, removed or renamed in it. a repeat scan only
+stats the folders and reuses the listing of every unchanged one. without a
+cache folder nothing is written
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import os
+import re
+import json
+import time
+import fnmatch
+import hashlib
+import argparse
+
+import cache
+import settings_profile
+
+# %% define constants
+DEFAULT_INCLUDE = ["*.csv"]
+DEFAULT_EXCLUDE = []
+SUBJECT_PATTERN = re.compile("(?P<id>.+?)[a-z_]*.csv")
+INDEX_VERSION = 2
+
+
+# %% define functions
+def parse_patterns(value, default):
+    """
+    list of glob patterns from a settings value - a list, or a string of
+    comma or semicolon separated patterns
+    """
+    if value is None or (isinstance(value, float) and value != value):
+        return list(default)
+    if isinstance(value, str):
+        value = re.split("[,;]", value)
+    return [pattern.strip() for pattern in value if pattern.strip()]
+
+
+def subject_id_of(file_name):
+    """
+    subject id of a recording file name, None when it does not follow the
+    naming rules
+    """
+    # the verified end time of a _time_off_[hhmm] name is not part of the id
+    time_off = settings_profile.TIME_OFF_PATTERN.fullmatch(file_name)
+    if time_off:
+        file_name = f"{time_off.group('stem')}.csv"
+    match = SUBJECT_PATTERN.match(file_name)
+    return match.group("id") if match else None
+
+
+def selected(relative_path, include, exclude):
+    """
+    whether a file's path relative to the input folder passes the patterns
+    """
+    relative_path = relative_path.replace(os.sep, "/")
+    return any(fnmatch.fnmatch(relative_path, p) for p in include) and not any(
+        fnmatch.fnmatch(relative_path, p) for p in exclude
+    )
+
+
+def index_path(root, include, exclude, cache_path):
+    """
+    location of the file index of a folder and pattern set in a cache folder
+    """
+    key = hashlib.sha256(
+        json.dumps([os.path.abspath(root), include, exclude]).encode()
+    ).hexdigest()[:32]
+    return os.path.join(cache_path, cache.DISCOVERY_INDEX, f"{key}.json")
+
+
+def load_index(path):
+    """
+    cached folder listings, {} when missing, unreadable or outdated
+    """
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != INDEX_VERSION:
+        return {}
+    return index.get("folders", {})
+
+
+def save_index(path, folders):
+    """
+    saves the folder listings, a read-only cache location is skipped
+    """
+    try:
+        cache.atomic_write(
+            path,
+            json.dumps({"version": INDEX_VERSION, "folders": folders}).encode(),
+        )
+    except OSError:
+        pass
+
+
+def scan_folder(root, relative_folder, include, exclude):
+    """
+    (subjects, subfolders) of one folder - subjects maps subject id to its
+    sorted file names
+    """
+    subjects = {}
+    subfolders = []
+    with os.scandir(os.path.join(root, relative_folder)) as scan:
+        for entry in scan:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.name)
+            elif entry.is_file() and selected(
+                os.path.join(relative_folder, entry.name), include, exclude
+            ):
+                subject_id = subject_id_of(entry.name)
+                if subject_id:
+                    subjects.setdefault(subject_id, []).append(entry.name)
+    return (
+        {subject_id: sorted(names) for subject_id, names in sorted(subjects.items())},
+        sorted(subfolders),
+    )
+
+
+def scan_tree(root, include=None, exclude=None, index=None):
+    """
+    walks root and returns (subject id -> file paths, folder index, number
+    of folders listed, number of folders reused from the index)
+    """
+    include = DEFAULT_INCLUDE if include is None else include
+    exclude = DEFAULT_EXCLUDE if exclude is None else exclude
+    index = index or {}
+    folders = {}
+    file_dict = {}
+    listed = reused = 0
+    pending = [""]
+    while pending:
+        relative_folder = pending.pop()
+        mtime = os.stat(os.path.join(root, relative_folder)).st_mtime_ns
+        cached = index.get(relative_folder)
+        if cached and cached["mtime"] == mtime:
+            subjects, subfolders = cached["subjects"], cached["subfolders"]
+            reused += 1
+        else:
+            subjects, subfolders = scan_folder(root, relative_folder, include, exclude)
+            listed += 1
+        folders[relative_folder] = {
+            "mtime": mtime,
+            "subjects": subjects,
+            "subfolders": subfolders,
+        }
+        prefix = (
+            ".".join(relative_folder.split(os.sep)) + "." if relative_folder else ""
+        )
+        for subject_id, names in subjects.items():
+            file_dict[prefix + subject_id] = [
+                os.path.join(root, relative_folder, name) for name in names
+            ]
+        # depth first, in name order
+        pending.extend(
+            os.path.join(relative_folder, name) for name in reversed(subfolders)
+        )
+    return file_dict, folders, listed, reused
+
+
+def discover(root, include=None, exclude=None, cache_path=None):
+    """
+    subject id -> recording file paths of every recording below root, using
+    and refreshing the folder index in cache_path when one is given
+
+    returns (file_dict, stats) - stats has the folder counts and seconds
+    """
+    include = parse_patterns(include, DEFAULT_INCLUDE)
+    exclude = parse_patterns(exclude, DEFAULT_EXCLUDE)
+    t0 = time.perf_counter()
+    path = index_path(root, include, exclude, cache_path) if cache_path else None
+    index = load_index(path) if path else {}
+    file_dict, folders, listed, reused = scan_tree(root, include, exclude, index)
+    if path and folders != index:
+        save_index(path, folders)
+    return file_dict, {
+        "folders listed": listed,
+        "folders reused": reused,
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="list the subjects and recording files below a folder"
+    )
+    parser.add_argument("folder")
+    parser.add_argument("--include", help='comma separated globs (default "*.csv")')
+    parser.add_argument("--exclude", help="comma separated globs")
+    parser.add_argument("--cache", help="cache folder to keep the folder index in")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list files")
+    args = parser.parse_args()
+
+    file_dict, stats = discover(args.folder, args.include, args.exclude, args.cache)
+    if args.verbose:
+        for subject_id, file_list in file_dict.items():
+            print(f"{subject_id}: {', '.join(file_list)}")
+    print(
+        f"{len(file_dict)} subject(s), {sum(len(v) for v in file_dict.values())} "
+        + f"file(s) - {stats['folders listed']} folder(s) listed, "
+        + f"{stats['folders reused']} from the index, {stats['seconds']:.3f} sec"
+    )
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+epoch summaries of the annotated night
+
+with the "night export" setting "epochs" the night workbook holds one row per
+epoch ("epoch length (sec)", default 30) instead of every sample of night_df:
+minimum and mean spo2 and mean pulse of the valid samples, the seconds of
+scored desat, severe desat, artifact and recording gap, and the ids (row
+numbers in the workbook's bout sheets) of the bouts active in the epoch.
+epochs are aligned to the clock and built in one pass - the samples are
+already in time order, so each epoch is a contiguous run reduced with
+ufunc.reduceat. every epoch from the first sample to the last has a row, and
+the interval of a sample (the time since the one before it) is split over
+the epochs it spans, so a long gap adds at most the epoch length to each of
+the epochs it covers
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import numpy as np
+import pandas as pd
+
+# %% define constants
+DEFAULT_EPOCH_SEC = 30
+
+# epoch column -> night_df flag whose sample intervals it adds up
+SECONDS_COLUMNS = {
+    "desat (sec)": "min_dur_desat",
+    "sev desat (sec)": "min_dur_sev_desat",
+    "artifact (sec)": "spo2_or_pulse_NA_filter",
+    "gap (sec)": "gaps",
+}
+
+# bout sheets of the night workbook whose active bouts are listed
+BOUT_COLUMNS = [
+    "desat bouts",
+    "sustained desat bouts",
+    "subdesat bouts",
+    "sustained subdesat bouts",
+]
+
+
+# %% define functions
+def epoch_ids(ts, epoch_sec):
+    """
+    epoch number of every timestamp, counted in whole epochs from midnight
+    of the first day
+    """
+    origin = ts[0].astype("datetime64[D]")
+    return (ts - origin) // np.timedelta64(int(epoch_sec * 1e9), "ns")
+
+
+def valid_stats(values, valid, run_starts):
+    """
+    per-run mean and minimum of values where valid, NaN for runs without any
+    """
+    counts = np.add.reduceat(valid.astype(np.int64), run_starts)
+    totals = np.add.reduceat(np.where(valid, values, 0.0), run_starts)
+    lowest = np.fmin.reduceat(np.where(valid, values, np.nan), run_starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return totals / counts, lowest
+
+
+def active_bouts(bouts, epoch_numbers, epoch_sec, origin):
+    """
+    comma separated 1-based ids of the bouts overlapping each epoch
+    """
+    active = [[] for _ in epoch_numbers]
+    epoch = np.timedelta64(int(epoch_sec * 1e9), "ns")
+    for bout_id, bout in enumerate(bouts, start=1):
+        first = (np.datetime64(bout["start"], "ns") - origin) // epoch
+        last = (np.datetime64(bout["stop"], "ns") - origin) // epoch
+        rows = np.arange(
+            np.searchsorted(epoch_numbers, first, side="left"),
+            np.searchsorted(epoch_numbers, last, side="right"),
+        )
+        for row in rows:
+            active[row].append(str(bout_id))
+    return [",".join(ids) for ids in active]
+
+
+def covered_seconds(span_start, span_stop, bounds):
+    """
+    seconds of the sorted, non-overlapping [span_start, span_stop) int64 ns
+    spans within each epoch between consecutive bounds
+    """
+    covered = np.concatenate([[0], np.cumsum(span_stop - span_start)])
+    # spans ending at or before each bound count whole, the next one in part
+    whole = np.searchsorted(span_stop, bounds, side="right")
+    partial = np.zeros(bounds.size, dtype=np.int64)
+    inside = whole < span_start.size
+    partial[inside] = np.clip(bounds[inside] - span_start[whole[inside]], 0, None)
+    return np.diff(covered[whole] + partial) / 1e9
+
+
+def epoch_table(night_df, bouts, epoch_sec=DEFAULT_EPOCH_SEC):
+    """
+    one row per epoch of the annotated night_df, see the module docstring
+    """
+    columns = (
+        ["epoch start", "samples", "min spo2", "mean spo2", "mean pulse"]
+        + list(SECONDS_COLUMNS)
+        + BOUT_COLUMNS
+    )
+    if night_df.shape[0] == 0:
+        return pd.DataFrame(columns=columns)
+    ts = night_df["ts"].to_numpy(dtype="datetime64[ns]")
+    ids = epoch_ids(ts, epoch_sec)
+    run_starts = np.flatnonzero(np.diff(ids, prepend=ids[0] - 1))
+    epoch_numbers = np.arange(ids[0], ids[-1] + 1)
+    rows = ids[run_starts] - ids[0]
+    origin = ts[0].astype("datetime64[D]").astype("datetime64[ns]")
+    epoch = np.timedelta64(int(epoch_sec * 1e9), "ns")
+
+    def per_epoch(values, fill):
+        # values of the epochs with samples, fill for the empty ones
+        full = np.full(epoch_numbers.size, fill, dtype=np.asarray(values).dtype)
+        full[rows] = values
+        return full
+
+    spo2 = night_df["spo2"].to_numpy(dtype=np.float64)
+    pulse = night_df["pulse"].to_numpy(dtype=np.float64)
+    mean_spo2, min_spo2 = valid_stats(
+        spo2, ~night_df["spo2_NA_filter"].to_numpy(dtype=bool), run_starts
+    )
+    mean_pulse, _ = valid_stats(
+        pulse, ~night_df["pulse_NA_filter"].to_numpy(dtype=bool), run_starts
+    )
+    table = {
+        "epoch start": origin + epoch_numbers * epoch,
+        "samples": per_epoch(np.diff(np.append(run_starts, ids.size)), 0),
+        "min spo2": per_epoch(min_spo2, np.nan),
+        "mean spo2": per_epoch(mean_spo2, np.nan),
+        "mean pulse": per_epoch(mean_pulse, np.nan),
+    }
+    stop = ts.astype(np.int64)
+    start = stop - np.rint(night_df["interval"].to_numpy() * 1e9).astype(np.int64)
+    bounds = (origin + np.append(epoch_numbers, ids[-1] + 1) * epoch).astype(np.int64)
+    for column, flag in SECONDS_COLUMNS.items():
+        flagged = night_df[flag].to_numpy(dtype=np.float64) == 1
+        table[column] = covered_seconds(start[flagged], stop[flagged], bounds)
+    for column in BOUT_COLUMNS:
+        table[column] = active_bouts(
+            bouts.get(column, []), epoch_numbers, epoch_sec, origin
+        )
+    return pd.DataFrame(table, columns=columns)
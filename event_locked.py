@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+event-locked peri-desaturation traces
+
+every onset is followed by the offsets of the window (multiples of the
+expected sampling rate from 'pre' before to 'post' after it), and the sample
+at each offset is found by binary search on the sorted timestamps of the
+night. a sample is only taken when it lies within half a sample of the
+offset, so fragments recorded at another phase of the sampling clock stay in
+place, and offsets that fall in a recording gap or past the ends of the
+night are NaN
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import pandas as pd
+import numpy as np
+import logging
+import os
+import argparse
+import traceback
+import warnings
+
+import main
+
+# %% define constants
+TRACE_COLUMNS = {"spo2": "fixed_spo2", "pulse": "fixed_pulse"}
+
+
+# %% define functions
+def window_rows(ts, targets, sample_sec):
+    """
+    row of the sample of the sorted int64 ns timestamps ts nearest to each
+    target (earlier one on ties), -1 where none is within half a sample
+    """
+    right = np.searchsorted(ts, targets).clip(0, ts.size - 1)
+    left = (right - 1).clip(0)
+    nearest = np.where(
+        np.abs(ts[left] - targets) <= np.abs(ts[right] - targets), left, right
+    )
+    within = np.abs(ts[nearest] - targets) <= sample_sec * 1e9 / 2
+    return np.where(within, nearest, -1)
+
+
+def event_locked_matrices(night_df, onsets, sample_sec, pre_sec, post_sec):
+    """
+    (onsets x offset) matrices of every trace from 'pre_sec' before to
+    'post_sec' after each onset timestamp
+
+    returns ({trace: matrix}, offsets in seconds)
+    """
+    pre_slots = int(pre_sec // sample_sec)
+    post_slots = int(post_sec // sample_sec)
+    offsets = np.arange(-pre_slots, post_slots + 1) * sample_sec
+    if len(onsets) == 0 or night_df.shape[0] == 0:
+        return {trace: np.empty((0, offsets.size)) for trace in TRACE_COLUMNS}, offsets
+
+    ts = night_df["ts"].to_numpy(dtype="datetime64[ns]").astype("int64")
+    onset_ns = np.asarray(onsets, dtype="datetime64[ns]").astype("int64")
+    targets = onset_ns[:, None] + np.rint(offsets * 1e9).astype("int64")[None, :]
+    rows = window_rows(ts, targets, sample_sec)
+    matrices = {}
+    for trace, column in TRACE_COLUMNS.items():
+        values = night_df[column].to_numpy(dtype=float)
+        matrices[trace] = np.where(rows >= 0, values[rows.clip(0)], np.nan)
+    return matrices, offsets
+
+
+def run_event_locked(
+    file_dict,
+    settings,
+    file_time_fix,
+    logger,
+    output_file_path,
+    bout_type="desat bouts",
+    pre_sec=60,
+    post_sec=120,
+):
+    """
+    builds the event-locked matrices for every subject, saves them to
+    'Event Locked Traces.npz' and writes the per-subject and cohort mean
+    traces to 'Event Locked Traces.xlsx'
+    """
+    night_duration_bins = main.build_night_duration_bins(settings, logger)
+    sample_sec = settings["expected_sampling_rate (sec)"]
+    subject_matrices = {}
+    offsets = None
+    for subject_id, subject_file_list in file_dict.items():
+        try:
+            subject_result = main.process_subject(
+                subject_id,
+                subject_file_list,
+                settings,
+                file_time_fix,
+                night_duration_bins,
+                logger,
+            )
+        except Exception as e:
+            logger.error(f"{subject_id} failed - {type(e).__name__}: {e}")
+            logger.debug(traceback.format_exc())
+            continue
+        subject_matrices[subject_id], offsets = event_locked_matrices(
+            subject_result["night_df"],
+            [bout["start"] for bout in subject_result["bouts"][bout_type]],
+            sample_sec,
+            pre_sec,
+            post_sec,
+        )
+        logger.info(f"event locked traces created for {subject_id}")
+
+    np.savez_compressed(
+        os.path.join(output_file_path, "Event Locked Traces.npz"),
+        offsets=offsets,
+        **{
+            f"{subject_id} {trace}": matrix
+            for subject_id, matrices in subject_matrices.items()
+            for trace, matrix in matrices.items()
+        },
+    )
+
+    writer = pd.ExcelWriter(
+        os.path.join(output_file_path, "Event Locked Traces.xlsx"),
+        engine="xlsxwriter",
+    )
+    cohort = {}
+    for trace in TRACE_COLUMNS:
+        matrices = {
+            subject_id: matrices[trace]
+            for subject_id, matrices in subject_matrices.items()
+            if matrices[trace].shape[0] > 0
+        }
+        with warnings.catch_warnings():
+            # offsets without any samples average to nan
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            subject_means = pd.DataFrame(
+                {
+                    subject_id: np.nanmean(matrix, axis=0)
+                    for subject_id, matrix in matrices.items()
+                },
+                index=pd.Index(offsets, name="offset (sec)"),
+            )
+            pooled = (
+                np.concatenate(list(matrices.values()))
+                if matrices
+                else np.empty((0, len(offsets)))
+            )
+            cohort[f"mean {trace} (subject means)"] = subject_means.mean(axis=1)
+            cohort[f"mean {trace} (all bouts)"] = np.nanmean(pooled, axis=0)
+            cohort[f"bouts with {trace}"] = (~np.isnan(pooled)).sum(axis=0)
+        subject_means.transpose().to_excel(writer, sheet_name=f"{trace} mean")
+    pd.DataFrame(cohort, index=pd.Index(offsets, name="offset (sec)")).to_excel(
+        writer, sheet_name="cohort"
+    )
+    writer.close()
+    logger.info("Event Locked Traces Output Saved")
+    return subject_matrices, offsets
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="event-locked spo2 and pulse traces around bout onsets"
+    )
+    parser.add_argument("-i", "--input", default="./sample data/pooled/")
+    parser.add_argument("-o", "--output", default="./sample output/")
+    parser.add_argument("-s", "--settings", default="./sample settings.xlsx")
+    parser.add_argument("--bout-type", default="desat bouts")
+    parser.add_argument(
+        "--pre", type=float, default=60, help="seconds before each onset"
+    )
+    parser.add_argument(
+        "--post", type=float, default=120, help="seconds after each onset"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(threadName)s | %(levelname)-5.5s |  %(message)s",
+    )
+    logger = logging.getLogger()
+    settings, file_time_fix = main.read_settings(args.settings)
+    file_dict = main.collect_subject_files(args.input, logger)
+    run_event_locked(
+        file_dict,
+        settings,
+        file_time_fix,
+        logger,
+        args.output,
+        bout_type=args.bout_type,
+        pre_sec=args.pre,
+        post_sec=args.post,
+    )
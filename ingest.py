@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+typed ingestion of pulse oximetry recording csv files
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import pandas as pd
+import numpy as np
+import os
+import csv
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow  # noqa: F401
+
+    DEFAULT_ENGINE = "pyarrow"
+except ImportError:
+    DEFAULT_ENGINE = "c"
+
+
+# %% define constants
+# every column is kept as int16 - small, but unlike int8 wide enough for every
+# valid value. the csv is parsed as float64 first, so fractional values are
+# rejected and large ones fail the range checks rather than being truncated
+# or wrapped around by either csv engine
+RECORDING_COLUMNS = {
+    "year": "int16",
+    "month": "int16",
+    "day": "int16",
+    "hour": "int16",
+    "minute": "int16",
+    "second": "int16",
+    "pulse": "int16",
+    "spo2": "int16",
+}
+
+RECORDING_RANGES = {
+    "month": (1, 12),
+    "day": (1, 31),
+    "hour": (0, 23),
+    "minute": (0, 59),
+    "second": (0, 59),
+    "pulse": (0, 500),
+    "spo2": (0, 500),
+}
+
+
+# %% define classes
+class RecordingFormatError(ValueError):
+    """
+    raised when a recording csv does not match the expected layout
+    """
+
+
+# %% define functions
+def check_header(f):
+    """
+    checks that the first line of a recording csv contains the required
+    (case sensitive) column names
+    """
+    with open(f, newline="") as csv_file:
+        header = next(csv.reader(csv_file), [])
+    header = [column.strip() for column in header]
+    missing = [column for column in RECORDING_COLUMNS if column not in header]
+    if missing:
+        hints = [
+            f"'{column}' (expected '{column.lower()}')"
+            for column in header
+            if column.lower() in missing
+        ]
+        message = f"{os.path.basename(f)}: missing column(s) {', '.join(missing)}"
+        if hints:
+            message += f" - column names are case sensitive, found {', '.join(hints)}"
+        raise RecordingFormatError(message)
+    return header
+
+
+def locate_malformed_row(f, header):
+    """
+    finds the first row of a recording csv that does not have one whole
+    number per column, returns (line number, row) or (None, None)
+    """
+    with open(f, newline="") as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader, None)
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != len(header):
+                return reader.line_num, row
+            for column, value in zip(header, row):
+                if column not in RECORDING_COLUMNS:
+                    continue
+                try:
+                    whole = float(value).is_integer()
+                except ValueError:
+                    whole = False
+                if not whole:
+                    return reader.line_num, row
+    return None, None
+
+
+def build_timestamps(df):
+    """
+    builds datetime timestamps from the year, month, day, hour, minute and
+    second columns with numpy datetime arithmetic in a single vectorized pass
+
+    raises ValueError for dates that do not exist (e.g. February 30th)
+    """
+    months = (df["year"].to_numpy(dtype="int64") - 1970) * 12 + (
+        df["month"].to_numpy(dtype="int64") - 1
+    )
+    months = months.astype("datetime64[M]")
+    days = months.astype("datetime64[D]") + (
+        df["day"].to_numpy(dtype="int64") - 1
+    ).astype("timedelta64[D]")
+    invalid = days.astype("datetime64[M]") != months
+    if invalid.any():
+        row_index = int(np.argmax(invalid))
+        raise ValueError(
+            f"day {df['day'].iat[row_index]} does not exist in "
+            + f"{df['year'].iat[row_index]}-{df['month'].iat[row_index]:02d} "
+            + f"at line {row_index + 2}"
+        )
+    seconds = (
+        df["hour"].to_numpy(dtype="int64") * 3600
+        + df["minute"].to_numpy(dtype="int64") * 60
+        + df["second"].to_numpy(dtype="int64")
+    )
+    return pd.Series(
+        days.astype("datetime64[ns]") + seconds.astype("timedelta64[s]"),
+        index=df.index,
+    )
+
+
+def read_recording(f, engine=None):
+    """
+    reads a recording csv with a fixed schema and adds the 'ts' column
+
+    uses the pyarrow csv engine when pyarrow is installed, otherwise the
+    pandas c engine. raises RecordingFormatError naming the file and the
+    offending line for missing columns, malformed rows or out of range values
+    """
+    if not engine:
+        engine = DEFAULT_ENGINE
+    header = check_header(f)
+
+    def malformed(e):
+        line_num, row = locate_malformed_row(f, header)
+        if line_num:
+            return RecordingFormatError(
+                f"{os.path.basename(f)}: malformed row at line {line_num}: {','.join(row)}"
+            )
+        return RecordingFormatError(f"{os.path.basename(f)}: {e}")
+
+    try:
+        df = pd.read_csv(
+            f,
+            usecols=list(RECORDING_COLUMNS),
+            dtype={column: "float64" for column in RECORDING_COLUMNS},
+            engine=engine,
+        )
+    except (ValueError, pd.errors.ParserError) as e:
+        raise malformed(e) from e
+    values = df.to_numpy()
+    if not (np.isfinite(values) & (values == np.round(values))).all():
+        raise malformed("empty or fractional values")
+
+    if df.shape[0] < 2:
+        raise RecordingFormatError(
+            f"{os.path.basename(f)}: at least two samples are needed, found {df.shape[0]}"
+        )
+
+    for column, (low, high) in RECORDING_RANGES.items():
+        out_of_range = (df[column] < low) | (df[column] > high)
+        if out_of_range.any():
+            row_index = int(np.argmax(out_of_range.to_numpy()))
+            raise RecordingFormatError(
+                f"{os.path.basename(f)}: {column} value {df[column].iat[row_index]:g} "
+                + f"out of range {low}-{high} at line {row_index + 2}"
+            )
+    df = df.astype(RECORDING_COLUMNS)
+
+    try:
+        df["ts"] = build_timestamps(df)
+    except ValueError as e:
+        raise RecordingFormatError(f"{os.path.basename(f)}: invalid date - {e}") from e
+    return df
+
+
+def merge_fragments(fragment_dfs, names=None, jump_sec=3600):
+    """
+    merges the recording fragments of one subject into a single timeline
+    that increases strictly in time
+
+    fragments are ordered by their first timestamp; when they do not overlap
+    this is a single concatenation. overlapping fragments are interleaved
+    with numpy's stable argsort rather than a k-way merge: for timestamps it
+    is a timsort, which finds the k sorted fragments as runs and merges them
+    in O(n log k) - O(n log n) only when clock jumps break a fragment's own
+    order - without a python loop over the samples. repeated timestamps
+    keep the sample from the earlier fragment
+
+    returns (merged df, report) - the report lists the fragment order,
+    overlapping fragment pairs, duplicate samples and clock jumps (steps
+    backwards, or forwards by more than 'jump_sec', within a fragment)
+    """
+    if names is None:
+        names = [f"fragment {i + 1}" for i in range(len(fragment_dfs))]
+    report = {
+        "order": [],
+        "overlaps": [],
+        "duplicate samples": 0,
+        "conflicting duplicates": 0,
+        "clock jumps": [],
+    }
+
+    for name, df in zip(names, fragment_dfs):
+        steps = np.diff(df["ts"].to_numpy(dtype="datetime64[ns]").astype("int64"))
+        for row_index in np.flatnonzero((steps < 0) | (steps > jump_sec * 1e9)):
+            report["clock jumps"].append(
+                (name, int(row_index) + 3, float(steps[row_index] / 1e9))
+            )
+
+    starts = np.array([df["ts"].min() for df in fragment_dfs], dtype="datetime64[ns]")
+    stops = np.array([df["ts"].max() for df in fragment_dfs], dtype="datetime64[ns]")
+    order = np.argsort(starts, kind="stable")
+    report["order"] = [names[i] for i in order]
+    latest_stop = stops[order[0]]
+    latest_name = names[order[0]]
+    for i in order[1:]:
+        if starts[i] <= latest_stop:
+            report["overlaps"].append(
+                (
+                    latest_name,
+                    names[i],
+                    float((latest_stop - starts[i]) / np.timedelta64(1, "s")),
+                )
+            )
+        if stops[i] > latest_stop:
+            latest_stop, latest_name = stops[i], names[i]
+
+    merged = pd.concat([fragment_dfs[i] for i in order])
+    ts = merged["ts"].to_numpy(dtype="datetime64[ns]")
+    if (np.diff(ts) > np.timedelta64(0)).all():
+        return merged, report
+
+    positions = np.argsort(ts, kind="stable")
+    sorted_ts = ts[positions]
+    duplicate = np.concatenate([[False], sorted_ts[1:] == sorted_ts[:-1]])
+    report["duplicate samples"] = int(duplicate.sum())
+    if duplicate.any():
+        values = merged[["pulse", "spo2"]].to_numpy()[positions]
+        # compare each repeat with the first sample at that timestamp
+        first = np.maximum.accumulate(np.where(duplicate, 0, np.arange(ts.size)))
+        report["conflicting duplicates"] = int(
+            (duplicate & (values != values[first]).any(axis=1)).sum()
+        )
+    return merged.take(positions[~duplicate]), report
+
+
+def read_recordings(file_list, max_workers=1, engine=None):
+    """
+    reads several recording csv files, concurrently when max_workers > 1
+
+    results are returned in the order of file_list
+    """
+    if max_workers <= 1 or len(file_list) <= 1:
+        return [read_recording(f, engine=engine) for f in file_list]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(file_list))) as pool:
+        return list(pool.map(lambda f: read_recording(f, engine=engine), file_list))
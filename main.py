@@ -15,8 +15,30 @@ __version__ = "0.1.3"
 import pandas as pd
 import numpy as np
 import os
-import re
 import logging
+import argparse
+import pickle
+import tempfile
+import traceback
+
+import ingest
+import discovery
+import settings_profile
+import cohort
+import odi
+import polars_backend
+import night_trace
+import bootstrap
+import burden
+import cache
+import scheduler
+import xlsx_stream
+import segments
+import epochs
+
+# %% define constants
+# desat flag column -> column name part of its duration filters
+DESAT_FAMILIES = {"desat": "desat", "sub desat": "sub_desat", "sev desat": "sev_desat"}
 
 
 # %% define functions
@@ -65,6 +87,56 @@ def night_time_check(ts, night_start=None, night_stop=None):
         return ts_time >= night_start or ts_time <= night_stop
 
 
+def night_mask(ts, night_start=None, night_stop=None):
+    """
+    vectorized night_time_check over an array of datetime64 timestamps
+    """
+    if not night_start:
+        night_start = pd.Timestamp(hour=21, minute=0).time()
+
+    if not night_stop:
+        night_stop = pd.Timestamp(hour=7, minute=0).time()
+
+    time_of_day = ts - ts.astype("datetime64[D]")
+    start = np.timedelta64(
+        pd.Timedelta(
+            hours=night_start.hour,
+            minutes=night_start.minute,
+            seconds=night_start.second,
+            microseconds=night_start.microsecond,
+        )
+    )
+    stop = np.timedelta64(
+        pd.Timedelta(
+            hours=night_stop.hour,
+            minutes=night_stop.minute,
+            seconds=night_stop.second,
+            microseconds=night_stop.microsecond,
+        )
+    )
+
+    if night_start < night_stop:
+        return (time_of_day >= start) & (time_of_day <= stop)
+    else:
+        return (time_of_day >= start) | (time_of_day <= stop)
+
+
+def fill_artifacts(values, missing):
+    """
+    replaces missing values with the next valid value, or the last valid
+    value when none follows (a positional bfill then ffill)
+    """
+    positions = np.arange(values.size)
+    next_valid = np.minimum.accumulate(np.where(missing, values.size, positions)[::-1])[
+        ::-1
+    ]
+    previous_valid = np.maximum.accumulate(np.where(missing, -1, positions))
+    source = np.where(next_valid < values.size, next_valid, previous_valid)
+    filled = values[np.maximum(source, 0)]
+    filled[source < 0] = np.nan
+    return filled
+
+
 def identify_bin(value, bin_list):
     bin_list.sort(reverse=True)
     for i in bin_list:
@@ -72,165 +144,89 @@ def identify_bin(value, bin_list):
             return i
 
 
-def bout_assembler(start_bouts, stop_bouts, df):
-    bouts = []
+def bout_pairs(start_bouts, stop_bouts):
+    """
+    (start, stop) timestamps of the bouts of matched start and stop markers
+    """
     if start_bouts.shape[0] == 0 or stop_bouts.shape[0] == 0:
-        return bouts
+        return []
     elif start_bouts.iat[0] > stop_bouts.iat[0]:
         # animal started night_df desatted...drop first bout for revised count, mean, and median calcs
-        for i in range(min(start_bouts.shape[0], stop_bouts.shape[0] - 1)):
-            bouts.append(
-                {
-                    "start": start_bouts.iat[i],
-                    "stop": stop_bouts.iat[i + 1],
-                    "duration": (stop_bouts.iat[i + 1] - start_bouts.iat[i]).seconds,
-                    #
-                    "artifact_pulse_duration": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                        & (df["pulse_NA_filter"] == True)
-                    ]["interval"].sum(),
-                    "artifact_spo2_duration": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                        & (df["spo2_NA_filter"] == True)
-                    ]["interval"].sum(),
-                    "artifact_spo2_and_pulse_duration": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                        & (df["spo2_and_pulse_NA_filter"] == True)
-                    ]["interval"].sum(),
-                    "artifact_spo2_or_pulse_duration": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                        & (df["spo2_or_pulse_NA_filter"] == True)
-                    ]["interval"].sum(),
-                    "duration_min_dur_sev_desat": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                        & (df["min_dur_sev_desat"] == True)
-                    ]["interval"].sum(),
-                    "ratio_sev_desat": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                        & (df["min_dur_sev_desat"] == True)
-                    ]["interval"].sum()
-                    / (stop_bouts.iat[i + 1] - start_bouts.iat[i]).seconds,
-                    "low_spo2": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                    ]["spo2"].min(),
-                    "mean_spo2": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                    ]["spo2"].mean(),
-                    "median_spo2": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                    ]["spo2"].median(),
-                    "low_pulse": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                    ]["pulse"].min(),
-                    "high_pulse": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                    ]["pulse"].max(),
-                    "mean_pulse": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                    ]["pulse"].mean(),
-                    "median_pulse": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i + 1])
-                    ]["pulse"].median(),
-                }
-            )
-
+        return [
+            (start_bouts.iat[i], stop_bouts.iat[i + 1])
+            for i in range(min(start_bouts.shape[0], stop_bouts.shape[0] - 1))
+        ]
     else:
-        for i in range(min(start_bouts.shape[0], stop_bouts.shape[0])):
-            bouts.append(
-                {
-                    "start": start_bouts.iat[i],
-                    "stop": stop_bouts.iat[i],
-                    "duration": (stop_bouts.iat[i] - start_bouts.iat[i]).seconds,
-                    #
-                    "artifact_pulse_duration": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                        & (df["pulse_NA_filter"] == True)
-                    ]["interval"].sum(),
-                    "artifact_spo2_duration": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                        & (df["spo2_NA_filter"] == True)
-                    ]["interval"].sum(),
-                    "artifact_spo2_and_pulse_duration": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                        & (df["spo2_and_pulse_NA_filter"] == True)
-                    ]["interval"].sum(),
-                    "artifact_spo2_or_pulse_duration": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                        & (df["spo2_or_pulse_NA_filter"] == True)
-                    ]["interval"].sum(),
-                    "duration_min_dur_sev_desat": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                        & (df["min_dur_sev_desat"] == True)
-                    ]["interval"].sum(),
-                    "ratio_sev_desat": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                        & (df["min_dur_sev_desat"] == True)
-                    ]["interval"].sum()
-                    / (stop_bouts.iat[i] - start_bouts.iat[i]).seconds,
-                    "low_spo2": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                    ]["spo2"].min(),
-                    "mean_spo2": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                    ]["spo2"].mean(),
-                    "median_spo2": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                    ]["spo2"].median(),
-                    "low_pulse": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                    ]["pulse"].min(),
-                    "high_pulse": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                    ]["pulse"].max(),
-                    "mean_pulse": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                    ]["pulse"].mean(),
-                    "median_pulse": df[
-                        (df["ts"] >= start_bouts.iat[i])
-                        & (df["ts"] <= stop_bouts.iat[i])
-                    ]["pulse"].median(),
-                }
-            )
-    return bouts
+        return [
+            (start_bouts.iat[i], stop_bouts.iat[i])
+            for i in range(min(start_bouts.shape[0], stop_bouts.shape[0]))
+        ]
+
+
+def bout_record(start, stop, df):
+    """
+    duration, artifact and spo2/pulse statistics of the samples of df from
+    start to stop
+    """
+    in_bout = (df["ts"] >= start) & (df["ts"] <= stop)
+    # columns are selected before masking, so only they are copied
+    interval = df["interval"]
+    sev_desat_duration = interval[in_bout & (df["min_dur_sev_desat"] == True)].sum()
+    spo2 = df["spo2"][in_bout]
+    pulse = df["pulse"][in_bout]
+    return {
+        "start": start,
+        "stop": stop,
+        "duration": (stop - start).seconds,
+        #
+        "artifact_pulse_duration": interval[
+            in_bout & (df["pulse_NA_filter"] == True)
+        ].sum(),
+        "artifact_spo2_duration": interval[
+            in_bout & (df["spo2_NA_filter"] == True)
+        ].sum(),
+        "artifact_spo2_and_pulse_duration": interval[
+            in_bout & (df["spo2_and_pulse_NA_filter"] == True)
+        ].sum(),
+        "artifact_spo2_or_pulse_duration": interval[
+            in_bout & (df["spo2_or_pulse_NA_filter"] == True)
+        ].sum(),
+        "duration_min_dur_sev_desat": sev_desat_duration,
+        "ratio_sev_desat": sev_desat_duration / (stop - start).seconds,
+        "low_spo2": spo2.min(),
+        "mean_spo2": spo2.mean(),
+        "median_spo2": spo2.median(),
+        "low_pulse": pulse.min(),
+        "high_pulse": pulse.max(),
+        "mean_pulse": pulse.mean(),
+        "median_pulse": pulse.median(),
+    }
+
+
+def bout_assembler(
+    start_bouts, stop_bouts, df, pool=None, segment_rows=segments.DEFAULT_SEGMENT_ROWS
+):
+    """
+    bout records of matched start and stop markers - each bout is scored on
+    its own rows of df, the segments of df (of about segment_rows rows)
+    concurrently on the pool when given (see segments.py)
+    """
+    return segments.score_bouts(
+        bout_record, bout_pairs(start_bouts, stop_bouts), df, pool, segment_rows
+    )
 
 
 def flag_subdesat_starts(bouts, night_df):
-    for i in range(len(bouts)):
-        try:
-            bouts[i]["started subdesat"] = int(
-                night_df[night_df["ts"] < bouts[i]["start"]][
-                    "sustained_dur_sub_desat"
-                ].iloc[-1]
-            )
-        except Exception as e:
-            print(e)
-            bouts[i]["started subdesat"] = "unk"
-        # print(bouts)
+    # the sample before each bout start, by binary search on the sorted
+    # timestamps
+    ts = night_df["ts"].to_numpy()
+    sustained_sub_desat = night_df["sustained_dur_sub_desat"].to_numpy()
+    for bout in bouts:
+        before = np.searchsorted(ts, bout["start"].to_datetime64(), side="left") - 1
+        if before < 0 or np.isnan(sustained_sub_desat[before]):
+            bout["started subdesat"] = "unk"
+        else:
+            bout["started subdesat"] = int(sustained_sub_desat[before])
     return bouts
 
 
@@ -246,6 +242,8 @@ def prepare_output_dict(
     sustained_subdesat_bouts,
     sustained_sevdesat_bouts,
     settings,
+    odi_events=None,
+    burden_summary=None,
 ):
     output_dict = {
         "night start": night_recording_start,
@@ -905,372 +903,779 @@ def prepare_output_dict(
         "median spo2 overall": night_df["spo2"].median(),
         "minimum spo2 overall": night_df["spo2"].min(),
     }
+    if odi_events is not None:
+        for drop, events in odi_events.items():
+            output_dict[f"count odi {drop}% events"] = len(events)
+            output_dict[f"odi {drop}% index (events/hr)"] = len(events) / (
+                output_dict["duration recording (excluding_gaps)"] / 3600
+            )
+    if burden_summary is not None:
+        output_dict.update(burden_summary)
+        for label, bouts in [
+            ("desat bouts", desat_bouts),
+            ("sustained desat bouts", sustained_desat_bouts),
+        ]:
+            output_dict[f"hypoxic burden during {label} (%min/hr)"] = burden.per_hour(
+                sum(bout["hypoxic_burden"] for bout in bouts),
+                output_dict["duration recording (excluding_gaps)"] / 3600,
+            )
     return output_dict
 
 
-# %% define classes
-
-
-# %% define main ## TODO !!! currently script, need to reframe as function
-def main(
-    input_file_path=None, output_file_path=None, settings_file_path=None, logger=None
-):
-    # %%
-    # get input files
-    if not input_file_path:
-        input_file_path = "./sample data/pooled/"
-
-    # get settings file
-    if not settings_file_path:
-        settings_file_path = "./sample settings.xlsx"
+def read_settings(settings_file_path):
+    """
+    reads a settings file (xlsx, json or toml, see settings_profile.py)
 
-    # get output path
-    if not settings_file_path:
-        output_file_path = "./sample output/"
+    returns the compiled settings (a dict of parameter -> value) and the
+    file time fix dict (file name -> (end hour, end minute))
+    """
+    profile = settings_profile.load_profile(settings_file_path)
+    return profile, profile.file_time_fix
 
-    # prepare logger
-    if not logger:
-        logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG)
-        log_formatter = logging.Formatter(
-            "%(asctime)s | %(threadName)s | %(levelname)-5.5s |  %(message)s"
-        )
-        file_handler = logging.FileHandler(os.path.join(output_file_path, "log.log"))
-        file_handler.setFormatter(log_formatter)
-        logger.addHandler(file_handler)
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(log_formatter)
-        logger.addHandler(console_handler)
-    else:
-        logger.info("using external logger")
 
-    logger.info("log started")
-    logger.info(f"input_file_path:{input_file_path}")
-    logger.info(f"output_file_path:{output_file_path}")
-    logger.info(f"settings_file_path:{settings_file_path}")
+def collect_subject_files(
+    input_file_path, logger, include=None, exclude=None, cache_path=None
+):
+    """
+    finds the recording csv files below input_file_path (recursively, see
+    discovery.py) and groups them by subject id
 
-    # %% collect data from file paths
-    logger.info("collecting settings")
-    settings = (
-        pd.read_excel(settings_file_path, sheet_name="settings")
-        .set_index("parameter")["value"]
-        .to_dict()
+    returns a dict of subject id -> list of file paths
+    """
+    file_dict, stats = discovery.discover(
+        input_file_path, include=include, exclude=exclude, cache_path=cache_path
     )
-    logger.info("checking for file time fix needs")
-    file_time_fix = pd.read_excel(settings_file_path, sheet_name="file time fix")
+    logger.info(
+        f"input files found: {sum(len(v) for v in file_dict.values())} files found "
+        + f"({stats['folders listed']} folder(s) listed, "
+        + f"{stats['folders reused']} unchanged)"
+    )
+    for subject_id, file_list in file_dict.items():
+        logger.info(
+            f"{subject_id} - {', '.join(os.path.basename(f) for f in file_list)}"
+        )
+    return file_dict
 
-    # %% list of files in input_file_path
-    file_list = [
-        os.path.join(input_file_path, f)
-        for f in os.listdir(input_file_path)
-        if f.endswith(".csv")
-    ]
-    logger.info(f"input files found: {len(file_list)} files found")
-
-    file_dict = {}
-    for f in file_list:
-        subject_id = re.match(
-            re.compile("(?P<id>.+?)[a-z_]*.csv"), os.path.basename(f)
-        ).group("id")
-        # subject_id = os.path.splitext(os.path.basename(f))[0].split("_")[0]
-        logger.info(f"{subject_id} - {os.path.basename(f)}")
-        if subject_id in file_dict:
-            file_dict[subject_id].append(f)
-        else:
-            file_dict[subject_id] = [f]
 
-    # %% populate night duration bins
-    output_dict = {}
-    output_dict["night_duration_bins"] = {}
+def build_night_duration_bins(settings, logger):
+    """
+    creates the empty night duration bins, keyed by the lower edge of each
+    bin in hours, including the complete night and insufficient data bins
+    """
+    night_duration_bins = {}
     for i in range(
         settings["minimum night duration (hours)"],
         settings["complete night duration (hours)"],
         settings["night duration bin size (hours)"],
     ):
-        output_dict["night_duration_bins"][i] = {}
+        night_duration_bins[i] = {}
         logger.info(f"adding {i} hour night duration bin")
-    if (
-        settings["complete night duration (hours)"]
-        not in output_dict["night_duration_bins"]
-    ):
-        output_dict["night_duration_bins"][
-            settings["complete night duration (hours)"]
-        ] = {}
+    if settings["complete night duration (hours)"] not in night_duration_bins:
+        night_duration_bins[settings["complete night duration (hours)"]] = {}
         logger.info(
             f'adding complete night duration bin ({settings["complete night duration (hours)"]} hrs)'
         )
-    if 0 not in output_dict["night_duration_bins"]:
-        output_dict["night_duration_bins"][0] = {}
+    if 0 not in night_duration_bins:
+        night_duration_bins[0] = {}
         logger.info("adding 0 hr duration bin (insufficient data bin)")
-    # %% loop through file list
-    logger.info("looping through subjects in dataset")
-    for subject_id, subject_file_list in file_dict.items():
-        logger.info(f"working on: {subject_id} - ','.join(subject_file_list)")
-        subject_df_list = []
-        output_summary = {}
-        for f in subject_file_list:
-            df = pd.read_csv(f)
-            # prepare timestamp column
-            df["ts"] = df.apply(build_timestamp, axis=1)
-            sample_interval = df["ts"].iloc[1] - df["ts"].iloc[0]
-
-            # fix timestamps if manual fix needed
-            if os.path.basename(f) in list(file_time_fix["filename"]):
-                last_row = df.iloc[-1]
-                ending_ts = pd.Timestamp(
-                    year=last_row["year"],
-                    month=last_row["month"],
-                    day=last_row["day"],
-                    hour=file_time_fix[
-                        file_time_fix["filename"] == os.path.basename(f)
-                    ]["end hour"].iloc[0],
-                    minute=file_time_fix[
-                        file_time_fix["filename"] == os.path.basename(f)
-                    ]["end minute"].iloc[0],
-                )
-                df["ts"] = pd.date_range(
-                    end=ending_ts, freq=sample_interval, periods=df.shape[0]
-                )
-                logger.info(
-                    f"fixing timestamps in file: {f}, new start:{df['ts'].iloc[0]}, new end: {df['ts'].iloc[-1]}"
-                )
+    return night_duration_bins
 
-            subject_df_list.append(df)
-        logger.info(
-            f"{subject_id}: {len(subject_file_list)} piece(s). sampling interval {sample_interval.seconds} sec"
-        )
-        subject_df = pd.concat(subject_df_list)
-
-        # % process file
-        # identify and placehold gaps and NA's
-        subject_df["spo2_NA_filter"] = subject_df["spo2"] == 500
-        subject_df["pulse_NA_filter"] = subject_df["pulse"] == 500
-        subject_df["spo2_and_pulse_NA_filter"] = (subject_df["spo2"] == 500) & (
-            subject_df["pulse"] == 500
-        )
-        subject_df["spo2_or_pulse_NA_filter"] = (subject_df["spo2"] == 500) | (
-            subject_df["pulse"] == 500
+
+def load_subject_df(subject_id, subject_file_list, settings, file_time_fix, logger):
+    """
+    reads, timestamps and concatenates the recording files of a subject and
+    adds the artifact, gap, filled value and night columns
+
+    returns the subject_df and the list of per-file dataframes
+    """
+    logger.info(f"working on: {subject_id} - {','.join(subject_file_list)}")
+    subject_df_list = []
+    fragment_dfs = ingest.read_recordings(
+        subject_file_list, max_workers=int(settings.get("ingest threads", 1))
+    )
+    for f, df in zip(subject_file_list, fragment_dfs):
+        sample_interval = df["ts"].iloc[1] - df["ts"].iloc[0]
+
+        # fix timestamps if manual fix needed
+        fix = settings_profile.end_time(file_time_fix, f)
+        if fix:
+            last_row = df.iloc[-1]
+            ending_ts = pd.Timestamp(
+                year=last_row["year"],
+                month=last_row["month"],
+                day=last_row["day"],
+                hour=fix[0],
+                minute=fix[1],
+            )
+            df["ts"] = pd.date_range(
+                end=ending_ts, freq=sample_interval, periods=df.shape[0]
+            )
+            logger.info(
+                f"fixing timestamps in file: {f}, new start:{df['ts'].iloc[0]}, new end: {df['ts'].iloc[-1]}"
+            )
+
+        subject_df_list.append(df)
+    logger.info(
+        f"{subject_id}: {len(subject_file_list)} piece(s). sampling interval {sample_interval.seconds} sec"
+    )
+    subject_df, merge_report = ingest.merge_fragments(
+        subject_df_list,
+        names=[os.path.basename(f) for f in subject_file_list],
+        jump_sec=settings.get("clock jump threshold (sec)", 3600),
+    )
+    if len(subject_df_list) > 1:
+        logger.info(f"{subject_id}: fragment order {', '.join(merge_report['order'])}")
+    for earlier, later, overlap in merge_report["overlaps"]:
+        logger.warning(f"{subject_id}: {later} overlaps {earlier} by {overlap} sec")
+    if merge_report["duplicate samples"]:
+        logger.warning(
+            f"{subject_id}: dropped {merge_report['duplicate samples']} duplicate "
+            + f"sample(s), {merge_report['conflicting duplicates']} with differing values"
         )
-        subject_df["interval"] = subject_df["ts"].diff().dt.total_seconds()
-        subject_df["gaps"] = (
-            subject_df["interval"] > settings["expected_sampling_rate (sec)"]
+    for name, line_num, step in merge_report["clock jumps"]:
+        logger.warning(
+            f"{subject_id}: clock jump of {step} sec in {name} at line {line_num}"
         )
 
-        # create fixed o2 column
-        subject_df["fixed_spo2"] = subject_df["spo2"]
-        subject_df["fixed_pulse"] = subject_df["pulse"]
-        subject_df.replace(
-            {"fixed_pulse": {500: np.nan}, "fixed_spo2": {500: np.nan}}, inplace=True
-        )
-        subject_df.bfill(inplace=True)
-        subject_df.ffill(inplace=True)
+    # % process file
+    # identify and placehold gaps and NA's - each derived column is built once
+    # from the underlying arrays rather than by passes over the whole frame
+    spo2_na = subject_df["spo2"].to_numpy() == 500
+    pulse_na = subject_df["pulse"].to_numpy() == 500
+    subject_df["spo2_NA_filter"] = spo2_na
+    subject_df["pulse_NA_filter"] = pulse_na
+    subject_df["spo2_and_pulse_NA_filter"] = spo2_na & pulse_na
+    subject_df["spo2_or_pulse_NA_filter"] = spo2_na | pulse_na
 
-        # create instantaneous o2 diff collumn
-        subject_df["diff_spo2"] = subject_df["fixed_spo2"].diff()
+    ts = subject_df["ts"].to_numpy(dtype="datetime64[ns]")
+    interval = np.empty(ts.size)
+    interval[1:] = np.diff(ts) / np.timedelta64(1, "s")
+    gaps = np.zeros(ts.size, dtype=bool)
+    gaps[1:] = interval[1:] > settings["expected_sampling_rate (sec)"]
+    # the first sample has no interval of its own and takes the next one
+    interval[0] = interval[1]
+    subject_df["interval"] = interval
+    subject_df["gaps"] = gaps
 
-        # % filter to "night" hours
-        subject_df["night"] = subject_df["ts"].apply(
-            night_time_check,
-            night_start=settings["night_start_time (24hr HH:MM)"],
-            night_stop=settings["night_stop_time (24hr HH:MM)"],
-        )
+    # create fixed o2 column, artifact values take the next valid value
+    # (or the last one at the end of the recording)
+    fixed_spo2 = fill_artifacts(subject_df["spo2"].to_numpy(dtype=float), spo2_na)
+    subject_df["fixed_spo2"] = fixed_spo2
+    subject_df["fixed_pulse"] = fill_artifacts(
+        subject_df["pulse"].to_numpy(dtype=float), pulse_na
+    )
 
-        night_df = subject_df[subject_df["night"]].copy()
-        night_recording_start = night_df["ts"].iloc[0]
-        night_recording_stop = night_df["ts"].iloc[-1]
+    # create instantaneous o2 diff collumn
+    diff_spo2 = np.empty(ts.size)
+    diff_spo2[0] = np.nan
+    diff_spo2[1:] = np.diff(fixed_spo2)
+    subject_df["diff_spo2"] = diff_spo2
 
-        # % determine which overnight bin to use
-        duration = night_df[night_df["gaps"] == False]["interval"].sum()
-        duration_hours = int(
-            (duration + settings["night duration round up within (minutes)"] * 60)
-            / 60
-            / 60
-        )
+    # % filter to "night" hours
+    night_start, night_stop = settings_profile.night_window(settings)
+    subject_df["night"] = night_mask(ts, night_start=night_start, night_stop=night_stop)
 
-        duration_bin = identify_bin(
-            duration_hours, list(output_dict["night_duration_bins"].keys())
-        )
-        logger.info(
-            f"duration (sec):{duration}; duration (hrs):{duration_hours}; bin: {duration_bin}"
-        )
+    return subject_df, subject_df_list
 
-        # % score desat events
-        night_df["desat"] = night_df["fixed_spo2"] < settings["desat threshold"]
-        night_df["sub desat"] = (
-            night_df["fixed_spo2"] <= settings["desat subthreshold"]
-        ) & (night_df["fixed_spo2"] >= settings["desat threshold"])
-        night_df["sev desat"] = (
-            night_df["fixed_spo2"] < settings["desat severe threshold"]
-        )
-        night_df["spike desat"] = night_df["diff_spo2"] <= settings["desat spike"]
-
-        # %% rescore desats that occur after recording gaps to prevent gap inclusion
-        # -- in minimum or sustained bouts
-        night_df.loc[night_df["gaps"] == True, "desat"] = False
-        night_df.loc[night_df["gaps"] == True, "sub desat"] = False
-        night_df.loc[night_df["gaps"] == True, "sev desat"] = False
-        night_df.loc[night_df["gaps"] == True, "spike desat"] = False
-
-        # % apply rolling filters (min duration and sustained duration)
-        # - apply twice, once to remove too small and second time to refill the time
-        min_duration = pd.Timedelta(seconds=settings["minimum desat interval (sec)"])
-        night_df["min_dur_desat_trimmed"] = night_df.rolling(
-            window=min_duration, on="ts", center=True
-        )["desat"].min()
-        night_df["min_dur_desat"] = night_df.rolling(
-            window=min_duration, on="ts", center=True
-        )["min_dur_desat_trimmed"].max()
-        night_df["min_dur_sub_desat_trimmed"] = night_df.rolling(
-            window=min_duration, on="ts", center=True
-        )["sub desat"].min()
-        night_df["min_dur_sub_desat"] = night_df.rolling(
-            window=min_duration, on="ts", center=True
-        )["min_dur_sub_desat_trimmed"].max()
-        night_df["min_dur_sev_desat_trimmed"] = night_df.rolling(
-            window=min_duration, on="ts", center=True
-        )["sev desat"].min()
-        night_df["min_dur_sev_desat"] = night_df.rolling(
-            window=min_duration, on="ts", center=True
-        )["min_dur_sev_desat_trimmed"].max()
-
-        night_df["min_dur_desat_bout_start"] = (
-            night_df["min_dur_desat"].astype(int).diff()
-        )
-        night_df["min_dur_sub_desat_bout_start"] = (
-            night_df["min_dur_sub_desat"].astype(int).diff()
-        )
-        night_df["min_dur_sev_desat_bout_start"] = (
-            night_df["min_dur_sev_desat"].astype(int).diff()
-        )
 
-        desat_start_bouts = night_df["ts"][night_df["min_dur_desat_bout_start"] == 1]
-        desat_stop_bouts = night_df["ts"][night_df["min_dur_desat_bout_start"] == -1]
+def duration_filter(night_df, flag, seconds):
+    """
+    (trimmed, kept, bout start) series of a desat flag - the centered rolling
+    min over 'seconds' drops runs shorter than the window, the rolling max of
+    that refills the kept runs, and its diff marks bout starts (1) and stops
+    (-1)
+    """
+    window = pd.Timedelta(seconds=seconds)
+    frame = night_df[["ts", flag]].copy()
+    frame["trimmed"] = frame.rolling(window=window, on="ts", center=True)[flag].min()
+    frame["kept"] = frame.rolling(window=window, on="ts", center=True)["trimmed"].max()
+    return frame["trimmed"], frame["kept"], frame["kept"].astype(int).diff()
 
-        subdesat_start_bouts = night_df["ts"][
-            night_df["min_dur_sub_desat_bout_start"] == 1
-        ]
-        subdesat_stop_bouts = night_df["ts"][
-            night_df["min_dur_sub_desat_bout_start"] == -1
-        ]
 
-        sevdesat_start_bouts = night_df["ts"][
-            night_df["min_dur_sev_desat_bout_start"] == 1
+def annotate_night(subject_id, subject_file_list, settings, file_time_fix, logger):
+    """
+    loads a subject and returns the night_df annotated with the desat flags,
+    the minimum and sustained duration filters and the bout start/stop
+    markers, and the list of per-file dataframes
+    """
+    subject_df, subject_df_list = load_subject_df(
+        subject_id, subject_file_list, settings, file_time_fix, logger
+    )
+
+    # a single positional take gives the night frame its own data, so the
+    # columns added below do not touch subject_df. a slice is no option -
+    # recordings over several nights have one night run per night
+    night_df = subject_df.take(np.flatnonzero(subject_df["night"].to_numpy()))
+
+    # % score desat events
+    # -- desats that occur after recording gaps are rescored as False to
+    # -- prevent gap inclusion in minimum or sustained bouts
+    night_spo2 = night_df["fixed_spo2"].to_numpy()
+    not_gap = ~night_df["gaps"].to_numpy()
+    night_df["desat"] = (night_spo2 < settings["desat threshold"]) & not_gap
+    night_df["sub desat"] = (
+        (night_spo2 <= settings["desat subthreshold"])
+        & (night_spo2 >= settings["desat threshold"])
+        & not_gap
+    )
+    night_df["sev desat"] = (night_spo2 < settings["desat severe threshold"]) & not_gap
+    night_df["spike desat"] = (
+        night_df["diff_spo2"].to_numpy() <= settings["desat spike"]
+    ) & not_gap
+
+    # % apply rolling filters (min duration and sustained duration)
+    # - apply twice, once to remove too small and second time to refill the time
+    # - the filters of the desat families are independent and run side by side
+    filters = [
+        (prefix, flag, settings[setting])
+        for prefix, setting in [
+            ("min_dur", "minimum desat interval (sec)"),
+            ("sustained_dur", "sustained desat interval (sec)"),
         ]
-        sevdesat_stop_bouts = night_df["ts"][
-            night_df["min_dur_sev_desat_bout_start"] == -1
+        for flag in DESAT_FAMILIES
+    ]
+    with segments.subject_pool(settings) as pool:
+        filtered = segments.run_tasks(
+            lambda task: duration_filter(night_df, task[1], task[2]), filters, pool
+        )
+    for prefix in ["min_dur", "sustained_dur"]:
+        results = [
+            (DESAT_FAMILIES[flag], result)
+            for (task_prefix, flag, _), result in zip(filters, filtered)
+            if task_prefix == prefix
         ]
+        for name, (trimmed, kept, _) in results:
+            night_df[f"{prefix}_{name}_trimmed"] = trimmed
+            night_df[f"{prefix}_{name}"] = kept
+        for name, (_, _, bout_start) in results:
+            night_df[f"{prefix}_{name}_bout_start"] = bout_start
 
-        sustained_duration = pd.Timedelta(
-            seconds=settings["sustained desat interval (sec)"]
-        )
-        night_df["sustained_dur_desat_trimmed"] = night_df.rolling(
-            window=sustained_duration, on="ts", center=True
-        )["desat"].min()
-        night_df["sustained_dur_desat"] = night_df.rolling(
-            window=sustained_duration, on="ts", center=True
-        )["sustained_dur_desat_trimmed"].max()
-        night_df["sustained_dur_sub_desat_trimmed"] = night_df.rolling(
-            window=sustained_duration, on="ts", center=True
-        )["sub desat"].min()
-        night_df["sustained_dur_sub_desat"] = night_df.rolling(
-            window=sustained_duration, on="ts", center=True
-        )["sustained_dur_sub_desat_trimmed"].max()
-        night_df["sustained_dur_sev_desat_trimmed"] = night_df.rolling(
-            window=sustained_duration, on="ts", center=True
-        )["sev desat"].min()
-        night_df["sustained_dur_sev_desat"] = night_df.rolling(
-            window=sustained_duration, on="ts", center=True
-        )["sustained_dur_sev_desat_trimmed"].max()
-
-        night_df["sustained_dur_desat_bout_start"] = (
-            night_df["sustained_dur_desat"].astype(int).diff()
-        )
-        night_df["sustained_dur_sub_desat_bout_start"] = (
-            night_df["sustained_dur_sub_desat"].astype(int).diff()
+    return night_df, subject_df_list
+
+
+def process_subject(
+    subject_id,
+    subject_file_list,
+    settings,
+    file_time_fix,
+    night_duration_bins,
+    logger,
+):
+    """
+    runs the analysis pipeline for a single subject
+
+    returns a dict containing the night duration bin, the output summary,
+    the assembled bouts (keyed by output sheet name) and the annotated
+    night_df
+    """
+    # "backend" selects the engine that builds the annotated night_df, the
+    # bouts and summary are scored from it the same way for both
+    if settings.get("backend", "pandas") == "polars":
+        night_df, subject_df_list = polars_backend.annotate_night(
+            subject_id, subject_file_list, settings, file_time_fix, logger
         )
-        night_df["sustained_dur_sev_desat_bout_start"] = (
-            night_df["sustained_dur_sev_desat"].astype(int).diff()
+    else:
+        night_df, subject_df_list = annotate_night(
+            subject_id, subject_file_list, settings, file_time_fix, logger
         )
+    if night_df.shape[0] == 0:
+        raise ValueError(f"{subject_id}: no recording samples within the night window")
+    night_recording_start = night_df["ts"].iloc[0]
+    night_recording_stop = night_df["ts"].iloc[-1]
 
-        sustained_desat_start_bouts = night_df["ts"][
-            night_df["sustained_dur_desat_bout_start"] == 1
-        ]
-        sustained_desat_stop_bouts = night_df["ts"][
-            night_df["sustained_dur_desat_bout_start"] == -1
-        ]
+    # % determine which overnight bin to use
+    duration = night_df[night_df["gaps"] == False]["interval"].sum()
+    duration_hours = int(
+        (duration + settings["night duration round up within (minutes)"] * 60) / 60 / 60
+    )
 
-        sustained_subdesat_start_bouts = night_df["ts"][
-            night_df["sustained_dur_sub_desat_bout_start"] == 1
-        ]
-        sustained_subdesat_stop_bouts = night_df["ts"][
-            night_df["sustained_dur_sub_desat_bout_start"] == -1
-        ]
+    duration_bin = identify_bin(duration_hours, list(night_duration_bins))
+    logger.info(
+        f"duration (sec):{duration}; duration (hrs):{duration_hours}; bin: {duration_bin}"
+    )
 
-        sustained_sevdesat_start_bouts = night_df["ts"][
-            night_df["sustained_dur_sev_desat_bout_start"] == 1
-        ]
-        sustained_sevdesat_stop_bouts = night_df["ts"][
-            night_df["sustained_dur_sev_desat_bout_start"] == -1
-        ]
+    # % bout start and stop times
+    desat_start_bouts = night_df["ts"][night_df["min_dur_desat_bout_start"] == 1]
+    desat_stop_bouts = night_df["ts"][night_df["min_dur_desat_bout_start"] == -1]
+
+    subdesat_start_bouts = night_df["ts"][night_df["min_dur_sub_desat_bout_start"] == 1]
+    subdesat_stop_bouts = night_df["ts"][night_df["min_dur_sub_desat_bout_start"] == -1]
+
+    sevdesat_start_bouts = night_df["ts"][night_df["min_dur_sev_desat_bout_start"] == 1]
+    sevdesat_stop_bouts = night_df["ts"][night_df["min_dur_sev_desat_bout_start"] == -1]
+
+    sustained_desat_start_bouts = night_df["ts"][
+        night_df["sustained_dur_desat_bout_start"] == 1
+    ]
+    sustained_desat_stop_bouts = night_df["ts"][
+        night_df["sustained_dur_desat_bout_start"] == -1
+    ]
+
+    sustained_subdesat_start_bouts = night_df["ts"][
+        night_df["sustained_dur_sub_desat_bout_start"] == 1
+    ]
+    sustained_subdesat_stop_bouts = night_df["ts"][
+        night_df["sustained_dur_sub_desat_bout_start"] == -1
+    ]
 
+    sustained_sevdesat_start_bouts = night_df["ts"][
+        night_df["sustained_dur_sev_desat_bout_start"] == 1
+    ]
+    sustained_sevdesat_stop_bouts = night_df["ts"][
+        night_df["sustained_dur_sev_desat_bout_start"] == -1
+    ]
+
+    # bouts of long nights are scored segment by segment (see segments.py)
+    segment_rows = settings.get("segment rows", segments.DEFAULT_SEGMENT_ROWS)
+    with segments.subject_pool(settings) as pool:
         subdesat_bouts = bout_assembler(
-            subdesat_start_bouts, subdesat_stop_bouts, night_df
+            subdesat_start_bouts, subdesat_stop_bouts, night_df, pool, segment_rows
         )
         sustained_subdesat_bouts = bout_assembler(
-            sustained_subdesat_start_bouts, sustained_subdesat_stop_bouts, night_df
+            sustained_subdesat_start_bouts,
+            sustained_subdesat_stop_bouts,
+            night_df,
+            pool,
+            segment_rows,
         )
         desat_bouts = flag_subdesat_starts(
-            bout_assembler(desat_start_bouts, desat_stop_bouts, night_df), night_df
+            bout_assembler(
+                desat_start_bouts, desat_stop_bouts, night_df, pool, segment_rows
+            ),
+            night_df,
         )
         sustained_desat_bouts = flag_subdesat_starts(
             bout_assembler(
-                sustained_desat_start_bouts, sustained_desat_stop_bouts, night_df
+                sustained_desat_start_bouts,
+                sustained_desat_stop_bouts,
+                night_df,
+                pool,
+                segment_rows,
             ),
             night_df,
         )
         sevdesat_bouts = bout_assembler(
-            sevdesat_start_bouts, sevdesat_stop_bouts, night_df
+            sevdesat_start_bouts, sevdesat_stop_bouts, night_df, pool, segment_rows
         )
         sustained_sevdesat_bouts = bout_assembler(
-            sustained_sevdesat_start_bouts, sustained_sevdesat_stop_bouts, night_df
-        )
-
-        # %
-        output_summary = prepare_output_dict(
-            night_recording_start,
-            night_recording_stop,
-            subject_df_list,
+            sustained_sevdesat_start_bouts,
+            sustained_sevdesat_stop_bouts,
             night_df,
-            desat_bouts,
-            subdesat_bouts,
-            sevdesat_bouts,
-            sustained_desat_bouts,
-            sustained_subdesat_bouts,
-            sustained_sevdesat_bouts,
-            settings,
+            pool,
+            segment_rows,
         )
-        output_dict["night_duration_bins"][duration_bin][subject_id] = output_summary
 
-        logger.info(f"summary created for {subject_id}")
+    # % hypoxic burden (area under the thresholds) of every bout
+    burden.add_bout_burden(
+        {
+            "desat bouts": desat_bouts,
+            "sustained desat bouts": sustained_desat_bouts,
+            "subdesat bouts": subdesat_bouts,
+            "sustained subdesat bouts": sustained_subdesat_bouts,
+            "sevdesat bouts": sevdesat_bouts,
+            "sustained sevdesat bouts": sustained_sevdesat_bouts,
+        },
+        night_df,
+        settings,
+    )
 
-        # create output of annotated night dataframe
-        writer = pd.ExcelWriter(
-            os.path.join(os.path.join(output_file_path, f"{subject_id}_night.xlsx")),
-            engine="xlsxwriter",
+    # % score oxygen desaturation index (ODI) events against a moving baseline
+    night_df["odi baseline"], _ = odi.moving_baseline(
+        night_df,
+        settings.get("odi baseline window (sec)", odi.DEFAULT_BASELINE_WINDOW),
+    )
+    odi_events = {
+        drop: odi.detect_odi_events(
+            night_df, drop, settings, baseline=night_df["odi baseline"].to_numpy()
         )
-        night_df.to_excel(writer, sheet_name=f"{subject_id}")
-        pd.DataFrame(desat_bouts).to_excel(writer, sheet_name="desat bouts")
-        pd.DataFrame(sustained_desat_bouts).to_excel(
-            writer, sheet_name="sustained desat bouts"
+        for drop in odi.ODI_DROPS
+    }
+
+    # %
+    output_summary = prepare_output_dict(
+        night_recording_start,
+        night_recording_stop,
+        subject_df_list,
+        night_df,
+        desat_bouts,
+        subdesat_bouts,
+        sevdesat_bouts,
+        sustained_desat_bouts,
+        sustained_subdesat_bouts,
+        sustained_sevdesat_bouts,
+        settings,
+        odi_events=odi_events,
+        burden_summary=burden.summary_burden(night_df, settings),
+    )
+    logger.info(f"summary created for {subject_id}")
+
+    return {
+        "subject_id": subject_id,
+        "duration_bin": duration_bin,
+        "output_summary": output_summary,
+        "bouts": {
+            "desat bouts": desat_bouts,
+            "sustained desat bouts": sustained_desat_bouts,
+            "subdesat bouts": subdesat_bouts,
+            "sustained subdesat bouts": sustained_subdesat_bouts,
+            "sevdesat bouts": sevdesat_bouts,
+            "sustained sevdesat bouts": sustained_sevdesat_bouts,
+            **{f"odi {drop}% events": events for drop, events in odi_events.items()},
+        },
+        "night_df": night_df,
+    }
+
+
+def write_night_output(subject_id, subject_result, output_file_path, settings=None):
+    """
+    writes the annotated night_df (or its epoch summary, see epochs.py), bout
+    tables and summary for a subject to {subject_id}_night.xlsx, and its
+    traces to {subject_id}_trace.npz
+    """
+    settings = settings or {}
+    if settings.get("night export", "full") == "epochs":
+        sheets = {
+            "epochs": epochs.epoch_table(
+                subject_result["night_df"],
+                subject_result["bouts"],
+                settings.get("epoch length (sec)", epochs.DEFAULT_EPOCH_SEC),
+            )
+        }
+    else:
+        sheets = {f"{subject_id}": subject_result["night_df"]}
+    for sheet_name in [
+        "desat bouts",
+        "sustained desat bouts",
+        "subdesat bouts",
+        "sustained subdesat bouts",
+    ] + [f"odi {drop}% events" for drop in odi.ODI_DROPS]:
+        sheets[sheet_name] = pd.DataFrame(subject_result["bouts"][sheet_name])
+    sheets["summary"] = pd.DataFrame(subject_result["output_summary"], index=[0])
+    # streamed in constant memory, nights past excel's row limit continue
+    # on numbered sheets
+    xlsx_stream.write_workbook(
+        os.path.join(output_file_path, f"{subject_id}_night.xlsx"), sheets
+    )
+    # compact copy of the traces and scored regions for the GUI trace viewer
+    night_trace.write_trace(
+        night_trace.trace_path(output_file_path, subject_id), subject_result
+    )
+
+
+def checkpoint_path(output_file_path, subject_id, status="done"):
+    """
+    location of the checkpoint record for a subject
+
+    status is "done" for completed subjects and "failed" for subjects
+    whose analysis raised an error
+    """
+    return os.path.join(output_file_path, "checkpoints", f"{subject_id}.{status}.pkl")
+
+
+def file_end_times(subject_files, file_time_fix):
+    """
+    verified end time of each of a subject's recording files (None for files
+    whose timestamps are kept), stored with checkpoints so an edited 'file
+    time fix' table invalidates them
+    """
+    return {
+        name: settings_profile.end_time(file_time_fix, name) for name in subject_files
+    }
+
+
+def save_checkpoint(path, record):
+    """
+    atomically persist a checkpoint record
+
+    the record is pickled to a temporary file in the checkpoint folder and
+    then moved into place, so an interrupted run never leaves a partially
+    written checkpoint behind
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), suffix=".tmp", delete=False
+    ) as tmp_file:
+        pickle.dump(record, tmp_file, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_file.name, path)
+
+
+def load_checkpoint(path):
+    """
+    load a checkpoint record, returns None if missing or unreadable
+    """
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def analyse_subject(
+    subject_id,
+    subject_file_list,
+    settings,
+    file_time_fix,
+    night_duration_bins,
+    output_file_path,
+):
+    """
+    runs the pipeline for one subject and writes its night workbook, in this
+    process or in a scheduler worker process
+
+    returns the duration bin, output summary and bouts of the subject
+    """
+    logger = logging.getLogger()
+    if not logger.handlers:
+        # fresh worker processes log to the run's log file
+        logger.setLevel(logging.DEBUG)
+        file_handler = logging.FileHandler(os.path.join(output_file_path, "log.log"))
+        file_handler.setFormatter(
+            logging.Formatter(
+                "%(asctime)s | %(processName)s | %(levelname)-5.5s |  %(message)s"
+            )
         )
-        pd.DataFrame(subdesat_bouts).to_excel(writer, sheet_name="subdesat bouts")
-        pd.DataFrame(sustained_subdesat_bouts).to_excel(
-            writer, sheet_name="sustained subdesat bouts"
+        logger.addHandler(file_handler)
+    subject_result = process_subject(
+        subject_id,
+        subject_file_list,
+        settings,
+        file_time_fix,
+        night_duration_bins,
+        logger,
+    )
+    write_night_output(subject_id, subject_result, output_file_path, settings)
+    return {
+        "duration_bin": subject_result["duration_bin"],
+        "output_summary": subject_result["output_summary"],
+        "bouts": subject_result["bouts"],
+    }
+
+
+# %% define classes
+
+
+# %% define main ## TODO !!! currently script, need to reframe as function
+def main(
+    input_file_path=None,
+    output_file_path=None,
+    settings_file_path=None,
+    logger=None,
+    resume=False,
+    cache_path=None,
+    on_subject_done=None,
+):
+    """
+    runs the analysis for every subject in input_file_path
+
+    on_subject_done, if given, is called with (subject_id, duration bin,
+    output_summary) as soon as each subject's result is available
+    """
+    # %%
+    # get input files
+    if not input_file_path:
+        input_file_path = "./sample data/pooled/"
+
+    # get settings file
+    if not settings_file_path:
+        settings_file_path = "./sample settings.xlsx"
+
+    # get output path
+    if not output_file_path:
+        output_file_path = "./sample output/"
+
+    # prepare logger
+    if not logger:
+        logger = logging.getLogger()
+        logger.setLevel(logging.DEBUG)
+        log_formatter = logging.Formatter(
+            "%(asctime)s | %(threadName)s | %(levelname)-5.5s |  %(message)s"
         )
-        pd.DataFrame(output_summary, index=[0]).to_excel(writer, sheet_name="summary")
-        writer.close()
+        file_handler = logging.FileHandler(os.path.join(output_file_path, "log.log"))
+        file_handler.setFormatter(log_formatter)
+        logger.addHandler(file_handler)
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(log_formatter)
+        logger.addHandler(console_handler)
+    else:
+        logger.info("using external logger")
 
-        logger.info("annotated night time series saved")
+    logger.info("log started")
+    logger.info(f"input_file_path:{input_file_path}")
+    logger.info(f"output_file_path:{output_file_path}")
+    logger.info(f"settings_file_path:{settings_file_path}")
+    if resume:
+        logger.info("resuming - completed subjects will be loaded from checkpoints")
+
+    # %% collect data from file paths
+    logger.info("collecting settings")
+    settings, file_time_fix = read_settings(settings_file_path)
+
+    # %% list of files in input_file_path
+    file_dict = collect_subject_files(
+        input_file_path,
+        logger,
+        include=settings.get("include patterns"),
+        exclude=settings.get("exclude patterns"),
+        cache_path=cache_path,
+    )
+    if cache_path:
+        logger.info(f"using result cache: {cache_path}")
+        hash_index = cache.load_hash_index(cache_path)
+
+    # %% populate night duration bins
+    output_dict = {}
+    output_dict["night_duration_bins"] = build_night_duration_bins(settings, logger)
+    # %% loop through file list
+    logger.info("looping through subjects in dataset")
+    failed_subjects = {}
+    subject_records = {}
+    pending_subjects = {}
+    cache_keys = {}
+    for subject_id, subject_file_list in file_dict.items():
+        subject_files = [os.path.basename(f) for f in subject_file_list]
+        done_path = checkpoint_path(output_file_path, subject_id, "done")
+
+        if resume:
+            checkpoint = load_checkpoint(done_path)
+            if (
+                checkpoint
+                and checkpoint["files"] == subject_files
+                and checkpoint["settings"] == settings
+                and checkpoint.get("end times")
+                == file_end_times(subject_files, file_time_fix)
+            ):
+                subject_records[subject_id] = checkpoint
+                logger.info(f"{subject_id} already completed, loaded from checkpoint")
+                if on_subject_done:
+                    on_subject_done(
+                        subject_id,
+                        checkpoint["duration_bin"],
+                        checkpoint["output_summary"],
+                    )
+                continue
+            elif checkpoint:
+                logger.info(
+                    f"{subject_id} checkpoint does not match current files, settings or file time fix, rerunning"
+                )
+
+        if cache_path:
+            cache_keys[subject_id] = cache.subject_fingerprint(
+                subject_file_list, settings, file_time_fix, hash_index
+            )
+            cached = cache.load_result(cache_path, cache_keys[subject_id])
+            if cached and cache.restore_workbook(
+                cache_path,
+                cache_keys[subject_id],
+                os.path.join(output_file_path, f"{subject_id}_night.xlsx"),
+                night_trace.trace_path(output_file_path, subject_id),
+            ):
+                subject_records[subject_id] = {
+                    "subject_id": subject_id,
+                    "files": subject_files,
+                    "settings": settings,
+                    "end times": file_end_times(subject_files, file_time_fix),
+                    **cached,
+                }
+                save_checkpoint(done_path, subject_records[subject_id])
+                logger.info(f"{subject_id} unchanged, loaded from result cache")
+                if on_subject_done:
+                    on_subject_done(
+                        subject_id, cached["duration_bin"], cached["output_summary"]
+                    )
+                continue
+
+        pending_subjects[subject_id] = subject_file_list
+
+    # %% analyse the remaining subjects, largest first
+    history_path = os.path.join(output_file_path, scheduler.HISTORY_FILE)
+    history = scheduler.load_history(history_path)
+    for (
+        subject_id,
+        subject_result,
+        error,
+        error_traceback,
+    ) in scheduler.run_largest_first(
+        pending_subjects,
+        analyse_subject,
+        args=(
+            settings,
+            file_time_fix,
+            list(output_dict["night_duration_bins"].keys()),
+            output_file_path,
+        ),
+        max_workers=int(settings.get("parallel workers", 1)),
+        memory_budget_mb=settings.get("memory budget (MB)"),
+        history=history,
+        logger=logger,
+    ):
+        subject_files = [os.path.basename(f) for f in pending_subjects[subject_id]]
+        done_path = checkpoint_path(output_file_path, subject_id, "done")
+        failed_path = checkpoint_path(output_file_path, subject_id, "failed")
+        if error:
+            failed_subjects[subject_id] = {
+                "files": ",".join(subject_files),
+                "error": error,
+            }
+            logger.error(f"{subject_id} failed - {error}")
+            logger.debug(error_traceback)
+            save_checkpoint(
+                failed_path,
+                {
+                    "subject_id": subject_id,
+                    "files": subject_files,
+                    "error": error,
+                    "traceback": error_traceback,
+                },
+            )
+            continue
+
+        logger.info(f"{subject_id} annotated night time series saved")
+        subject_records[subject_id] = {
+            "subject_id": subject_id,
+            "files": subject_files,
+            "settings": settings,
+            "end times": file_end_times(subject_files, file_time_fix),
+            **subject_result,
+        }
+        save_checkpoint(done_path, subject_records[subject_id])
+        if os.path.exists(failed_path):
+            os.remove(failed_path)
+        if on_subject_done:
+            on_subject_done(
+                subject_id,
+                subject_result["duration_bin"],
+                subject_result["output_summary"],
+            )
+        if cache_path:
+            cache.store_result(
+                cache_path,
+                cache_keys[subject_id],
+                subject_result,
+                night_workbook=os.path.join(
+                    output_file_path, f"{subject_id}_night.xlsx"
+                ),
+                night_trace=night_trace.trace_path(output_file_path, subject_id),
+                size_limit_mb=settings.get(
+                    "cache size (MB)", cache.DEFAULT_CACHE_SIZE_MB
+                ),
+            )
+    scheduler.save_history(history_path, history)
+
+    if cache_path:
+        cache.save_hash_index(cache_path, hash_index)
+
+    # subjects are reported in input order whatever order they finished in
+    subject_records = {
+        subject_id: subject_records[subject_id]
+        for subject_id in file_dict
+        if subject_id in subject_records
+    }
+    for subject_id, record in subject_records.items():
+        output_dict["night_duration_bins"][record["duration_bin"]][subject_id] = record[
+            "output_summary"
+        ]
 
     # %% create output file
     writer = pd.ExcelWriter(
@@ -1280,10 +1685,62 @@ def main(
         pd.DataFrame(value).transpose().to_excel(
             writer, sheet_name=f"{key} hour night session"
         )
+    # cohort means of every numeric metric with bootstrap confidence intervals
+    bootstrap_resamples = int(
+        settings.get("bootstrap resamples", bootstrap.DEFAULT_RESAMPLES)
+    )
+    if bootstrap_resamples > 0:
+        for key, value in output_dict["night_duration_bins"].items():
+            if not value:
+                continue
+            bootstrap.cohort_summary(
+                value,
+                resamples=bootstrap_resamples,
+                seed=settings.get("bootstrap seed"),
+                confidence=settings.get(
+                    "bootstrap confidence (%)", bootstrap.DEFAULT_CONFIDENCE
+                ),
+            ).to_excel(writer, sheet_name=f"{key} hour cohort summary")
+    if failed_subjects:
+        pd.DataFrame(failed_subjects).transpose().to_excel(
+            writer, sheet_name="failed subjects"
+        )
     writer.close()
     logger.info("Aggregate Output Saved")
 
+    bout_path, subject_path = cohort.write_cohort_tables(
+        subject_records, output_file_path
+    )
+    logger.info(f"cohort bout table saved: {os.path.basename(bout_path)}")
+    if failed_subjects:
+        logger.warning(
+            f"{len(failed_subjects)} subject(s) failed: {', '.join(failed_subjects)}"
+        )
+
 
 # %% run main
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Sleep Apnea Saturation Analysis")
+    parser.add_argument("-i", "--input", help="folder containing recording csv files")
+    parser.add_argument("-o", "--output", help="folder for output files")
+    parser.add_argument("-s", "--settings", help="settings xlsx file")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip subjects already completed in a previous run to the same output folder",
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=cache.DEFAULT_CACHE_PATH,
+        help="reuse results of unchanged subjects from a result cache folder "
+        + f"(default folder: {cache.DEFAULT_CACHE_PATH})",
+    )
+    args = parser.parse_args()
+    main(
+        input_file_path=args.input,
+        output_file_path=args.output,
+        settings_file_path=args.settings,
+        resume=args.resume,
+        cache_path=args.cache,
+    )
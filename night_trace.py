@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+compact night traces for the GUI trace viewer
+
+every subject's fixed spo2 and pulse are saved with the scored bouts and the
+artifact and gap regions as {subject_id}_trace.npz, a few percent of the size
+of the night workbook. the viewer only draws what fits on screen: the samples
+in view are reduced to the minimum and maximum of each pixel column, so a
+multi-day recording is drawn from a few thousand points at any zoom
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import os
+import numpy as np
+
+# %% define constants
+TRACE_SUFFIX = "_trace.npz"
+TRACE_COLUMNS = {"spo2": "fixed_spo2", "pulse": "fixed_pulse"}
+
+# shaded regions - name: bout list in the subject's bouts, or a night_df
+# column whose True runs mark the region
+BOUT_REGIONS = {
+    "desat": "desat bouts",
+    "sustained desat": "sustained desat bouts",
+}
+MASK_REGIONS = {
+    "severe desat": "min_dur_sev_desat",
+    "artifact": "spo2_or_pulse_NA_filter",
+}
+REGIONS = list(BOUT_REGIONS) + list(MASK_REGIONS) + ["gaps"]
+
+
+# %% define functions
+def trace_path(output_file_path, subject_id):
+    """
+    location of a subject's trace file
+    """
+    return os.path.join(output_file_path, f"{subject_id}{TRACE_SUFFIX}")
+
+
+def mask_runs(t, mask):
+    """
+    (start, stop) times of the runs of True in mask, as an (n, 2) array
+    """
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1) - 1
+    return np.column_stack([t[starts], t[stops]])
+
+
+def build_trace(subject_result):
+    """
+    arrays of the trace file of a processed subject - times are seconds from
+    the first night sample, recording gaps are broken by a NaN sample
+    """
+    night_df = subject_result["night_df"]
+    ts = night_df["ts"].to_numpy().astype("datetime64[ms]")
+    start = ts[0] if len(ts) else np.datetime64("NaT", "ms")
+    t = (ts - start) / np.timedelta64(1, "s")
+    gaps = night_df["gaps"].to_numpy().astype(bool)
+
+    # a gap sample ends the gap since the previous sample
+    gap_index = np.flatnonzero(gaps[1:]) + 1
+    trace = {
+        "start": np.array(start),
+        "t": np.insert(t, gap_index, (t[gap_index - 1] + t[gap_index]) / 2),
+    }
+    for name, column in TRACE_COLUMNS.items():
+        values = night_df[column].to_numpy().astype(np.float32)
+        trace[name] = np.insert(values, gap_index, np.nan)
+
+    for name, bout_type in BOUT_REGIONS.items():
+        bouts = subject_result["bouts"][bout_type]
+        trace[name] = np.array(
+            [
+                [
+                    (np.datetime64(bout[edge], "ms") - start) / np.timedelta64(1, "s")
+                    for edge in ["start", "stop"]
+                ]
+                for bout in bouts
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+    for name, column in MASK_REGIONS.items():
+        trace[name] = mask_runs(t, night_df[column].to_numpy().astype(bool))
+    trace["gaps"] = np.column_stack([t[gap_index - 1], t[gap_index]])
+    return trace
+
+
+def write_trace(path, subject_result):
+    """
+    saves a processed subject's trace file
+    """
+    np.savez_compressed(path, **build_trace(subject_result))
+
+
+def load_trace(path):
+    """
+    loads a trace file into a dict of arrays
+    """
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def decimate(t, y, t0, t1, columns):
+    """
+    points to draw y over [t0, t1] on a plot columns pixels wide
+
+    samples in view (plus one either side, so lines reach the plot edges) are
+    returned as they are when there are few of them, otherwise each pixel
+    column is reduced to its minimum and maximum, so every peak and trough
+    stays visible. empty columns become NaN, which breaks the line
+    """
+    first = max(np.searchsorted(t, t0, side="right") - 1, 0)
+    stop = min(np.searchsorted(t, t1, side="left") + 1, len(t))
+    t = t[first:stop]
+    y = y[first:stop]
+    if len(t) <= 2 * columns or t1 <= t0:
+        return t, y
+
+    column = np.clip(((t - t0) / (t1 - t0) * columns).astype(np.int64), -1, columns)
+    bin_starts = np.concatenate([[0], np.flatnonzero(np.diff(column)) + 1])
+    bin_columns = column[bin_starts]
+    with np.errstate(invalid="ignore"):
+        low = np.fmin.reduceat(y, bin_starts)
+        high = np.fmax.reduceat(y, bin_starts)
+    x = t0 + (bin_columns + 0.5) * (t1 - t0) / columns
+
+    # min then max in every column, NaN after a column followed by a gap
+    broken = np.concatenate([np.diff(bin_columns) > 1, [False]])
+    points = np.column_stack([low, high, np.where(broken, np.nan, high)])
+    xs = np.column_stack([x, x, x])
+    keep = np.column_stack([np.ones_like(broken), np.ones_like(broken), broken])
+    return xs[keep], points[keep]
+
+
+def value_range(y):
+    """
+    (min, max) of the finite values of y, (0, 1) when there are none
+    """
+    finite = y[np.isfinite(y)]
+    if not len(finite):
+        return 0.0, 1.0
+    return float(finite.min()), float(finite.max())
+
+
+def regions_in_view(regions, t0, t1):
+    """
+    the (start, stop) rows of regions that overlap [t0, t1]
+    """
+    if not len(regions):
+        return regions
+    return regions[(regions[:, 1] >= t0) & (regions[:, 0] <= t1)]
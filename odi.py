@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+oxygen desaturation index (ODI) event detection
+
+an ODI event is a drop of at least 3% (or 4%) spo2 below a moving baseline,
+the mean of the valid samples in the preceding baseline window. the
+baseline for every sample comes from cumulative sums, so each window costs
+O(1) regardless of its length. windows restart after recording gaps,
+events never extend across one, and artifact samples are excluded from
+both the baseline and the events
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import pandas as pd
+import numpy as np
+
+# %% define constants
+ODI_DROPS = [3, 4]
+DEFAULT_BASELINE_WINDOW = 120
+
+
+# %% define functions
+def moving_baseline(night_df, window_sec):
+    """
+    mean spo2 of the valid (non-artifact) samples in the window
+    [t - window_sec, t) before each sample, restarted at recording gaps
+
+    returns (baseline, number of valid samples in the window)
+    """
+    ts = night_df["ts"].to_numpy(dtype="datetime64[ns]").astype("int64")
+    valid = ~night_df["spo2_NA_filter"].to_numpy(dtype=bool)
+    spo2 = np.where(valid, night_df["spo2"].to_numpy(dtype=float), 0.0)
+    gaps = night_df["gaps"].to_numpy(dtype=bool)
+
+    positions = np.arange(ts.size)
+    # first sample of the gap-free segment each sample belongs to
+    segment_start = np.maximum.accumulate(np.where(gaps, positions, 0))
+    window_start = np.maximum(
+        np.searchsorted(ts, ts - int(window_sec * 1e9), side="left"), segment_start
+    )
+
+    spo2_sum = np.concatenate([[0.0], np.cumsum(spo2)])
+    valid_count = np.concatenate([[0], np.cumsum(valid)])
+    count = valid_count[positions] - valid_count[window_start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        baseline = (spo2_sum[positions] - spo2_sum[window_start]) / count
+    return np.where(count > 0, baseline, np.nan), count
+
+
+def detect_odi_events(night_df, drop, settings, baseline=None):
+    """
+    finds runs of valid samples at least 'drop' % below the moving baseline
+    that last at least the 'odi minimum event duration (sec)' setting
+    (default: the minimum desat interval)
+
+    returns a list of event dicts in the style of the bout dicts
+    """
+    if baseline is None:
+        baseline, _ = moving_baseline(
+            night_df,
+            settings.get("odi baseline window (sec)", DEFAULT_BASELINE_WINDOW),
+        )
+    minimum_duration = settings.get(
+        "odi minimum event duration (sec)", settings["minimum desat interval (sec)"]
+    )
+
+    ts = night_df["ts"].to_numpy(dtype="datetime64[ns]")
+    spo2 = night_df["spo2"].to_numpy(dtype=float)
+    valid = ~(
+        night_df["spo2_NA_filter"].to_numpy(dtype=bool)
+        | night_df["gaps"].to_numpy(dtype=bool)
+    )
+    with np.errstate(invalid="ignore"):
+        dropped = valid & (spo2 <= baseline - drop)
+
+    change = np.diff(np.concatenate([[0], dropped.astype(np.int8), [0]]))
+    run_starts = np.flatnonzero(change == 1)
+    run_ends = np.flatnonzero(change == -1)  # first sample after the run
+    if run_starts.size == 0:
+        return []
+
+    # an event ends one sample interval after its last sample, capped at the
+    # next sample - a run that ends at a recording gap stops before the gap
+    sample_interval = np.timedelta64(
+        int(settings["expected_sampling_rate (sec)"] * 1e9), "ns"
+    )
+    stops = ts[run_ends - 1] + sample_interval
+    following = run_ends < ts.size
+    stops[following] = np.minimum(stops[following], ts[run_ends[following]])
+    durations = (stops - ts[run_starts]) / np.timedelta64(1, "s")
+    keep = durations >= minimum_duration
+    run_starts, run_ends, stops, durations = (
+        run_starts[keep],
+        run_ends[keep],
+        stops[keep],
+        durations[keep],
+    )
+    if run_starts.size == 0:
+        return []
+
+    # gather the samples of all events into one array and reduce each
+    # contiguous event segment in a single pass
+    run_lengths = run_ends - run_starts
+    offsets = np.concatenate([[0], np.cumsum(run_lengths)[:-1]])
+    event_samples = spo2[
+        np.arange(run_lengths.sum()) + np.repeat(run_starts - offsets, run_lengths)
+    ]
+    low_spo2 = np.minimum.reduceat(event_samples, offsets)
+    mean_spo2 = np.add.reduceat(event_samples, offsets) / run_lengths
+
+    return [
+        {
+            "start": pd.Timestamp(ts[start]),
+            "stop": pd.Timestamp(stop),
+            "duration": duration,
+            "baseline_spo2": baseline[start],
+            "low_spo2": low,
+            "mean_spo2": mean,
+            "max_drop": baseline[start] - low,
+        }
+        for start, stop, duration, low, mean in zip(
+            run_starts, stops, durations, low_spo2, mean_spo2
+        )
+    ]
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+polars backend for the per-subject pipeline (setting "backend": "polars")
+
+ingestion, timestamp fixes, fragment merging, artifact and gap flags, night
+windowing, desat flagging, the minimum and sustained duration filters and the
+bout start/stop markers are expressed as one lazy polars query, which polars
+optimizes and runs multi-threaded. the collected frame has the columns of
+main.annotate_night's night_df, so bouts and the output summary are scored
+from it exactly as for the pandas backend
+
+the centered time-based rolling windows of pandas, (t - w/2, t + w/2], are
+rolling windows with offset -w/2 and closed="right"
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import datetime
+
+import ingest
+import settings_profile
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# %% define constants
+FLAG_COLUMNS = {
+    "desat": "desat",
+    "sub desat": "sub_desat",
+    "sev desat": "sev_desat",
+}
+
+
+# %% define functions
+def require_polars():
+    """
+    raises ImportError with install instructions when polars is missing
+    """
+    if pl is None:
+        raise ImportError(
+            'the "polars" backend needs polars - pip install polars, or set '
+            + '"backend" to "pandas"'
+        )
+
+
+def scan_fragment(f, fragment, file_time_fix):
+    """
+    lazy frame of one recording file with its 'ts' column (fixed when the
+    file has a verified end time) and its position in the fragment list
+    """
+    lf = pl.scan_csv(
+        f,
+        schema_overrides={column: pl.Int16 for column in ingest.RECORDING_COLUMNS},
+    ).select(list(ingest.RECORDING_COLUMNS))
+    lf = lf.with_columns(
+        pl.datetime(
+            pl.col("year"),
+            pl.col("month"),
+            pl.col("day"),
+            pl.col("hour"),
+            pl.col("minute"),
+            pl.col("second"),
+            time_unit="ns",
+        ).alias("ts")
+    )
+    fix = settings_profile.end_time(file_time_fix, f)
+    if fix:
+        # as pd.date_range(end=..., periods=n, freq=first sample step)
+        end_ts = pl.datetime(
+            pl.col("year").last(),
+            pl.col("month").last(),
+            pl.col("day").last(),
+            fix[0],
+            fix[1],
+            time_unit="ns",
+        )
+        step = pl.col("ts").get(1) - pl.col("ts").get(0)
+        lf = lf.with_columns(
+            (end_ts - step * (pl.len() - 1 - pl.int_range(pl.len()))).alias("ts")
+        )
+    return lf.with_columns(
+        pl.lit(fragment).alias("fragment"),
+        pl.col("ts").min().alias("fragment start"),
+    )
+
+
+def centered(expression, seconds):
+    """
+    expression over the pandas-style centered time window of 'seconds'
+    """
+    return expression.rolling(
+        index_column="ts",
+        period=datetime.timedelta(seconds=seconds),
+        offset=-datetime.timedelta(seconds=seconds) / 2,
+        closed="right",
+    )
+
+
+def duration_filter(flag, seconds, prefix):
+    """
+    the three stages of the duration filter of a flag column, as
+    main.annotate_night's rolling min then max and the bout start markers
+    """
+    name = FLAG_COLUMNS[flag]
+    trimmed = f"{prefix}_{name}_trimmed"
+    filtered = f"{prefix}_{name}"
+    return [
+        centered(pl.col(flag).cast(pl.Float64).min(), seconds).alias(trimmed),
+        centered(pl.col(trimmed).max(), seconds).alias(filtered),
+        pl.col(filtered)
+        .cast(pl.Int64)
+        .diff()
+        .cast(pl.Float64)
+        .alias(f"{filtered}_bout_start"),
+    ]
+
+
+def fragment_checks(fragments):
+    """
+    lazy per-fragment sample counts, out of range flags and invalid date
+    flags, the checks ingest.read_recording applies
+    """
+    return fragments.group_by("fragment").agg(
+        pl.len().alias("samples"),
+        *[
+            ((pl.col(column) < low) | (pl.col(column) > high)).any().alias(column)
+            for column, (low, high) in ingest.RECORDING_RANGES.items()
+        ],
+        pl.col("ts").is_null().any().alias("invalid dates"),
+    )
+
+
+def night_query(subject_file_list, settings, file_time_fix):
+    """
+    lazy queries of the annotated night frame of a subject and of the
+    per-fragment checks, which share the scans of the recording files
+    """
+    fragments = pl.concat(
+        [
+            scan_fragment(f, fragment, file_time_fix)
+            for fragment, f in enumerate(subject_file_list)
+        ]
+    )
+    # fragments ordered by their first timestamp, repeated timestamps keep
+    # the sample of the earlier fragment (ingest.merge_fragments)
+    merged = (
+        fragments.sort(["ts", "fragment start", "fragment"], maintain_order=True)
+        .unique(subset="ts", keep="first", maintain_order=True)
+        .drop("fragment", "fragment start")
+    )
+
+    spo2_na = pl.col("spo2") == 500
+    pulse_na = pl.col("pulse") == 500
+    step = pl.col("ts").diff().dt.total_nanoseconds() / 1e9
+    first_row = pl.int_range(pl.len()) == 0
+    annotated = merged.with_columns(
+        spo2_na.alias("spo2_NA_filter"),
+        pulse_na.alias("pulse_NA_filter"),
+        (spo2_na & pulse_na).alias("spo2_and_pulse_NA_filter"),
+        (spo2_na | pulse_na).alias("spo2_or_pulse_NA_filter"),
+        # the first sample has no interval of its own and takes the next one
+        pl.when(first_row).then(step.get(1)).otherwise(step).alias("interval"),
+        pl.when(first_row)
+        .then(False)
+        .otherwise(step > settings["expected_sampling_rate (sec)"])
+        .alias("gaps"),
+        # artifact values take the next valid value (or the last one)
+        *[
+            pl.when(pl.col(column) == 500)
+            .then(None)
+            .otherwise(pl.col(column))
+            .cast(pl.Float64)
+            .backward_fill()
+            .forward_fill()
+            .alias(f"fixed_{column}")
+            for column in ["spo2", "pulse"]
+        ],
+    ).with_columns(pl.col("fixed_spo2").diff().alias("diff_spo2"))
+
+    night_start, night_stop = settings_profile.night_window(settings)
+    time_of_day = pl.col("ts").dt.time()
+    if night_start < night_stop:
+        night = (time_of_day >= night_start) & (time_of_day <= night_stop)
+    else:
+        night = (time_of_day >= night_start) | (time_of_day <= night_stop)
+
+    # -- desats that occur after recording gaps are rescored as False to
+    # -- prevent gap inclusion in minimum or sustained bouts
+    spo2 = pl.col("fixed_spo2")
+    not_gap = ~pl.col("gaps")
+    night_lf = (
+        annotated.with_columns(night.alias("night"))
+        .filter(pl.col("night"))
+        .with_columns(
+            ((spo2 < settings["desat threshold"]) & not_gap).alias("desat"),
+            (
+                (spo2 <= settings["desat subthreshold"])
+                & (spo2 >= settings["desat threshold"])
+                & not_gap
+            ).alias("sub desat"),
+            ((spo2 < settings["desat severe threshold"]) & not_gap).alias("sev desat"),
+            ((pl.col("diff_spo2") <= settings["desat spike"]) & not_gap).alias(
+                "spike desat"
+            ),
+        )
+    )
+
+    # the stages of each filter depend on the previous one, the filters of
+    # the three flags run side by side
+    for prefix, setting in [
+        ("min_dur", "minimum desat interval (sec)"),
+        ("sustained_dur", "sustained desat interval (sec)"),
+    ]:
+        stages = [
+            duration_filter(flag, settings[setting], prefix) for flag in FLAG_COLUMNS
+        ]
+        for stage in range(3):
+            night_lf = night_lf.with_columns([columns[stage] for columns in stages])
+    return night_lf, fragment_checks(fragments)
+
+
+def column_order(columns):
+    """
+    night_df column order of main.annotate_night
+    """
+    order = []
+    for prefix in ["min_dur", "sustained_dur"]:
+        for name in FLAG_COLUMNS.values():
+            order += [f"{prefix}_{name}_trimmed", f"{prefix}_{name}"]
+        order += [f"{prefix}_{name}_bout_start" for name in FLAG_COLUMNS.values()]
+    leading = [column for column in columns if column not in order]
+    return leading + order
+
+
+def annotate_night(subject_id, subject_file_list, settings, file_time_fix, logger):
+    """
+    polars counterpart of main.annotate_night - returns the annotated
+    night_df (a pandas dataframe) and the list of recording files
+
+    files that fail to parse are read again with ingest.read_recording,
+    which raises the RecordingFormatError naming the file and line
+    """
+    require_polars()
+    logger.info(
+        f"working on: {subject_id} - {','.join(subject_file_list)} (polars backend)"
+    )
+    for f in subject_file_list:
+        ingest.check_header(f)
+    night_lf, checks_lf = night_query(subject_file_list, settings, file_time_fix)
+    try:
+        night_df, checks = pl.collect_all([night_lf, checks_lf])
+    except pl.exceptions.PolarsError:
+        # malformed rows - ingest reports the file and line
+        for f in subject_file_list:
+            ingest.read_recording(f)
+        raise
+    flags = ["invalid dates"] + list(ingest.RECORDING_RANGES)
+    failed = checks.filter(
+        (pl.col("samples") < 2) | pl.any_horizontal(*[pl.col(c) for c in flags])
+    )
+    for fragment in sorted(failed["fragment"].to_list()):
+        ingest.read_recording(subject_file_list[fragment])
+
+    night_df = night_df.select(column_order(night_df.columns)).to_pandas()
+    return night_df, list(subject_file_list)
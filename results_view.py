@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+results table for the SASA GUI
+
+subjects' output summaries are added to a table model as they finish. the
+view only asks the model for the cells on screen, and sorting and filtering
+are done by a proxy model over all of the rows, so the table stays
+responsive for hundreds of subjects with ~100 metric columns. only Qt is
+imported here, keeping GUI startup light
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import math
+import numbers
+from PySide6 import QtWidgets
+from PySide6.QtCore import (
+    QAbstractTableModel,
+    QModelIndex,
+    QObject,
+    QSortFilterProxyModel,
+    Qt,
+    Signal,
+)
+
+# %% define constants
+LEADING_COLUMNS = ["subject", "duration bin"]
+
+
+# %% define classes
+class ResultsTableModel(QAbstractTableModel):
+    """
+    one row per finished subject, one column per output summary metric
+
+    the display role gives formatted text and the user role the raw value,
+    which the proxy model sorts by
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.columns = list(LEADING_COLUMNS)
+        self.column_index = {column: i for i, column in enumerate(self.columns)}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        value = self.rows[index.row()].get(self.columns[index.column()])
+        if role == Qt.DisplayRole:
+            return format_value(value)
+        if role == Qt.UserRole:
+            return sort_value(value)
+        if role == Qt.TextAlignmentRole and isinstance(value, numbers.Number):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.columns[section]
+        return section + 1
+
+    def add_result(self, subject_id, duration_bin, output_summary):
+        """
+        adds a finished subject, new metrics become new columns
+        """
+        row = {"subject": subject_id, "duration bin": duration_bin, **output_summary}
+        new_columns = [column for column in row if column not in self.column_index]
+        if new_columns:
+            first = len(self.columns)
+            self.beginInsertColumns(QModelIndex(), first, first + len(new_columns) - 1)
+            for column in new_columns:
+                self.column_index[column] = len(self.columns)
+                self.columns.append(column)
+            self.endInsertColumns()
+
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows))
+        self.rows.append(row)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.rows = []
+        self.columns = list(LEADING_COLUMNS)
+        self.column_index = {column: i for i, column in enumerate(self.columns)}
+        self.endResetModel()
+
+
+class ResultSignals(QObject):
+    """
+    carries finished subjects from the analysis thread to the GUI thread
+    """
+
+    subject_done = Signal(str, object, object)
+
+    def emit_result(self, subject_id, duration_bin, output_summary):
+        self.subject_done.emit(subject_id, duration_bin, output_summary)
+
+
+class ResultsPanel(QtWidgets.QWidget):
+    """
+    filter box over a sortable results table
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.model = ResultsTableModel(self)
+        self.proxy = QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setSortRole(Qt.UserRole)
+        self.proxy.setFilterKeyColumn(0)
+        self.proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+
+        self.filter_edit = QtWidgets.QLineEdit(self)
+        self.filter_edit.setPlaceholderText("filter subjects")
+        self.filter_edit.textChanged.connect(self.proxy.setFilterWildcard)
+
+        self.table = QtWidgets.QTableView(self)
+        self.table.setModel(self.proxy)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(-1, Qt.AscendingOrder)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table.setHorizontalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self.table.verticalHeader().setDefaultSectionSize(20)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.filter_edit)
+        layout.addWidget(self.table)
+
+        self.signals = ResultSignals(self)
+        self.signals.subject_done.connect(self.model.add_result)
+
+
+# %% define functions
+def format_value(value):
+    """
+    display text of a summary value
+    """
+    if value is None:
+        return ""
+    if isinstance(value, numbers.Integral) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, numbers.Real):
+        return "" if math.isnan(value) else f"{value:.4g}"
+    return str(value)
+
+
+def sort_value(value):
+    """
+    sort key of a summary value - numbers sort numerically with missing
+    values first, everything else sorts as text
+    """
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        return -math.inf if math.isnan(value) else float(value)
+    if value is None:
+        return -math.inf
+    return str(value)
@@ -10,6 +10,7 @@ License: MIT-X
 
 GUI wrapper for SASA
 """
+
 __version__ = "0.1.3"
 __license__ = "MIT License"
 __license_text__ = """
@@ -37,15 +38,41 @@ SOFTWARE.
 """
 
 # %% import libraries
-import main
-
+# the analysis stack (main, pandas, numpy, excel writers) is imported lazily
+# so the window appears with only Qt loaded - see warm_import
+import importlib
 import logging
 import os
 from PySide6 import QtWidgets
 from PySide6.QtUiTools import QUiLoader
-from PySide6.QtCore import QFile, QObject, QThread, Signal, Slot
+from PySide6.QtCore import QFile, QObject, QThread, Qt, Signal, Slot
 import sys
 
+from results_view import ResultsPanel
+from trace_view import TracePanel
+
+
+def warm_import():
+    """
+    imports the analysis stack used by a run
+
+    main pulls in pandas and numpy, the excel engines are otherwise only
+    imported by pandas on first write. safe to call from several threads,
+    later calls return the already imported module
+    """
+    main = importlib.import_module("main")
+    importlib.import_module("openpyxl")
+    importlib.import_module("xlsxwriter")
+    return main
+
+
+def run_analysis(**kwargs):
+    """
+    runs main.main, importing the analysis stack first if the background
+    warm up has not finished yet
+    """
+    warm_import().main(**kwargs)
+
 
 class GUI_Logger:
     def __init__(
@@ -178,6 +205,14 @@ class WorkerThread(QThread):
         self.func(*self.args, **self.kwargs, logger=self.logger)
 
 
+class WarmupThread(QThread):
+    loaded = Signal(str)
+
+    def run(self):
+        main = warm_import()
+        self.loaded.emit(main.__version__)
+
+
 class MyLog(QObject):
     signal = Signal(str)
 
@@ -209,7 +244,8 @@ class MainWindow(QtWidgets.QMainWindow):
         for att, val in ui.__dict__.items():
             setattr(self, att, val)
 
-        self.ui.setWindowTitle(f"SASA - {main.__version__}")
+        self.ui.setWindowTitle(f"SASA - {__version__}")
+        self.version_info = {"GUI": __version__, "MAIN": None}
 
         self.pushButton_input.clicked.connect(self.action_input)
         self.pushButton_output.clicked.connect(self.action_output)
@@ -223,6 +259,26 @@ class MainWindow(QtWidgets.QMainWindow):
         self.output_path = None
         self.settings_path = None
 
+        # subjects' summaries are listed here as each one finishes
+        self.results_panel = ResultsPanel()
+        self.results_dock = QtWidgets.QDockWidget("Results", self.ui)
+        self.results_dock.setWidget(self.results_panel)
+        self.ui.addDockWidget(Qt.BottomDockWidgetArea, self.results_dock)
+
+        # night traces of the output folder, listed as subjects finish
+        self.trace_panel = TracePanel()
+        self.trace_dock = QtWidgets.QDockWidget("Traces", self.ui)
+        self.trace_dock.setWidget(self.trace_panel)
+        self.ui.addDockWidget(Qt.BottomDockWidgetArea, self.trace_dock)
+        self.ui.tabifyDockWidget(self.results_dock, self.trace_dock)
+        self.results_dock.raise_()
+        self.results_panel.signals.subject_done.connect(self.trace_panel.refresh)
+
+        # import the analysis stack in the background while folders are picked
+        self.warmup_worker = WarmupThread()
+        self.warmup_worker.loaded.connect(self.analysis_loaded)
+        self.warmup_worker.start()
+
     def action_input(self):
         self.input_path = QtWidgets.QFileDialog.getExistingDirectory(
             None, "Select Input Folder"
@@ -236,10 +292,14 @@ class MainWindow(QtWidgets.QMainWindow):
         )
         self.logger.info(f"output path set: {self.output_path}")
         self.label_output.setText(f"Output Path: {self.output_path}")
+        self.trace_panel.set_output_path(self.output_path)
 
     def action_settings(self):
         self.settings_path = QtWidgets.QFileDialog.getOpenFileName(
-            None, "Select Settings File", "", "Excel Files (*.xlsx);;All Files (*)"
+            None,
+            "Select Settings File",
+            "",
+            "Settings Files (*.xlsx *.json *.toml);;All Files (*)",
         )[0]
         self.logger.info(f"settings path set: {self.settings_path}")
         self.label_settings.setText(f"Settings File: {self.settings_path}")
@@ -247,11 +307,13 @@ class MainWindow(QtWidgets.QMainWindow):
     def action_run(self):
         if self.input_path and self.output_path and self.settings_path:
             self.logger.info("launching run")
+            self.results_panel.model.clear()
             self.run_worker = WorkerThread(
-                main.main,
+                run_analysis,
                 input_file_path=self.input_path,
                 output_file_path=self.output_path,
                 settings_file_path=self.settings_path,
+                on_subject_done=self.results_panel.signals.emit_result,
                 logger=ThreadLogger(),
             )
             self.run_worker.logger.log.signal.connect(self.write_log)
@@ -265,12 +327,17 @@ class MainWindow(QtWidgets.QMainWindow):
     def write_log(self, log_text):
         self.logger.info(log_text)
 
+    @Slot(str)
+    def analysis_loaded(self, main_version):
+        self.version_info["MAIN"] = main_version
+        self.logger.debug(f"analysis modules loaded (main {main_version})")
+
     # create the application
 
 
-def sasa():
+def build_window():
     loader = QUiLoader()
-    app = QtWidgets.QApplication()
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication()
     ui_file = QFile(os.path.join(os.path.dirname(__file__), "gui.ui"))
     window_ui = loader.load(ui_file)
 
@@ -278,7 +345,11 @@ def sasa():
 
     ui = MainWindow(window_ui)
 
-    ui.version_info = {"GUI": __version__, "MAIN": main.__version__}
+    return app, ui
+
+
+def sasa():
+    app, ui = build_window()
 
     sys.exit(app.exec())
 
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+memory-aware largest-first scheduling of subject runs
+
+each subject's run time and peak memory are estimated from the size of its
+fragment files, scaled by a linear fit to the costs observed in earlier runs
+(kept in a small json history). subjects are started largest first so the
+longest run does not start last, and a subject is only started while the
+estimated memory of the running subjects stays within the memory budget -
+smaller subjects that fit are started ahead of a large one that does not
+
+with more than one worker every subject runs in a fresh process, so its
+peak resident memory can be measured and recorded for later estimates. a
+worker that dies (killed when out of memory, a crash in a native reader)
+fails the subjects running in the pool at that moment, and the remaining
+subjects continue in a new pool
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import os
+import json
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+# %% define constants
+# (fixed cost, cost per MB of csv) used until the history allows a fit
+DEFAULT_SECONDS = (1.0, 20.0)
+DEFAULT_MEMORY_MB = (250.0, 100.0)
+
+HISTORY_FILE = "scheduler history.json"
+
+
+# %% define functions
+def subject_bytes(subject_file_list):
+    """
+    total size of a subject's fragment files
+    """
+    return sum(os.path.getsize(f) for f in subject_file_list)
+
+
+def default_memory_budget_mb():
+    """
+    half of the physical memory, or 4 GB when it cannot be determined
+    """
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2e6
+    except (AttributeError, ValueError, OSError):
+        return 4000
+
+
+def load_history(history_path):
+    """
+    observed subject costs from earlier runs, keyed by subject id
+    """
+    try:
+        with open(history_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_history(history_path, history):
+    """
+    saves the observed subject costs
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(history_path)), exist_ok=True)
+    with open(history_path, "w") as f:
+        json.dump(history, f, indent=1)
+
+
+def fit_cost(history, field, default):
+    """
+    (fixed cost, cost per MB) of one history field from a linear fit to the
+    observations, or the default until there are two distinct file sizes
+    """
+    points = [
+        (observed["bytes"] / 1e6, observed[field])
+        for observed in history.values()
+        if observed.get(field) is not None
+    ]
+    if len({size for size, _ in points}) < 2:
+        return default
+    per_mb, fixed = np.polyfit(*zip(*points), 1)
+    return max(fixed, 0.0), max(per_mb, 0.0)
+
+
+def estimate_costs(tasks, history):
+    """
+    estimated seconds and peak memory (MB) of every subject in tasks
+    (subject id -> fragment file list)
+    """
+    seconds = fit_cost(history, "seconds", DEFAULT_SECONDS)
+    memory = fit_cost(history, "memory (MB)", DEFAULT_MEMORY_MB)
+    estimates = {}
+    for subject_id, subject_file_list in tasks.items():
+        size = subject_bytes(subject_file_list)
+        size_mb = size / 1e6
+        estimates[subject_id] = {
+            "seconds": seconds[0] + seconds[1] * size_mb,
+            "memory (MB)": memory[0] + memory[1] * size_mb,
+        }
+        # a subject seen before with the same files uses its own record
+        observed = history.get(subject_id)
+        if observed and observed["bytes"] == size:
+            for field in ["seconds", "memory (MB)"]:
+                if observed.get(field) is not None:
+                    estimates[subject_id][field] = observed[field]
+    return estimates
+
+
+def measured_call(func, subject_id, subject_file_list, args):
+    """
+    runs func(subject_id, subject_file_list, *args) and returns
+    (result, error, traceback, elapsed seconds, peak memory in MB)
+
+    peak memory is the process' peak resident size, which is only the
+    subject's own when the process runs a single subject
+    """
+    result = error = error_traceback = None
+    t0 = time.perf_counter()
+    try:
+        result = func(subject_id, subject_file_list, *args)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        error_traceback = traceback.format_exc()
+    elapsed = time.perf_counter() - t0
+    peak_mb = None
+    if resource is not None:
+        # ru_maxrss is in kB on linux
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+    return result, error, error_traceback, elapsed, peak_mb
+
+
+def run_largest_first(
+    tasks,
+    func,
+    args=(),
+    max_workers=1,
+    memory_budget_mb=None,
+    history=None,
+    logger=None,
+):
+    """
+    runs func(subject_id, subject_file_list, *args) for every subject in
+    tasks, largest estimated cost first, and yields
+    (subject_id, result, error, traceback) as subjects finish
+
+    observed costs are added to history (when given)
+    """
+    if history is None:
+        history = {}
+    if not memory_budget_mb:
+        memory_budget_mb = default_memory_budget_mb()
+    estimates = estimate_costs(tasks, history)
+    queue = sorted(tasks, key=lambda s: estimates[s]["seconds"], reverse=True)
+
+    def record(subject_id, elapsed, peak_mb):
+        size = subject_bytes(tasks[subject_id])
+        previous = history.get(subject_id, {})
+        if peak_mb is None and previous.get("bytes") == size:
+            peak_mb = previous.get("memory (MB)")
+        history[subject_id] = {
+            "bytes": size,
+            "seconds": elapsed,
+            "memory (MB)": peak_mb,
+        }
+
+    if max_workers <= 1:
+        for subject_id in queue:
+            result, error, error_traceback, elapsed, _ = measured_call(
+                func, subject_id, tasks[subject_id], args
+            )
+            # the peak of this long-lived process says nothing about the subject
+            record(subject_id, elapsed, None)
+            yield subject_id, result, error, error_traceback
+        return
+
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1)
+
+    running = {}
+    memory_in_use = 0
+    pool = new_pool()
+    try:
+        while queue or running:
+            for subject_id in list(queue):
+                if len(running) >= max_workers:
+                    break
+                needed = estimates[subject_id]["memory (MB)"]
+                if running and memory_in_use + needed > memory_budget_mb:
+                    continue
+                if not running and needed > memory_budget_mb and logger:
+                    logger.warning(
+                        f"{subject_id}: estimated {needed:.0f} MB exceeds the "
+                        + f"memory budget of {memory_budget_mb:.0f} MB, running alone"
+                    )
+                future = pool.submit(
+                    measured_call, func, subject_id, tasks[subject_id], args
+                )
+                running[future] = subject_id
+                memory_in_use += needed
+                queue.remove(subject_id)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = None
+            for future in done:
+                subject_id = running.pop(future)
+                memory_in_use -= estimates[subject_id]["memory (MB)"]
+                try:
+                    result, error, error_traceback, elapsed, peak_mb = future.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        # a worker died, e.g. killed when out of memory
+                        broken = e
+                    error = f"worker process failed - {type(e).__name__}: {e}"
+                    yield subject_id, None, error, traceback.format_exc()
+                    continue
+                record(subject_id, elapsed, peak_mb)
+                yield subject_id, result, error, error_traceback
+
+            if broken:
+                # the pool is unusable, the subjects still in it are lost with
+                # it - they are reported as failed and the queue carries on in
+                # a new pool
+                error = f"worker process failed - {type(broken).__name__}: {broken}"
+                for subject_id in running.values():
+                    yield subject_id, None, error, None
+                running = {}
+                memory_in_use = 0
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+                if logger:
+                    logger.warning(
+                        "a worker process crashed, continuing in a new process pool"
+                    )
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+intra-subject parallelism
+
+a long night is split into contiguous segments, cut at recording gaps where
+the recording has them. every bout is scored on the slice of rows between its
+start and stop (found by binary search on the sorted timestamps) rather than
+by masking the whole night, so the result of a bout does not depend on the
+segment it falls in. segments (and the independent duration filters of the
+desat families) run on a thread pool of "subject threads" workers and their
+bouts are stitched back in time order
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# %% define constants
+DEFAULT_SEGMENT_ROWS = 20000
+
+
+# %% define functions
+def subject_pool(settings):
+    """
+    context manager giving a thread pool of the "subject threads" setting,
+    or None (run inline) for a single thread
+    """
+    threads = int(settings.get("subject threads", 1))
+    if threads <= 1:
+        return contextlib.nullcontext(None)
+    return ThreadPoolExecutor(max_workers=threads, thread_name_prefix="segment")
+
+
+def run_tasks(function, items, pool=None):
+    """
+    function applied to every item, on the pool when given - results are
+    returned in the order of items
+    """
+    if pool is None:
+        return [function(item) for item in items]
+    return list(pool.map(function, items))
+
+
+def segment_starts(gaps, segment_rows=DEFAULT_SEGMENT_ROWS):
+    """
+    row positions where segments begin - the first recording gap at least
+    segment_rows rows into the current segment, or the row 2 * segment_rows
+    in when there is none
+    """
+    gap_rows = np.flatnonzero(gaps)
+    starts = [0]
+    while starts[-1] + segment_rows < len(gaps):
+        target = starts[-1] + segment_rows
+        i = np.searchsorted(gap_rows, target)
+        if i < gap_rows.size and gap_rows[i] < target + segment_rows:
+            starts.append(int(gap_rows[i]))
+        else:
+            starts.append(target + segment_rows)
+    return np.array([start for start in starts if start < len(gaps)])
+
+
+def score_bouts(score, pairs, df, pool=None, segment_rows=DEFAULT_SEGMENT_ROWS):
+    """
+    score(start, stop, frame) of every (start, stop) bout of pairs, in time
+    order - frame is the slice of df from the bout's start to its stop, and
+    the bouts are grouped by the segment of their start
+    """
+    if not pairs:
+        return []
+    ts = df["ts"].to_numpy()
+    first = np.searchsorted(
+        ts, np.array([start for start, _ in pairs], dtype=ts.dtype), side="left"
+    )
+    last = np.searchsorted(
+        ts, np.array([stop for _, stop in pairs], dtype=ts.dtype), side="right"
+    )
+    starts = segment_starts(df["gaps"].to_numpy(), segment_rows)
+    segment = np.searchsorted(starts, first, side="right") - 1
+    groups = np.split(np.arange(len(pairs)), np.flatnonzero(np.diff(segment)) + 1)
+
+    def score_group(group):
+        return [score(*pairs[i], df.iloc[first[i] : last[i]]) for i in group]
+
+    return [bout for bouts in run_tasks(score_group, groups, pool) for bout in bouts]
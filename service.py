@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+local HTTP analysis service
+
+keeps a pool of worker processes that have already imported the analysis
+stack and hold the parsed settings, so a recording posted to the service
+is analysed without paying for interpreter, pandas or settings startup.
+the service only listens on localhost
+
+    python service.py -s "sample settings.xlsx" --port 8765
+
+    curl --data-binary @SB001.csv -H "Content-Type: text/csv" \\
+        "http://127.0.0.1:8765/analyse?filename=SB001.csv"
+
+POST /analyse accepts a csv body (text/csv, name it with ?filename=), a
+multipart form upload with one or more fragment files, or json
+{"paths": [...]} naming files on this machine below a --root folder (or the
+watch folder). every file must be a .csv named after one subject. the reply
+is json with the subject id, duration bin, output_summary and bout tables,
+as main.main() computes them. GET / serves an upload form and GET /health
+reports status. analysis errors of named files are only logged, not
+replied, as they can quote rows of the file
+
+with --watch [folder], recordings copied into the folder are analysed once
+their size stops changing and the reply json is written next to them
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import os
+import json
+import math
+import logging
+import argparse
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+import main
+import discovery
+
+# %% define constants
+DEFAULT_PORT = 8765
+
+UPLOAD_FORM = """<!DOCTYPE html>
+<html><head><title>SASA</title></head><body>
+<h3>SASA - Sleep Apnea Saturation Analysis</h3>
+<form action="/analyse" method="post" enctype="multipart/form-data">
+<input type="file" name="recording" accept=".csv" multiple>
+<input type="submit" value="analyse">
+</form>
+</body></html>
+"""
+
+# state of each worker process, filled once by init_worker
+WORKER_STATE = {}
+
+
+# %% define classes
+class RequestError(ValueError):
+    """
+    a request the service refuses before reading any file
+    """
+
+
+# %% define functions
+def init_worker(settings, file_time_fix):
+    """
+    runs once in every worker process - keeps the parsed settings and the
+    night duration bins so requests only pay for the analysis itself
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(processName)s | %(levelname)-5.5s |  %(message)s",
+    )
+    WORKER_STATE["logger"] = logging.getLogger()
+    WORKER_STATE["settings"] = settings
+    WORKER_STATE["file_time_fix"] = file_time_fix
+    WORKER_STATE["night_duration_bins"] = list(
+        main.build_night_duration_bins(settings, WORKER_STATE["logger"]).keys()
+    )
+
+
+def worker_ready(_=None):
+    """
+    no-op task used to start the workers before the first request
+    """
+    return os.getpid()
+
+
+def analyse_files(subject_id, file_paths):
+    """
+    runs the per-subject pipeline in a worker and returns a json-ready dict
+    """
+    subject_result = main.process_subject(
+        subject_id,
+        file_paths,
+        WORKER_STATE["settings"],
+        WORKER_STATE["file_time_fix"],
+        WORKER_STATE["night_duration_bins"],
+        WORKER_STATE["logger"],
+    )
+    return to_jsonable(
+        {
+            "subject_id": subject_id,
+            "files": [os.path.basename(f) for f in file_paths],
+            "duration_bin": subject_result["duration_bin"],
+            "output_summary": subject_result["output_summary"],
+            "bouts": subject_result["bouts"],
+        }
+    )
+
+
+def to_jsonable(value):
+    """
+    converts results to plain json types - timestamps become iso strings and
+    NaN becomes null
+    """
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return None if pd.isna(value) else value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def subject_id_for(file_name):
+    """
+    subject id of a recording file name, as main.collect_subject_files
+    """
+    return discovery.subject_id_of(file_name)
+
+
+def within(path, roots):
+    """
+    whether path (symlinks resolved) lies below one of the roots
+    """
+    path = os.path.realpath(path)
+    for root in roots:
+        root = os.path.realpath(root)
+        if os.path.commonpath([path, root]) == root:
+            return True
+    return False
+
+
+def parse_multipart(content_type, body):
+    """
+    (file name, content) of every file in a multipart/form-data body
+    """
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    return [
+        (os.path.basename(part.get_filename()), part.get_payload(decode=True))
+        for part in message.iter_parts()
+        if part.get_filename()
+    ]
+
+
+class AnalysisService(ThreadingHTTPServer):
+    """
+    threaded HTTP server that hands analyses to a warm worker pool
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, pool, logger, roots=()):
+        super().__init__(address, AnalysisRequestHandler)
+        self.pool = pool
+        self.logger = logger
+        # folders whose files json requests may name
+        self.roots = [root for root in roots if root]
+
+    def analyse(self, files):
+        """
+        analyses uploaded files given as (file name, content) pairs
+        """
+        if not files:
+            raise RequestError("no recording files received")
+        with tempfile.TemporaryDirectory(prefix="sasa_") as upload_path:
+            file_paths = []
+            for file_name, content in files:
+                file_paths.append(os.path.join(upload_path, file_name))
+                with open(file_paths[-1], "wb") as f:
+                    f.write(content)
+            return self.analyse_paths(file_paths)
+
+    def analyse_requested_paths(self, file_paths):
+        """
+        analyses files named by a client, which must lie below a root
+        """
+        if not isinstance(file_paths, list) or not file_paths:
+            raise RequestError("paths must be a list of recording files")
+        for f in file_paths:
+            if not isinstance(f, str) or not within(f, self.roots):
+                raise RequestError(f"{f}: not below a folder the service may read")
+        return self.analyse_paths(file_paths)
+
+    def analyse_paths(self, file_paths):
+        """
+        analyses recording files that already exist on this machine
+        """
+        for f in file_paths:
+            if not f.endswith(".csv"):
+                raise RequestError(
+                    f"{os.path.basename(f)}: recordings must be .csv files"
+                )
+        subject_ids = {subject_id_for(os.path.basename(f)) for f in file_paths}
+        if None in subject_ids:
+            raise RequestError("file names must start with a subject id")
+        if len(subject_ids) != 1:
+            raise RequestError(
+                f"files of exactly one subject expected, found {sorted(subject_ids)}"
+            )
+        subject_id = subject_ids.pop()
+        self.logger.info(f"analysing {subject_id}: {', '.join(file_paths)}")
+        return self.pool.submit(analyse_files, subject_id, file_paths).result()
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """
+    request handler for the analysis service
+    """
+
+    def send_body(self, status, body, content_type="application/json"):
+        data = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, value):
+        self.send_body(status, json.dumps(value, indent=1))
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/":
+            self.send_body(200, UPLOAD_FORM, "text/html; charset=utf-8")
+        elif path == "/health":
+            self.send_json(200, {"status": "ok", "version": __version__})
+        else:
+            self.send_json(404, {"error": f"unknown path {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/analyse":
+            self.send_json(404, {"error": f"unknown path {url.path}"})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        content_type = self.headers.get("Content-Type", "")
+        named_files = content_type.startswith("application/json")
+        try:
+            if content_type.startswith("multipart/form-data"):
+                result = self.server.analyse(parse_multipart(content_type, body))
+            elif named_files:
+                paths = json.loads(body).get("paths")
+                result = self.server.analyse_requested_paths(paths)
+            else:
+                query = parse_qs(url.query)
+                file_name = query.get("filename", ["recording.csv"])[0]
+                result = self.server.analyse([(os.path.basename(file_name), body)])
+        except Exception as e:
+            self.server.logger.error(f"analysis failed - {type(e).__name__}: {e}")
+            self.server.logger.debug(traceback.format_exc())
+            error = f"{type(e).__name__}: {e}"
+            if named_files and not isinstance(e, RequestError):
+                # errors reading a named file can quote its rows
+                error = f"{type(e).__name__}: see the service log"
+            self.send_json(400, {"error": error})
+            return
+        self.send_json(200, result)
+
+    def log_message(self, format, *args):
+        self.server.logger.info(f"{self.address_string()} - {format % args}")
+
+
+def watch_folder(watch_path, service, stop_event, interval=2.0):
+    """
+    analyses recordings that appear in watch_path once their files stop
+    changing size, writing {subject_id}_summary.json next to them
+    """
+    seen = {}
+    done = {}
+    # the file listing is logged on every poll, keep it quiet
+    listing_logger = logging.getLogger("watch")
+    listing_logger.setLevel(logging.WARNING)
+    while not stop_event.is_set():
+        file_dict = main.collect_subject_files(watch_path, listing_logger)
+        for subject_id, file_paths in file_dict.items():
+            sizes = {f: os.path.getsize(f) for f in file_paths}
+            if done.get(subject_id) == sizes:
+                continue
+            if seen.get(subject_id) != sizes:
+                # wait one more poll to see whether the files are complete
+                seen[subject_id] = sizes
+                continue
+            try:
+                result = service.analyse_paths(file_paths)
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+                service.logger.error(f"{subject_id} failed - {result['error']}")
+            with open(os.path.join(watch_path, f"{subject_id}_summary.json"), "w") as f:
+                json.dump(result, f, indent=1)
+            done[subject_id] = sizes
+            service.logger.info(f"{subject_id} summary written")
+        stop_event.wait(interval)
+
+
+def serve(settings_file_path, port=DEFAULT_PORT, workers=1, watch_path=None, roots=()):
+    """
+    starts the worker pool and serves requests on localhost until interrupted
+
+    json requests may only name files below one of roots or the watch folder
+    """
+    logger = logging.getLogger()
+    settings, file_time_fix = main.read_settings(settings_file_path)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(settings, file_time_fix),
+    )
+    # start every worker now so the first request finds them warm
+    list(pool.map(worker_ready, range(workers)))
+    service = AnalysisService(
+        ("127.0.0.1", port), pool, logger, roots=[*roots, watch_path]
+    )
+    logger.info(f"SASA service listening on http://127.0.0.1:{service.server_port}")
+
+    stop_event = threading.Event()
+    if watch_path:
+        threading.Thread(
+            target=watch_folder,
+            args=(watch_path, service, stop_event),
+            name="watch",
+            daemon=True,
+        ).start()
+        logger.info(f"watching {watch_path} for recordings")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        service.server_close()
+        pool.shutdown()
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local SASA analysis service")
+    parser.add_argument("-s", "--settings", default="./sample settings.xlsx")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--watch", help="folder to watch for new recordings")
+    parser.add_argument(
+        "--root",
+        action="append",
+        default=[],
+        help="folder whose recordings json requests may name (repeatable)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(threadName)s | %(levelname)-5.5s |  %(message)s",
+    )
+    serve(
+        args.settings,
+        port=args.port,
+        workers=args.workers,
+        watch_path=args.watch,
+        roots=args.root,
+    )
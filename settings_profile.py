@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+compiled settings profiles
+
+a settings file (xlsx, json or toml) is read once into a SettingsProfile - a
+dict of parameter -> value, as before, with the values checked and converted
+(numbers, whole numbers, night start/stop times, choices) so a bad entry is
+reported by name before any subject is analysed, and blank optional settings
+are left out so their defaults apply. the 'file time fix' table becomes a dict
+of file name -> (end hour, end minute), and recordings named
+[subject_id]_time_off_[hhmm].csv take their end time from the name unless the
+table has an entry for them
+
+json and toml profiles need no excel reader:
+
+    {"settings": {"desat threshold": 90, "night_start_time (24hr HH:MM)": "21:00", ...},
+     "file time fix": [{"filename": "SB009_time_off_0900.csv", "end hour": 9, "end minute": 0}]}
+
+`python settings_profile.py "sample settings.xlsx" -o settings.json` checks a
+settings file and converts it to json
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import os
+import re
+import json
+import numbers
+import datetime
+import argparse
+import tomllib
+
+# %% define constants
+# settings the analysis indexes directly, with the type each is compiled to
+REQUIRED_SETTINGS = {
+    "desat subthreshold": "number",
+    "desat threshold": "number",
+    "desat severe threshold": "number",
+    "desat spike": "number",
+    "minimum desat interval (sec)": "number",
+    "sustained desat interval (sec)": "number",
+    "complete night duration (hours)": "whole number",
+    "minimum night duration (hours)": "whole number",
+    "expected_sampling_rate (sec)": "number",
+    "night duration bin size (hours)": "whole number",
+    "night duration round up within (minutes)": "number",
+}
+OPTIONAL_SETTINGS = {
+    "night_start_time (24hr HH:MM)": "time",
+    "night_stop_time (24hr HH:MM)": "time",
+    "artifact duration threshold (sec)": "number",
+    "odi baseline window (sec)": "number",
+    "odi minimum event duration (sec)": "number",
+    "epoch length (sec)": "number",
+    "clock jump threshold (sec)": "number",
+    # execution
+    "ingest threads": "whole number",
+    "subject threads": "whole number",
+    "segment rows": "whole number",
+    "parallel workers": "whole number",
+    "memory budget (MB)": "number",
+    "cache size (MB)": "number",
+    # cohort summaries
+    "bootstrap resamples": "whole number",
+    "bootstrap seed": "whole number",
+    "bootstrap confidence (%)": "number",
+}
+# settings limited to a few values
+CHOICE_SETTINGS = {
+    "night export": ["full", "epochs"],
+    "backend": ["pandas", "polars"],
+}
+# night window used when the night start or stop setting is left blank
+DEFAULT_NIGHT_START = datetime.time(21, 0)
+DEFAULT_NIGHT_STOP = datetime.time(7, 0)
+TIME_OFF_PATTERN = re.compile(
+    r"(?P<stem>.+)_time_off_(?P<hour>\d{2})(?P<minute>\d{2})\.csv"
+)
+
+
+# %% define classes
+class SettingsError(ValueError):
+    """
+    raised when a settings file is missing a setting or has an invalid value
+    """
+
+
+class SettingsProfile(dict):
+    """
+    parameter -> value dict of a compiled settings file, with the file time
+    fix lookup in file_time_fix
+    """
+
+    def __init__(self, settings=None, file_time_fix=None, source=None):
+        super().__init__(settings or {})
+        self.file_time_fix = dict(file_time_fix or {})
+        self.source = source
+
+
+# %% define functions
+def is_missing(value):
+    """
+    whether a value is an empty cell (None or NaN)
+    """
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def to_number(key, value):
+    if isinstance(value, bool):
+        raise SettingsError(f'setting "{key}": expected a number, got {value!r}')
+    if isinstance(value, numbers.Number):
+        return value
+    try:
+        number = float(str(value).strip())
+    except ValueError:
+        raise SettingsError(f'setting "{key}": expected a number, got {value!r}')
+    return int(number) if number.is_integer() else number
+
+
+def to_whole_number(key, value):
+    number = to_number(key, value)
+    if float(number) != int(number):
+        raise SettingsError(f'setting "{key}": expected a whole number, got {value!r}')
+    return int(number)
+
+
+def to_time(key, value):
+    if isinstance(value, datetime.datetime):
+        return value.time()
+    if isinstance(value, datetime.time):
+        return value
+    for time_format in ["%H:%M", "%H:%M:%S"]:
+        try:
+            return datetime.datetime.strptime(str(value).strip(), time_format).time()
+        except ValueError:
+            pass
+    raise SettingsError(f'setting "{key}": expected a 24 hr HH:MM time, got {value!r}')
+
+
+CONVERTERS = {"number": to_number, "whole number": to_whole_number, "time": to_time}
+
+
+def compile_settings(settings):
+    """
+    checks and converts the values of a parameter -> value dict, blank
+    optional settings are dropped and settings not listed in
+    REQUIRED_SETTINGS, OPTIONAL_SETTINGS or CHOICE_SETTINGS are kept as they
+    are
+    """
+    missing = [key for key in REQUIRED_SETTINGS if is_missing(settings.get(key))]
+    if missing:
+        raise SettingsError(f"missing setting(s): {', '.join(missing)}")
+    compiled = dict(settings)
+    for key in [*OPTIONAL_SETTINGS, *CHOICE_SETTINGS]:
+        if is_missing(settings.get(key)):
+            compiled.pop(key, None)
+    for key, kind in {**REQUIRED_SETTINGS, **OPTIONAL_SETTINGS}.items():
+        if key in compiled:
+            compiled[key] = CONVERTERS[kind](key, settings[key])
+    for key, choices in CHOICE_SETTINGS.items():
+        if key in compiled:
+            compiled[key] = str(settings[key]).strip().lower()
+            if compiled[key] not in choices:
+                raise SettingsError(
+                    f'setting "{key}": expected one of {", ".join(choices)}, '
+                    + f"got {settings[key]!r}"
+                )
+    return compiled
+
+
+def compile_time_fix(rows):
+    """
+    file name -> (end hour, end minute) dict of the 'file time fix' rows
+    """
+    file_time_fix = {}
+    for row in rows:
+        if is_missing(row.get("filename")):
+            continue
+        name = str(row["filename"]).strip()
+        try:
+            hour, minute = int(row["end hour"]), int(row["end minute"])
+        except (KeyError, TypeError, ValueError):
+            raise SettingsError(f"file time fix of {name}: needs end hour and minute")
+        if not (0 <= hour <= 23 and 0 <= minute <= 59):
+            raise SettingsError(f"file time fix of {name}: {hour}:{minute} is no time")
+        file_time_fix[name] = (hour, minute)
+    return file_time_fix
+
+
+def read_xlsx(path):
+    """
+    (settings dict, file time fix rows) of a settings workbook, both sheets
+    read from a single open of the file
+    """
+    import pandas as pd
+
+    with pd.ExcelFile(path) as workbook:
+        settings = workbook.parse("settings").set_index("parameter")["value"].to_dict()
+        rows = []
+        if "file time fix" in workbook.sheet_names:
+            rows = workbook.parse("file time fix").to_dict("records")
+    return settings, rows
+
+
+def read_document(path):
+    """
+    (settings dict, file time fix rows) of a json or toml settings file
+    """
+    if path.lower().endswith(".toml"):
+        with open(path, "rb") as f:
+            document = tomllib.load(f)
+    else:
+        with open(path) as f:
+            document = json.load(f)
+    if not isinstance(document.get("settings"), dict):
+        raise SettingsError(f"{os.path.basename(path)}: no settings table")
+    return document["settings"], document.get("file time fix", [])
+
+
+def load_profile(path):
+    """
+    compiled SettingsProfile of a settings file - xlsx, json or toml by its
+    extension
+    """
+    if path.lower().endswith((".json", ".toml")):
+        settings, rows = read_document(path)
+    else:
+        settings, rows = read_xlsx(path)
+    return SettingsProfile(
+        compile_settings(settings), compile_time_fix(rows), source=path
+    )
+
+
+def time_off_of(file_name):
+    """
+    (end hour, end minute) of a [subject_id]_time_off_[hhmm].csv file name,
+    None for other names
+    """
+    match = TIME_OFF_PATTERN.fullmatch(file_name)
+    if not match:
+        return None
+    hour, minute = int(match.group("hour")), int(match.group("minute"))
+    return (hour, minute) if hour <= 23 and minute <= 59 else None
+
+
+def end_time(file_time_fix, f):
+    """
+    verified (end hour, end minute) of a recording file - its file time fix
+    entry, else the time in its name - or None when its timestamps are kept
+    """
+    name = os.path.basename(f)
+    return file_time_fix.get(name) or time_off_of(name)
+
+
+def night_window(settings):
+    """
+    (night start, night stop) times of a settings dict, the default night
+    (21:00 to 07:00) for settings left blank
+    """
+    window = []
+    for key, default in [
+        ("night_start_time (24hr HH:MM)", DEFAULT_NIGHT_START),
+        ("night_stop_time (24hr HH:MM)", DEFAULT_NIGHT_STOP),
+    ]:
+        value = settings.get(key)
+        window.append(default if is_missing(value) else to_time(key, value))
+    return tuple(window)
+
+
+def profile_document(profile):
+    """
+    json-ready dict of a profile
+    """
+    return {
+        "settings": {
+            key: value.strftime("%H:%M") if isinstance(value, datetime.time) else value
+            for key, value in profile.items()
+            if not is_missing(value)
+        },
+        "file time fix": [
+            {"filename": name, "end hour": hour, "end minute": minute}
+            for name, (hour, minute) in sorted(profile.file_time_fix.items())
+        ],
+    }
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="check a settings file and optionally convert it to json"
+    )
+    parser.add_argument("settings")
+    parser.add_argument("-o", "--output", help="json file to write")
+    args = parser.parse_args()
+
+    profile = load_profile(args.settings)
+    document = json.dumps(profile_document(profile), indent=1, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document + "\n")
+        print(f"{args.settings}: ok, written to {args.output}")
+    else:
+        print(document)
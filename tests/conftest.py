@@ -0,0 +1,48 @@
+"""
+shared fixtures of the SASA tests
+"""
+
+import os
+import json
+import logging
+
+import pytest
+
+import settings_profile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_DATA = os.path.join(ROOT, "sample data", "pooled")
+SAMPLE_SETTINGS = os.path.join(ROOT, "sample settings.xlsx")
+
+
+@pytest.fixture(scope="session")
+def sample_profile():
+    return settings_profile.load_profile(SAMPLE_SETTINGS)
+
+
+@pytest.fixture
+def settings(sample_profile):
+    return dict(sample_profile)
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("sasa tests")
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def write_settings(path, profile, file_time_fix=None):
+    """
+    writes a json settings file of a profile, with its file time fix
+    replaced when given
+    """
+    document = settings_profile.profile_document(profile)
+    if file_time_fix is not None:
+        document["file time fix"] = [
+            {"filename": name, "end hour": hour, "end minute": minute}
+            for name, (hour, minute) in file_time_fix.items()
+        ]
+    with open(path, "w") as f:
+        json.dump(document, f)
+    return path
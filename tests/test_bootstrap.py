@@ -0,0 +1,64 @@
+"""
+bootstrap cohort summaries of bootstrap.py
+"""
+
+import numpy as np
+
+import bootstrap
+
+SUMMARIES = {
+    "SB001": {"odi 3%": 4.0, "mean spo2": 95.0, "night start": "21:00"},
+    "SB002": {"odi 3%": 12.0, "mean spo2": 93.0, "night start": "21:00"},
+    "SB003": {"odi 3%": 7.5, "mean spo2": np.nan, "night start": "21:00"},
+    "SB004": {"odi 3%": 1.0, "mean spo2": 96.5, "night start": "21:00"},
+}
+
+
+def test_fixed_seed_is_reproducible():
+    first = bootstrap.cohort_summary(SUMMARIES, resamples=500, seed=11)
+    second = bootstrap.cohort_summary(SUMMARIES, resamples=500, seed=11)
+    assert first.equals(second)
+    # seeds read from the settings workbook arrive as floats
+    assert first.equals(bootstrap.cohort_summary(SUMMARIES, resamples=500, seed=11.0))
+    other = bootstrap.cohort_summary(SUMMARIES, resamples=500, seed=12)
+    assert not first["bootstrap se"].equals(other["bootstrap se"])
+
+
+def test_blocks_continue_one_random_stream():
+    _, values = bootstrap.metric_matrix(SUMMARIES)
+    resamples = bootstrap.BLOCK_RESAMPLES
+    longer = bootstrap.bootstrap_means(values, resamples + 100, seed=3)
+    shorter = bootstrap.bootstrap_means(values, resamples, seed=3)
+    np.testing.assert_array_equal(longer[:resamples], shorter)
+
+
+def test_summary_values():
+    table = bootstrap.cohort_summary(SUMMARIES, resamples=2000, seed=1)
+    assert list(table.index) == ["odi 3%", "mean spo2"]
+    assert list(table.columns) == [
+        "subjects",
+        "mean",
+        "bootstrap se",
+        "95% ci low",
+        "95% ci high",
+    ]
+    assert table.loc["odi 3%", "subjects"] == 4
+    assert table.loc["mean spo2", "subjects"] == 3
+    assert table.loc["odi 3%", "mean"] == 6.125
+    assert table.loc["mean spo2", "mean"] == 94.83333333333333
+    # the standard error of a mean is close to sd / sqrt(n)
+    expected_se = np.std([4.0, 12.0, 7.5, 1.0]) / 2
+    assert abs(table.loc["odi 3%", "bootstrap se"] - expected_se) < 0.1 * expected_se
+    low, high = table.loc["odi 3%", ["95% ci low", "95% ci high"]]
+    assert 1.0 <= low < 6.125 < high <= 12.0
+
+
+def test_constant_metric_has_no_spread():
+    summaries = {subject: {"odi 3%": 5.0} for subject in ["SB001", "SB002"]}
+    table = bootstrap.cohort_summary(summaries, resamples=100, seed=0)
+    assert table.loc["odi 3%"].to_list() == [2, 5.0, 0.0, 5.0, 5.0]
+
+
+def test_no_numeric_metrics():
+    table = bootstrap.cohort_summary({"SB001": {"night start": "21:00"}}, seed=0)
+    assert table.empty
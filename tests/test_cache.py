@@ -0,0 +1,87 @@
+"""
+result cache of cache.py
+"""
+
+import os
+import shutil
+
+import pytest
+
+import cache
+from conftest import SAMPLE_DATA
+
+
+@pytest.fixture
+def recording(tmp_path):
+    path = tmp_path / "recordings" / "SB001.csv"
+    path.parent.mkdir()
+    shutil.copyfile(os.path.join(SAMPLE_DATA, "SB001.csv"), path)
+    return str(path)
+
+
+def fingerprint(recording, settings, file_time_fix=None, hash_index=None):
+    return cache.subject_fingerprint(
+        [recording],
+        settings,
+        file_time_fix or {},
+        {} if hash_index is None else hash_index,
+    )
+
+
+def test_store_and_load(tmp_path, recording, settings):
+    cache_path = str(tmp_path / "cache")
+    key = fingerprint(recording, settings)
+    assert cache.load_result(cache_path, key) is None
+    cache.store_result(cache_path, key, {"duration_bin": 8})
+    assert cache.load_result(cache_path, key) == {"duration_bin": 8}
+    assert [entry[0] for entry in cache.cache_entries(cache_path)] == [key]
+
+
+def test_key_is_stable(recording, settings):
+    hash_index = {}
+    key = fingerprint(recording, settings, hash_index=hash_index)
+    # the second digest comes from the hash index
+    assert fingerprint(recording, settings, hash_index=hash_index) == key
+    assert fingerprint(recording, dict(settings)) == key
+
+
+def test_execution_settings_keep_the_key(recording, settings):
+    key = fingerprint(recording, settings)
+    changed = dict(settings, **{"subject threads": 4, "bootstrap seed": 7})
+    assert fingerprint(recording, changed) == key
+
+
+def test_result_settings_change_the_key(recording, settings):
+    key = fingerprint(recording, settings)
+    changed = dict(settings)
+    changed["minimum desat interval (sec)"] += 1
+    assert fingerprint(recording, changed) != key
+
+
+def test_file_content_changes_the_key(recording, settings):
+    hash_index = {}
+    key = fingerprint(recording, settings, hash_index=hash_index)
+    with open(recording, "a") as f:
+        f.write("2024,3,2,7,0,0,70,95\n")
+    assert fingerprint(recording, settings, hash_index=hash_index) != key
+
+
+def test_end_time_changes_the_key(recording, settings):
+    key = fingerprint(recording, settings)
+    fixed = fingerprint(recording, settings, {"SB001.csv": (7, 0)})
+    assert fixed != key
+    assert fingerprint(recording, settings, {"SB001.csv": (7, 30)}) != fixed
+    # a fix for another subject's file does not matter
+    assert fingerprint(recording, settings, {"SB002.csv": (7, 0)}) == key
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache_path = str(tmp_path / "cache")
+    record = {"payload": b"x" * 400_000}
+    cache.store_result(cache_path, "old", record)
+    cache.store_result(cache_path, "new", record)
+    os.utime(cache.entry_path(cache_path, "old"), ns=(0, 0))
+    cache.load_result(cache_path, "new")
+    assert cache.evict(cache_path, 0.5) == 1
+    assert cache.load_result(cache_path, "old") is None
+    assert cache.load_result(cache_path, "new") == record
@@ -0,0 +1,90 @@
+"""
+columnar cohort bout table of cohort.py
+"""
+
+import pandas as pd
+
+import cohort
+
+
+def bout(start, seconds, low_spo2, started_subdesat=0):
+    start = pd.Timestamp(start)
+    return {
+        "start": start,
+        "stop": start + pd.Timedelta(seconds=seconds),
+        "duration": float(seconds),
+        "low_spo2": float(low_spo2),
+        "started subdesat": started_subdesat,
+    }
+
+
+def record(duration_hours, bouts):
+    return {
+        "duration_bin": 8,
+        "output_summary": {
+            "night start": pd.Timestamp("2024-03-01 21:00"),
+            "night stop": pd.Timestamp("2024-03-02 07:00"),
+            "duration recording (excluding_gaps)": duration_hours * 3600.0,
+        },
+        "bouts": bouts,
+    }
+
+
+SUBJECT_RECORDS = {
+    "SB001": record(
+        8,
+        {
+            "desat bouts": [
+                bout("2024-03-01 22:00", 20, 85),
+                bout("2024-03-01 23:00", 40, 78, "unk"),
+            ],
+            "sustained desat bouts": [bout("2024-03-01 23:00", 40, 78)],
+        },
+    ),
+    "SB002": record(4, {"desat bouts": [bout("2024-03-01 22:30", 12, 88, 1)]}),
+    "SB003": record(10, {"desat bouts": []}),
+}
+
+
+def test_bout_table_has_one_row_per_bout_with_fixed_columns():
+    table = cohort.build_bout_table(SUBJECT_RECORDS)
+    assert list(table.columns) == ["subject", "bout type"] + list(cohort.BOUT_COLUMNS)
+    assert len(table) == 4
+    assert table["subject"].dtype == "category"
+    assert table["bout type"].dtype == "category"
+    for column, dtype in cohort.BOUT_COLUMNS.items():
+        assert table[column].dtype == dtype
+    # fields the bouts lack are empty, undetermined starts are missing
+    assert table["median_spo2"].isna().all()
+    assert table["started subdesat"].isna().sum() == 1
+
+
+def test_empty_cohort_gives_an_empty_table():
+    table = cohort.build_bout_table({"SB003": SUBJECT_RECORDS["SB003"]})
+    assert len(table) == 0
+    assert list(table.columns) == ["subject", "bout type"] + list(cohort.BOUT_COLUMNS)
+
+
+def test_tables_round_trip(tmp_path):
+    cohort.write_cohort_tables(SUBJECT_RECORDS, str(tmp_path))
+    bout_table, subject_table = cohort.read_cohort_tables(str(tmp_path))
+    pd.testing.assert_frame_equal(
+        bout_table, cohort.build_bout_table(SUBJECT_RECORDS), check_categorical=False
+    )
+    assert list(subject_table["subject"]) == ["SB001", "SB002", "SB003"]
+
+
+def test_cohort_queries():
+    table = cohort.build_bout_table(SUBJECT_RECORDS)
+    subject_table = cohort.build_subject_table(SUBJECT_RECORDS)
+
+    per_hour = cohort.bouts_per_hour(table, subject_table)
+    assert per_hour.to_dict() == {"SB001": 2 / 8, "SB002": 1 / 4, "SB003": 0.0}
+
+    assert cohort.share_below(table, 80) == 1 / 3
+    by_subject = cohort.share_below(table, 86, by_subject=True)
+    assert by_subject["SB001"] == 1.0
+    assert by_subject["SB002"] == 0.0
+
+    histogram = cohort.duration_histogram(table, [0, 15, 30, 60])
+    assert histogram.to_list() == [1, 1, 1]
@@ -0,0 +1,93 @@
+"""
+group comparison statistics of compare.py against hand-computed values
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+import compare
+
+
+def groups(**values):
+    """
+    {label: {subject_id: {"odi 3%": value}}} from lists of values
+    """
+    return {
+        label: {
+            f"{label}{i}": {"odi 3%": value} for i, value in enumerate(group_values)
+        }
+        for label, group_values in values.items()
+    }
+
+
+def test_rank_columns_averages_ties():
+    values = np.array([[3.0, 1.0], [1.0, np.nan], [3.0, 2.0], [2.0, 2.0]])
+    ranks, tie_sum = compare.rank_columns(values)
+    np.testing.assert_array_equal(ranks[:, 0], [3.5, 1.0, 3.5, 2.0])
+    np.testing.assert_array_equal(ranks[:, 1], [1.0, np.nan, 2.5, 2.5])
+    # one pair of ties in each column: 2**3 - 2
+    np.testing.assert_array_equal(tie_sum, [6.0, 6.0])
+
+
+def test_erfc_and_chi2_sf():
+    x = np.array([-1.5, 0.0, 0.3, 2.0])
+    np.testing.assert_allclose(compare.erfc(x), [math.erfc(v) for v in x], rtol=1.2e-7)
+    # df 2: exp(-x/2), df 1: erfc(sqrt(x/2)), df 3 by the series
+    assert compare.chi2_sf(4.0, 2) == pytest.approx(math.exp(-2))
+    assert compare.chi2_sf(3.0, 1) == pytest.approx(math.erfc(math.sqrt(1.5)))
+    expected = math.erfc(math.sqrt(1.5)) + math.exp(-1.5) * math.sqrt(6 / math.pi)
+    assert compare.chi2_sf(3.0, 3) == pytest.approx(expected)
+
+
+def test_benjamini_hochberg():
+    q = compare.benjamini_hochberg(np.array([0.01, 0.04, np.nan, 0.03, 0.5]))
+    np.testing.assert_allclose(q, [0.04, 0.04 * 4 / 3, np.nan, 0.04 * 4 / 3, 0.5])
+
+
+def test_mann_whitney_of_separated_groups():
+    table = compare.compare_groups(groups(a=[1.0, 2.0, 3.0], b=[4.0, 5.0, 6.0]))
+    row = table.loc["odi 3%"]
+    assert row["a n"] == 3
+    assert row["a median"] == 2.0
+    assert row["b median"] == 5.0
+    assert row["a vs b U"] == 0
+    assert row["a vs b cliff's delta"] == -1
+    # normal approximation with continuity correction
+    z = (4.5 - 0.5) / math.sqrt(3 * 3 / 12 * 7)
+    assert row["a vs b p"] == pytest.approx(math.erfc(z / math.sqrt(2)))
+    assert "kruskal-wallis H" not in table
+
+
+def test_mann_whitney_with_ties():
+    table = compare.compare_groups(groups(a=[1.0, 1.0, 2.0], b=[1.0, 3.0]))
+    row = table.loc["odi 3%"]
+    # ranks 2, 2, 4 and 2, 5 - a three-way tie at 1
+    assert row["a vs b U"] == 8 - 6
+    assert row["a vs b cliff's delta"] == 2 * 2 / 6 - 1
+    sigma = math.sqrt(3 * 2 / 12 * (6 - 24 / 20))
+    z = (abs(2 - 3) - 0.5) / sigma
+    assert row["a vs b p"] == pytest.approx(math.erfc(z / math.sqrt(2)))
+
+
+def test_kruskal_wallis_of_three_groups():
+    table = compare.compare_groups(groups(a=[1.0, 2.0], b=[3.0, 4.0], c=[5.0, 6.0]))
+    row = table.loc["odi 3%"]
+    h = 12 / (6 * 7) * (3**2 / 2 + 7**2 / 2 + 11**2 / 2) - 3 * 7
+    assert row["kruskal-wallis H"] == pytest.approx(h)
+    assert row["kruskal-wallis epsilon squared"] == pytest.approx(h / 5)
+    assert row["kruskal-wallis p"] == pytest.approx(math.exp(-h / 2))
+    # every pair is compared, on the ranks of its own two groups
+    assert row["a vs c U"] == 0
+    assert row["b vs c cliff's delta"] == -1
+
+
+def test_metric_missing_from_a_group_is_not_tested():
+    summaries = groups(a=[1.0, 2.0], b=[3.0, 4.0])
+    for summary in summaries["b"].values():
+        summary["odi 3%"] = np.nan
+    row = compare.compare_groups(summaries).loc["odi 3%"]
+    assert row["b n"] == 0
+    assert np.isnan(row["a vs b U"])
+    assert np.isnan(row["a vs b p"])
@@ -0,0 +1,61 @@
+"""
+per-epoch span coverage of epochs.py
+"""
+
+import numpy as np
+
+import epochs
+
+SEC = 10**9
+
+
+def covered(spans, bounds):
+    """
+    covered_seconds of spans and bounds given in seconds
+    """
+    spans = np.array(spans, dtype=np.int64).reshape(-1, 2) * SEC
+    return epochs.covered_seconds(
+        spans[:, 0], spans[:, 1], np.array(bounds, dtype=np.int64) * SEC
+    )
+
+
+def test_spans_within_epochs():
+    result = covered([[2, 5], [31, 40]], [0, 30, 60])
+    np.testing.assert_array_equal(result, [3.0, 9.0])
+
+
+def test_span_across_an_epoch_boundary_is_split():
+    result = covered([[20, 45]], [0, 30, 60])
+    np.testing.assert_array_equal(result, [10.0, 15.0])
+
+
+def test_span_across_several_epochs():
+    result = covered([[10, 100]], [0, 30, 60, 90, 120])
+    np.testing.assert_array_equal(result, [20.0, 30.0, 30.0, 10.0])
+
+
+def test_spans_ending_and_starting_on_a_boundary():
+    result = covered([[0, 30], [30, 35], [55, 60]], [0, 30, 60, 90])
+    np.testing.assert_array_equal(result, [30.0, 10.0, 0.0])
+
+
+def test_spans_outside_the_bounds_are_cut_off():
+    result = covered([[-20, 10], [50, 70], [80, 90]], [0, 30, 60])
+    np.testing.assert_array_equal(result, [10.0, 10.0])
+
+
+def test_no_spans():
+    result = covered([], [0, 30, 60])
+    np.testing.assert_array_equal(result, [0.0, 0.0])
+
+
+def test_matches_interval_overlap():
+    rng = np.random.default_rng(0)
+    edges = np.sort(rng.choice(np.arange(-50, 400), size=40, replace=False))
+    spans = edges.reshape(-1, 2)
+    bounds = np.arange(0, 331, 30)
+    expected = [
+        sum(max(0, min(stop, high) - max(start, low)) for start, stop in spans)
+        for low, high in zip(bounds[:-1], bounds[1:])
+    ]
+    np.testing.assert_array_equal(covered(spans, bounds), expected)
@@ -0,0 +1,79 @@
+"""
+fragment merging of ingest.py
+"""
+
+import numpy as np
+import pandas as pd
+
+import ingest
+
+
+def fragment(start, seconds, spo2=95, pulse=70):
+    """
+    recording fragment with a sample at each offset (sec) from start
+    """
+    ts = pd.Timestamp(start) + pd.to_timedelta(np.asarray(seconds), unit="s")
+    return pd.DataFrame(
+        {
+            "ts": ts,
+            "pulse": np.full(len(ts), pulse, dtype="int16"),
+            "spo2": np.full(len(ts), spo2, dtype="int16"),
+        }
+    )
+
+
+def test_separate_fragments_are_ordered_and_concatenated():
+    late = fragment("2024-03-02 01:00", range(10))
+    early = fragment("2024-03-01 23:00", range(10))
+    merged, report = ingest.merge_fragments([late, early], names=["late", "early"])
+    assert report == {
+        "order": ["early", "late"],
+        "overlaps": [],
+        "duplicate samples": 0,
+        "conflicting duplicates": 0,
+        "clock jumps": [],
+    }
+    assert len(merged) == 20
+    assert merged["ts"].is_monotonic_increasing
+
+
+def test_overlapping_fragments_are_interleaved():
+    first = fragment("2024-03-01 23:00", range(0, 20, 2))
+    second = fragment("2024-03-01 23:00:05", range(0, 20, 2), spo2=90)
+    merged, report = ingest.merge_fragments([first, second], names=["a", "b"])
+    assert report["overlaps"] == [("a", "b", 13.0)]
+    assert report["duplicate samples"] == 0
+    assert len(merged) == 20
+    assert (merged["ts"].diff().dropna() > pd.Timedelta(0)).all()
+
+
+def test_duplicates_keep_the_earlier_fragment_and_count_conflicts():
+    first = fragment("2024-03-01 23:00", range(10))
+    # seconds 5 to 9 repeat, 5 and 6 agree with the first fragment
+    second = fragment("2024-03-01 23:00:05", range(10))
+    second.loc[2:, "spo2"] = 80
+    merged, report = ingest.merge_fragments([second, first], names=["b", "a"])
+    assert report["order"] == ["a", "b"]
+    assert report["overlaps"] == [("a", "b", 4.0)]
+    assert report["duplicate samples"] == 5
+    assert report["conflicting duplicates"] == 3
+    assert len(merged) == 15
+    assert merged["ts"].is_unique
+    # the repeated seconds keep the values of fragment a
+    assert (merged["spo2"].to_numpy()[:10] == 95).all()
+    assert (merged["spo2"].to_numpy()[10:] == 80).all()
+
+
+def test_clock_jumps_are_reported_by_csv_line():
+    jumps = fragment("2024-03-01 23:00", [0, 1, 2, -58, -57, 7200])
+    merged, report = ingest.merge_fragments([jumps], names=["SB001.csv"])
+    # the csv line of the sample after the step - header and 1-based lines
+    assert report["clock jumps"] == [("SB001.csv", 5, -60.0), ("SB001.csv", 7, 7257.0)]
+    assert merged["ts"].is_monotonic_increasing
+    assert len(merged) == 6
+
+
+def test_jump_threshold_is_configurable():
+    steps = fragment("2024-03-01 23:00", [0, 1, 120])
+    _, report = ingest.merge_fragments([steps], jump_sec=60)
+    assert report["clock jumps"] == [("fragment 1", 4, 119.0)]
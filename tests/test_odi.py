@@ -0,0 +1,67 @@
+"""
+ODI event detection of odi.py next to recording gaps
+"""
+
+import numpy as np
+import pandas as pd
+
+import odi
+
+SETTINGS = {
+    "expected_sampling_rate (sec)": 1,
+    "minimum desat interval (sec)": 3,
+    "odi baseline window (sec)": 10,
+}
+
+
+def night_df(spo2, gap_at=None, gap_sec=60):
+    """
+    1 Hz samples, with a gap of gap_sec before sample gap_at
+    """
+    seconds = np.arange(len(spo2), dtype=float)
+    if gap_at is not None:
+        seconds[gap_at:] += gap_sec - 1
+    ts = pd.Timestamp("2024-03-01 23:00") + pd.to_timedelta(seconds, unit="s")
+    df = pd.DataFrame({"ts": ts, "spo2": np.asarray(spo2, dtype=float)})
+    df["spo2_NA_filter"] = df["spo2"] == 500
+    df["gaps"] = df["ts"].diff().dt.total_seconds() > 1
+    return df
+
+
+def test_event_inside_a_segment_ends_one_sample_after_its_last():
+    df = night_df([97] * 15 + [92] * 5 + [97] * 5)
+    (event,) = odi.detect_odi_events(df, 3, SETTINGS)
+    assert event["start"] == df["ts"][15]
+    assert event["stop"] == df["ts"][20]
+    assert event["duration"] == 5
+    assert event["low_spo2"] == 92
+    assert event["baseline_spo2"] == 97
+
+
+def test_event_that_runs_into_a_gap_stops_before_the_gap():
+    df = night_df([97] * 15 + [92] * 5 + [92] * 5, gap_at=20)
+    (event,) = odi.detect_odi_events(df, 3, SETTINGS)
+    assert event["start"] == df["ts"][15]
+    # one sample interval after the last sample, not the first sample after
+    # the gap
+    assert event["stop"] == df["ts"][19] + pd.Timedelta(seconds=1)
+    assert event["stop"] < df["ts"][20]
+    assert event["duration"] == 5
+
+
+def test_baseline_restarts_after_a_gap():
+    # after the gap the samples only drop below the baseline of the earlier
+    # segment, which must not carry over
+    df = night_df([97] * 15 + [92] * 10, gap_at=15)
+    baseline, count = odi.moving_baseline(df, 10)
+    assert np.isnan(baseline[15])
+    assert count[15] == 0
+    assert baseline[20] == 92
+    assert odi.detect_odi_events(df, 3, SETTINGS, baseline=baseline) == []
+
+
+def test_event_at_the_end_of_the_recording():
+    df = night_df([97] * 15 + [92] * 4)
+    (event,) = odi.detect_odi_events(df, 3, SETTINGS)
+    assert event["stop"] == df["ts"][18] + pd.Timedelta(seconds=1)
+    assert event["duration"] == 4
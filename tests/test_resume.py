@@ -0,0 +1,81 @@
+"""
+resume checkpoints of main.main
+"""
+
+import os
+import shutil
+import logging
+
+import pytest
+
+import main
+from conftest import SAMPLE_DATA, write_settings
+
+
+class Messages(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def run(tmp_path, sample_profile):
+    """
+    runs main.main with resume on one sample subject and returns the log
+    messages of the run
+    """
+    input_path = tmp_path / "input"
+    output_path = tmp_path / "output"
+    input_path.mkdir()
+    output_path.mkdir()
+    shutil.copy(os.path.join(SAMPLE_DATA, "SB001.csv"), input_path)
+
+    def run(file_time_fix):
+        settings_path = write_settings(
+            tmp_path / "settings.json", sample_profile, file_time_fix
+        )
+        handler = Messages()
+        logger = logging.getLogger("sasa resume test")
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        try:
+            main.main(
+                str(input_path),
+                str(output_path),
+                str(settings_path),
+                logger=logger,
+                resume=True,
+            )
+        finally:
+            logger.removeHandler(handler)
+        return handler.messages
+
+    return run
+
+
+def test_unchanged_subject_is_loaded_from_its_checkpoint(run):
+    run({})
+    messages = run({})
+    assert "SB001 already completed, loaded from checkpoint" in messages
+
+
+def test_changed_end_time_reruns_the_subject(run):
+    run({})
+    messages = run({"SB001.csv": (7, 0)})
+    assert "SB001 already completed, loaded from checkpoint" not in messages
+    assert any("SB001 checkpoint does not match" in m for m in messages)
+    # the new end time is stored, a further run loads it
+    assert "SB001 already completed, loaded from checkpoint" in run(
+        {"SB001.csv": (7, 0)}
+    )
+
+
+def test_checkpoint_records_the_end_times(tmp_path, run):
+    run({"SB001.csv": (7, 0)})
+    checkpoint = main.load_checkpoint(
+        main.checkpoint_path(str(tmp_path / "output"), "SB001")
+    )
+    assert checkpoint["end times"] == {"SB001.csv": (7, 0)}
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+all-thresholds-at-once desaturation curves
+
+for every integer threshold in a range, computes the time spent below the
+threshold, the number of desat bouts and the mean bout duration from each
+night_df, instead of re-running the analysis once per candidate 'desat
+threshold'
+
+time below comes from a single pass over the sorted spo2 values. bouts are
+scored as main.py scores desat bouts - the flag below the threshold (never
+on gap samples) goes through the same "minimum desat interval (sec)"
+duration filter and its starts and stops are paired the same way - so the
+bout count and mean duration at the configured threshold are the "count
+desat bouts" and "mean desat duration" of Aggregate.xlsx. the duration
+filter runs once on the spo2 values rather than once per threshold, and the
+bouts of all thresholds come from one pass over its result
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import pandas as pd
+import numpy as np
+import logging
+import os
+import argparse
+import traceback
+
+import main
+
+
+# %% define functions
+def threshold_curve(night_df, thresholds, minimum_sec):
+    """
+    time below, percent time below, bout count and mean bout duration for
+    every threshold in 'thresholds' (ascending integers) for one night_df,
+    with bouts shorter than 'minimum_sec' dropped
+
+    a sample counts as below threshold T when fixed_spo2 < T, as the
+    'desat' column does in main.py, and gap samples never count
+    """
+    thresholds = np.asarray(thresholds)
+    spo2 = night_df["fixed_spo2"].to_numpy(dtype=float)
+    interval = night_df["interval"].to_numpy(dtype=float)
+    gaps = night_df["gaps"].to_numpy(dtype=bool)
+
+    # gap samples (and unfilled values) never fall below any threshold
+    values = np.where(gaps | np.isnan(spo2), np.inf, spo2)
+
+    # time below: cumulative interval over the sorted values
+    order = np.argsort(values, kind="stable")
+    cumulative = np.concatenate([[0.0], np.cumsum(interval[order])])
+    below_count = np.searchsorted(values[order], thresholds, side="left")
+    time_below = cumulative[below_count]
+
+    # bouts: the duration filter of main.py keeps a sample at threshold T
+    # when the rolling min of the rolling max of the flag is 1, and as min
+    # and max commute with "value < T" that is the rolling min of the rolling
+    # max of the values being below T - both rolling passes run once for
+    # every threshold. values are capped at the highest threshold (below
+    # none of them) as rolling max skips the inf of gap samples
+    window = pd.Timedelta(seconds=minimum_sec)
+    frame = pd.DataFrame(
+        {
+            "ts": night_df["ts"].to_numpy(),
+            "value": np.minimum(values, thresholds.max()),
+        }
+    )
+    frame["trimmed"] = frame.rolling(window=window, on="ts", center=True)["value"].max()
+    kept_value = (
+        frame.rolling(window=window, on="ts", center=True)["trimmed"].min().to_numpy()
+    )
+    # runs of kept samples of every threshold (thresholds x samples)
+    kept = kept_value[np.newaxis, :] < thresholds[:, np.newaxis]
+    change = np.diff(np.pad(kept.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    run_threshold, run_starts = np.nonzero(change == 1)
+    _, run_stops = np.nonzero(change == -1)  # first sample after the run
+    # as in main.bout_pairs, runs open at either end of the night are no bouts
+    complete = (run_starts > 0) & (run_stops < values.size)
+    ts = frame["ts"].to_numpy(dtype="datetime64[ns]").astype("int64")
+    seconds = (ts[run_stops[complete]] - ts[run_starts[complete]]) // 10**9
+    bout_count = np.bincount(run_threshold[complete], minlength=thresholds.size)
+    bout_seconds = np.bincount(
+        run_threshold[complete], weights=seconds, minlength=thresholds.size
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_bout_duration = np.where(bout_count > 0, bout_seconds / bout_count, np.nan)
+
+    valid_duration = interval[~gaps].sum()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percent_below = 100 * time_below / valid_duration
+
+    return pd.DataFrame(
+        {
+            "time below (sec)": time_below,
+            "percent time below": percent_below,
+            "bout count": bout_count,
+            "mean bout duration (sec)": mean_bout_duration,
+        },
+        index=pd.Index(thresholds, name="threshold"),
+    )
+
+
+def cohort_threshold_curves(subject_curves, valid_durations):
+    """
+    combines per-subject curves into cohort curves - pooled time below,
+    percent of all valid recording time, total bouts, pooled mean bout
+    duration, and the mean across subjects of the per-subject percent
+    """
+    time_below = sum(curve["time below (sec)"] for curve in subject_curves.values())
+    bout_count = sum(curve["bout count"] for curve in subject_curves.values())
+    bout_duration = sum(
+        curve["bout count"] * curve["mean bout duration (sec)"].fillna(0)
+        for curve in subject_curves.values()
+    )
+    percent = pd.concat(
+        [curve["percent time below"] for curve in subject_curves.values()], axis=1
+    )
+    return pd.DataFrame(
+        {
+            "time below (sec)": time_below,
+            "percent time below": 100 * time_below / sum(valid_durations.values()),
+            "bout count": bout_count,
+            "mean bout duration (sec)": bout_duration
+            / bout_count.where(bout_count > 0),
+            "mean subject percent time below": percent.mean(axis=1),
+        }
+    )
+
+
+def run_threshold_curves(
+    file_dict, settings, file_time_fix, thresholds, logger, output_file_path
+):
+    """
+    computes the curves for every subject and writes the subject x
+    threshold tables and the cohort curves to 'Threshold Curves.xlsx'
+    """
+    subject_curves = {}
+    valid_durations = {}
+    for subject_id, subject_file_list in file_dict.items():
+        try:
+            subject_df, _ = main.load_subject_df(
+                subject_id, subject_file_list, settings, file_time_fix, logger
+            )
+            night_df = subject_df[subject_df["night"]]
+            if night_df.shape[0] == 0:
+                raise ValueError(
+                    f"{subject_id}: no recording samples within the night window"
+                )
+        except Exception as e:
+            logger.error(f"{subject_id} failed - {type(e).__name__}: {e}")
+            logger.debug(traceback.format_exc())
+            continue
+        subject_curves[subject_id] = threshold_curve(
+            night_df, thresholds, settings["minimum desat interval (sec)"]
+        )
+        valid_durations[subject_id] = night_df[night_df["gaps"] == False][
+            "interval"
+        ].sum()
+        logger.info(f"threshold curve created for {subject_id}")
+
+    writer = pd.ExcelWriter(
+        os.path.join(output_file_path, "Threshold Curves.xlsx"), engine="xlsxwriter"
+    )
+    for metric in [
+        "time below (sec)",
+        "percent time below",
+        "bout count",
+        "mean bout duration (sec)",
+    ]:
+        pd.DataFrame(
+            {subject_id: curve[metric] for subject_id, curve in subject_curves.items()}
+        ).transpose().to_excel(writer, sheet_name=metric)
+    if subject_curves:
+        cohort_threshold_curves(subject_curves, valid_durations).to_excel(
+            writer, sheet_name="cohort"
+        )
+    writer.close()
+    logger.info("Threshold Curves Output Saved")
+    return subject_curves
+
+
+# %% run main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="desaturation curves for every integer threshold in a range"
+    )
+    parser.add_argument("-i", "--input", default="./sample data/pooled/")
+    parser.add_argument("-o", "--output", default="./sample output/")
+    parser.add_argument("-s", "--settings", default="./sample settings.xlsx")
+    parser.add_argument("--start", type=int, default=80, help="lowest threshold")
+    parser.add_argument("--stop", type=int, default=94, help="highest threshold")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(threadName)s | %(levelname)-5.5s |  %(message)s",
+    )
+    logger = logging.getLogger()
+    settings, file_time_fix = main.read_settings(args.settings)
+    file_dict = main.collect_subject_files(args.input, logger)
+    run_threshold_curves(
+        file_dict,
+        settings,
+        file_time_fix,
+        np.arange(args.start, args.stop + 1),
+        logger,
+        args.output,
+    )
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+night trace viewer for the SASA GUI
+
+plots fixed spo2 and pulse of a subject's {subject_id}_trace.npz with the
+desat, sustained desat and severe desat bouts and the artifact and gap
+regions shaded. each repaint draws only the min/max of every pixel column
+in view (see night_trace.decimate), so zooming (mouse wheel) and panning
+(drag) stay interactive on multi-day recordings. double click shows the
+whole night. numpy and night_trace are imported when the first trace is
+opened, keeping GUI startup light
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import datetime
+import importlib
+import math
+import os
+from PySide6 import QtWidgets
+from PySide6.QtCore import QPointF, QRectF, Qt
+from PySide6.QtGui import QColor, QPainter, QPainterPath, QPen
+
+# %% define constants
+TRACE_SUFFIX = "_trace.npz"
+PLOTS = [("spo2", "SpO2 (%)", "#1f4e9c"), ("pulse", "pulse (bpm)", "#b03a2e")]
+# drawn in order, gaps last so they cover everything inside them
+REGION_COLORS = {
+    "desat": QColor(70, 130, 220, 45),
+    "sustained desat": QColor(70, 130, 220, 70),
+    "severe desat": QColor(200, 40, 40, 70),
+    "artifact": QColor(230, 160, 40, 70),
+    "gaps": QColor(150, 150, 150),
+}
+MARGINS = {"left": 60, "right": 12, "top": 22, "bottom": 24}
+MIN_SPAN_SEC = 30.0
+ZOOM_STEP = 1.25
+
+
+# %% define classes
+class TraceView(QtWidgets.QWidget):
+    """
+    stacked spo2 and pulse plots of one trace over a shared time axis
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.trace = None
+        self.trace_module = None
+        self.t0 = 0.0
+        self.t1 = 1.0
+        self.drag_x = None
+        self.setMinimumHeight(240)
+        self.setMouseTracking(False)
+
+    def set_trace(self, trace, trace_module):
+        """
+        shows a loaded trace (dict of arrays from night_trace.load_trace)
+        """
+        self.trace = trace
+        self.trace_module = trace_module
+        self.show_all()
+
+    def show_all(self):
+        if self.trace is not None and len(self.trace["t"]):
+            self.t0 = float(self.trace["t"][0])
+            self.t1 = max(float(self.trace["t"][-1]), self.t0 + MIN_SPAN_SEC)
+        self.update()
+
+    def plot_width(self):
+        return max(self.width() - MARGINS["left"] - MARGINS["right"], 1)
+
+    def to_x(self, t):
+        return MARGINS["left"] + (t - self.t0) / (self.t1 - self.t0) * self.plot_width()
+
+    def to_t(self, x):
+        return self.t0 + (x - MARGINS["left"]) / self.plot_width() * (self.t1 - self.t0)
+
+    def set_span(self, t0, t1):
+        """
+        moves the view to [t0, t1], kept within the recording
+        """
+        first = float(self.trace["t"][0])
+        last = max(float(self.trace["t"][-1]), first + MIN_SPAN_SEC)
+        span = min(max(t1 - t0, MIN_SPAN_SEC), last - first)
+        t0 = min(max(t0, first), last - span)
+        self.t0, self.t1 = t0, t0 + span
+        self.update()
+
+    def wheelEvent(self, event):
+        if self.trace is None:
+            return
+        anchor = self.to_t(event.position().x())
+        factor = ZOOM_STEP ** (-event.angleDelta().y() / 120)
+        self.set_span(
+            anchor - (anchor - self.t0) * factor, anchor + (self.t1 - anchor) * factor
+        )
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.drag_x = event.position().x()
+
+    def mouseMoveEvent(self, event):
+        if self.drag_x is None or self.trace is None:
+            return
+        shift = (self.drag_x - event.position().x()) / self.plot_width()
+        self.drag_x = event.position().x()
+        span = self.t1 - self.t0
+        self.set_span(self.t0 + shift * span, self.t1 + shift * span)
+
+    def mouseReleaseEvent(self, event):
+        self.drag_x = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.show_all()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        if self.trace is None:
+            painter.drawText(self.rect(), Qt.AlignCenter, "no trace selected")
+            return
+        plot_height = (self.height() - MARGINS["top"] - MARGINS["bottom"]) / len(PLOTS)
+        for i, (name, label, color) in enumerate(PLOTS):
+            area = QRectF(
+                MARGINS["left"],
+                MARGINS["top"] + i * plot_height,
+                self.plot_width(),
+                plot_height - 6,
+            )
+            self.draw_plot(painter, area, name, label, QColor(color))
+        self.draw_time_axis(painter)
+        self.draw_legend(painter)
+
+    def draw_plot(self, painter, area, name, label, color):
+        """
+        shaded regions, axis and decimated trace of one plot
+        """
+        nt = self.trace_module
+        painter.setClipRect(area)
+        for region, region_color in REGION_COLORS.items():
+            for start, stop in nt.regions_in_view(self.trace[region], self.t0, self.t1):
+                x0 = self.to_x(start)
+                # at least a pixel wide, so short events stay visible
+                painter.fillRect(
+                    QRectF(
+                        x0, area.top(), max(self.to_x(stop) - x0, 1.0), area.height()
+                    ),
+                    region_color,
+                )
+
+        x, y = nt.decimate(
+            self.trace["t"], self.trace[name], self.t0, self.t1, int(self.plot_width())
+        )
+        low, high = nt.value_range(y)
+        pad = max((high - low) * 0.05, 1.0)
+        low, high = low - pad, high + pad
+
+        def to_y(value):
+            return area.bottom() - (value - low) / (high - low) * area.height()
+
+        path = QPainterPath()
+        pen_down = False
+        for t, value in zip(x.tolist(), y.tolist()):
+            if math.isnan(value):
+                pen_down = False
+                continue
+            point = QPointF(self.to_x(t), to_y(value))
+            if pen_down:
+                path.lineTo(point)
+            else:
+                path.moveTo(point)
+                pen_down = True
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.setPen(QPen(color, 1))
+        painter.drawPath(path)
+        painter.setClipping(False)
+
+        painter.setPen(QPen(Qt.black, 1))
+        painter.drawRect(area)
+        for value in [low + pad, high - pad]:
+            painter.drawText(
+                QRectF(0, to_y(value) - 8, MARGINS["left"] - 4, 16),
+                Qt.AlignRight | Qt.AlignVCenter,
+                f"{value:.0f}",
+            )
+        painter.save()
+        painter.translate(10, area.center().y())
+        painter.rotate(-90)
+        painter.drawText(QRectF(-60, -8, 120, 16), Qt.AlignCenter, label)
+        painter.restore()
+
+    def draw_time_axis(self, painter):
+        """
+        clock time ticks along the bottom
+        """
+        start = datetime.datetime.fromisoformat(str(self.trace["start"]))
+        span = self.t1 - self.t0
+        steps = [10, 30, 60, 300, 600, 1800, 3600, 7200, 21600, 43200, 86400]
+        step = next((s for s in steps if span / s <= 8), steps[-1])
+        # ticks fall on whole multiples of the step in clock time
+        midnight = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        offset = (start - midnight).total_seconds()
+        first = math.ceil((offset + self.t0) / step) * step - offset
+        y = self.height() - MARGINS["bottom"]
+        painter.setPen(QPen(Qt.black, 1))
+        t = first
+        while t <= self.t1:
+            x = self.to_x(t)
+            painter.drawLine(QPointF(x, y), QPointF(x, y + 4))
+            clock = start + datetime.timedelta(seconds=t)
+            text = clock.strftime("%H:%M" if step >= 60 else "%H:%M:%S")
+            if step >= 86400:
+                text = clock.strftime("%m-%d")
+            painter.drawText(QRectF(x - 40, y + 4, 80, 18), Qt.AlignCenter, text)
+            t += step
+
+    def draw_legend(self, painter):
+        x = MARGINS["left"]
+        for region, region_color in REGION_COLORS.items():
+            painter.fillRect(QRectF(x, 6, 12, 10), region_color)
+            painter.setPen(QPen(Qt.black, 1))
+            painter.drawText(QRectF(x + 16, 2, 110, 18), Qt.AlignVCenter, region)
+            x += 16 + painter.fontMetrics().horizontalAdvance(region) + 14
+
+
+class TracePanel(QtWidgets.QWidget):
+    """
+    subject picker over a trace view of an output folder's trace files
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.output_path = None
+        self.trace_module = None
+
+        self.subject_box = QtWidgets.QComboBox(self)
+        self.subject_box.setSizeAdjustPolicy(QtWidgets.QComboBox.AdjustToContents)
+        self.subject_box.currentTextChanged.connect(self.open_subject)
+        self.reset_button = QtWidgets.QPushButton("whole night", self)
+        self.view = TraceView(self)
+        self.reset_button.clicked.connect(self.view.show_all)
+
+        controls = QtWidgets.QHBoxLayout()
+        controls.addWidget(QtWidgets.QLabel("subject", self))
+        controls.addWidget(self.subject_box)
+        controls.addWidget(self.reset_button)
+        controls.addStretch()
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(controls)
+        layout.addWidget(self.view)
+
+    def set_output_path(self, output_path):
+        self.output_path = output_path
+        self.refresh()
+
+    def refresh(self, *args):
+        """
+        lists the subjects with a trace file in the output folder, keeping
+        the current selection (accepts and ignores the subject_done signal's
+        arguments)
+        """
+        if not self.output_path or not os.path.isdir(self.output_path):
+            return
+        subjects = sorted(
+            f[: -len(TRACE_SUFFIX)]
+            for f in os.listdir(self.output_path)
+            if f.endswith(TRACE_SUFFIX)
+        )
+        current = self.subject_box.currentText()
+        if subjects == [
+            self.subject_box.itemText(i) for i in range(self.subject_box.count())
+        ]:
+            return
+        self.subject_box.blockSignals(True)
+        self.subject_box.clear()
+        self.subject_box.addItems(subjects)
+        self.subject_box.blockSignals(False)
+        if current in subjects:
+            self.subject_box.setCurrentText(current)
+        elif subjects:
+            self.open_subject(self.subject_box.currentText())
+
+    def open_subject(self, subject_id):
+        if not subject_id or not self.output_path:
+            return
+        if self.trace_module is None:
+            self.trace_module = importlib.import_module("night_trace")
+        path = os.path.join(self.output_path, f"{subject_id}{TRACE_SUFFIX}")
+        try:
+            trace = self.trace_module.load_trace(path)
+        except (OSError, ValueError, KeyError):
+            return
+        self.view.set_trace(trace, self.trace_module)
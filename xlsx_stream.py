@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Project: SASA
+Description: Sleep Apnea Saturation Analysis
+Author: Christopher Scott Ward, christopher.ward@bcm.edu
+Created: 2025
+License: MIT-X
+
+constant-memory excel export
+
+dataframes are written row by row with xlsxwriter's constant_memory mode,
+which flushes each finished row to disk. rows are converted from the column
+arrays a chunk at a time, so neither the workbook nor the python cell values
+for a whole sheet are ever held in memory. sheets longer than excel's row
+limit continue on numbered sheets ("SB001", "SB001 2", ...)
+"""
+
+__version__ = "0.1.3"
+
+# %% import libraries
+import pandas as pd
+import numpy as np
+import xlsxwriter
+
+# %% define constants
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_SHEET_NAME = 31
+CHUNK_ROWS = 10000
+DATETIME_FORMAT = "yyyy-mm-dd hh:mm:ss"
+
+
+# %% define functions
+def chunk_values(values, start, stop):
+    """
+    python cell values of values[start:stop] - NaN and NaT become None,
+    which xlsxwriter leaves as empty cells
+    """
+    chunk = values[start:stop]
+    if chunk.dtype.kind == "M":
+        # NaT converts to None
+        return chunk.astype("datetime64[us]").tolist()
+    if chunk.dtype.kind == "m":
+        return [
+            None if np.isnat(value) else value / np.timedelta64(1, "s")
+            for value in chunk
+        ]
+    if chunk.dtype.kind == "f":
+        return np.where(np.isnan(chunk), None, chunk.astype(object)).tolist()
+    if chunk.dtype.kind == "O":
+        return [
+            (
+                None
+                if pd.isna(value)
+                else value.item() if isinstance(value, np.generic) else value
+            )
+            for value in chunk
+        ]
+    return chunk.tolist()
+
+
+def frame_columns(df, index=True):
+    """
+    (header, values array) of every column to write, the index first
+    """
+    columns = []
+    if index:
+        columns.append((df.index.name or "", df.index.to_numpy()))
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_localize(None)
+        if pd.api.types.is_extension_array_dtype(values.dtype):
+            values = values.astype(object)
+        columns.append((str(column), values.to_numpy()))
+    return columns
+
+
+def sheet_names(sheet_name, row_count, max_rows=EXCEL_MAX_ROWS):
+    """
+    names of the sheets needed for row_count data rows (plus a header row
+    on every sheet)
+    """
+    sheet_count = max(1, -(-row_count // (max_rows - 1)))
+    names = [sheet_name[:EXCEL_MAX_SHEET_NAME]]
+    for number in range(2, sheet_count + 1):
+        suffix = f" {number}"
+        names.append(sheet_name[: EXCEL_MAX_SHEET_NAME - len(suffix)] + suffix)
+    return names
+
+
+def write_frame(
+    workbook, sheet_name, df, header_format=None, index=True, max_rows=EXCEL_MAX_ROWS
+):
+    """
+    streams a dataframe into one or more sheets of a constant_memory
+    workbook, returns the names of the sheets written
+    """
+    columns = frame_columns(df, index=index)
+    headers = [header for header, _ in columns]
+    row_count = df.shape[0]
+    rows_per_sheet = max_rows - 1
+    names = sheet_names(sheet_name, row_count, max_rows)
+    for sheet_number, name in enumerate(names):
+        worksheet = workbook.add_worksheet(name)
+        worksheet.write_row(0, 0, headers, header_format)
+        sheet_start = sheet_number * rows_per_sheet
+        sheet_stop = min(sheet_start + rows_per_sheet, row_count)
+        for chunk_start in range(sheet_start, sheet_stop, CHUNK_ROWS):
+            chunk_stop = min(chunk_start + CHUNK_ROWS, sheet_stop)
+            chunk = [
+                chunk_values(values, chunk_start, chunk_stop) for _, values in columns
+            ]
+            for offset, row in enumerate(zip(*chunk)):
+                worksheet.write_row(chunk_start - sheet_start + offset + 1, 0, row)
+    return names
+
+
+def write_workbook(path, sheets, max_rows=EXCEL_MAX_ROWS):
+    """
+    writes {sheet name: dataframe} to an xlsx file in a single streaming
+    pass, returns {sheet name: names of the sheets written}
+    """
+    total_rows = sum(df.shape[0] for df in sheets.values())
+    workbook = xlsxwriter.Workbook(
+        path,
+        {
+            "constant_memory": True,
+            "default_date_format": DATETIME_FORMAT,
+            "strings_to_urls": False,
+            # large workbooks can pass the 4 GB zip limit
+            "use_zip64": total_rows >= max_rows,
+        },
+    )
+    header_format = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+    written = {}
+    for sheet_name, df in sheets.items():
+        written[sheet_name] = write_frame(
+            workbook, sheet_name, df, header_format, max_rows=max_rows
+        )
+    workbook.close()
+    return written